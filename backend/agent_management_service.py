@@ -1,6 +1,7 @@
 # Agent Management Service
 # Manage voice agents with configurations, system prompts, and Indian language support
 
+import asyncio
 import logging
 import json
 import os
@@ -8,14 +9,65 @@ from typing import Optional, List, Dict
 from datetime import datetime
 import uuid
 
+from state_backend import StateBackend, SQLiteStateBackend
+from prompt_compiler import build_system_prompt
+from config import LLM_MODEL_PROFILES
+from single_flight import SingleFlight
+
 logger = logging.getLogger(__name__)
 
 class AgentManagementService:
     """Service for creating and managing voice agents"""
     
-    def __init__(self):
+    def __init__(self, state: Optional[StateBackend] = None, prompt_bank=None):
+        # Agents live in the shared state backend so every worker (and node) sees the same set
+        self.state = state or SQLiteStateBackend()
+        # Optional PromptBankService; agents are re-rendered when their voice or prompts change
+        self.prompt_bank = prompt_bank
         self.agents_dir = "/tmp/agents_db"
-        os.makedirs(self.agents_dir, exist_ok=True)
+        # Calls starting at once all look up the same agent; one state-backend read serves them
+        self.flight = SingleFlight("agent_config")
+        # Loop the *_async methods run on; renders requested from their worker threads are scheduled there
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._migrate_legacy_files()
+
+    def _migrate_legacy_files(self):
+        """Import agents saved as one JSON file each by earlier versions"""
+        if not os.path.isdir(self.agents_dir):
+            return
+        for agent_file in os.listdir(self.agents_dir):
+            if not agent_file.endswith(".json"):
+                continue
+            path = os.path.join(self.agents_dir, agent_file)
+            try:
+                with open(path, "r") as f:
+                    agent_config = json.load(f)
+                if self.state.get("agents", agent_config["id"]) is None:
+                    self._save(agent_config)
+                os.remove(path)
+                logger.info(f"Migrated legacy agent file: {agent_file}")
+            except Exception as e:
+                logger.error(f"Error migrating agent file {agent_file}: {e}")
+
+    def _load(self, agent_id: str) -> Optional[dict]:
+        return self.state.get_json("agents", agent_id)
+
+    def _save(self, agent_config: dict):
+        self.state.set_json("agents", agent_config["id"], agent_config)
+
+    def _schedule_render(self, agent_config: dict):
+        """Start a prompt-bank render on the event loop, also when called from a worker thread"""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self.prompt_bank.schedule_render, agent_config)
+            return
+        self.prompt_bank.schedule_render(agent_config)
+
+    async def _in_thread(self, method, *args, **kwargs):
+        self._loop = asyncio.get_running_loop()
+        return await asyncio.to_thread(method, *args, **kwargs)
 
     def create_agent(
         self,
@@ -28,10 +80,23 @@ class AgentManagementService:
         stt_provider: str = "google_stt",
         voice_id: Optional[str] = None,
         temperature: float = 0.7,
-        max_tokens: int = 500
+        max_tokens: int = 500,
+        supported_languages: Optional[List[str]] = None,
+        prompts: Optional[Dict] = None,
+        speculative_mode: bool = False,
+        speculative_confidence_threshold: float = 0.85,
+        speculative_cost_cap: int = 2000,
+        speaker_verification_threshold: Optional[float] = None,
+        few_shot_examples: Optional[List[Dict]] = None,
+        latency_slo_ms: Optional[int] = None,
+        turn_budget_ms: Optional[int] = None,
+        llm_models: Optional[List[str]] = None
     ) -> dict:
         """Create a new voice agent"""
         try:
+            unknown_models = [model for model in llm_models or [] if model not in LLM_MODEL_PROFILES]
+            if unknown_models:
+                return {"success": False, "error": f"Unknown llm_models: {', '.join(unknown_models)}"}
             agent_id = str(uuid.uuid4())
             
             agent_config = {
@@ -46,15 +111,28 @@ class AgentManagementService:
                 "voice_id": voice_id,
                 "temperature": temperature,
                 "max_tokens": max_tokens,
+                "supported_languages": supported_languages or [language],
+                "prompts": prompts or {},
+                "speculative_mode": speculative_mode,
+                "speculative_confidence_threshold": speculative_confidence_threshold,
+                "speculative_cost_cap": speculative_cost_cap,
+                "speaker_verification_threshold": speaker_verification_threshold,
+                "few_shot_examples": few_shot_examples or [],
+                # Time-to-first-token target and whole-turn budget; the model router picks among llm_models
+                "latency_slo_ms": latency_slo_ms,
+                "turn_budget_ms": turn_budget_ms,
+                "llm_models": llm_models,
+                # Bumped on every update; compiled prompts are cached per version
+                "version": 1,
                 "created_at": datetime.utcnow().isoformat(),
                 "updated_at": datetime.utcnow().isoformat(),
                 "status": "active"
             }
             
             # Save agent configuration
-            agent_path = os.path.join(self.agents_dir, f"{agent_id}.json")
-            with open(agent_path, "w") as f:
-                json.dump(agent_config, f, indent=2)
+            self._save(agent_config)
+            if self.prompt_bank and agent_config["prompts"]:
+                self._schedule_render(agent_config)
             
             logger.info(f"Created agent: {agent_id}")
             return {
@@ -70,10 +148,8 @@ class AgentManagementService:
     def get_agent(self, agent_id: str) -> dict:
         """Retrieve agent configuration"""
         try:
-            agent_path = os.path.join(self.agents_dir, f"{agent_id}.json")
-            if os.path.exists(agent_path):
-                with open(agent_path, "r") as f:
-                    agent_config = json.load(f)
+            agent_config = self._load(agent_id)
+            if agent_config is not None:
                 return {"success": True, "agent": agent_config}
             else:
                 return {"success": False, "error": "Agent not found"}
@@ -81,6 +157,14 @@ class AgentManagementService:
             logger.error(f"Error retrieving agent: {e}")
             return {"success": False, "error": str(e)}
 
+    async def get_agent_async(self, agent_id: str) -> dict:
+        """get_agent off the event loop, shared by concurrent callers (treat the result as read-only)"""
+        return await self.flight.do(agent_id, lambda: asyncio.to_thread(self.get_agent, agent_id))
+
+    async def create_agent_async(self, **fields) -> dict:
+        """create_agent off the event loop"""
+        return await self._in_thread(self.create_agent, **fields)
+
     def update_agent(
         self,
         agent_id: str,
@@ -88,57 +172,70 @@ class AgentManagementService:
     ) -> dict:
         """Update agent configuration"""
         try:
-            agent_path = os.path.join(self.agents_dir, f"{agent_id}.json")
-            if not os.path.exists(agent_path):
+            agent_config = self._load(agent_id)
+            if agent_config is None:
                 return {"success": False, "error": "Agent not found"}
             
-            with open(agent_path, "r") as f:
-                agent_config = json.load(f)
+            previous = dict(agent_config)
             
             # Update only allowed fields
             allowed_fields = [
                 "name", "job_role", "system_instruction",
                 "language", "llm_provider", "tts_provider",
                 "stt_provider", "voice_id", "temperature",
-                "max_tokens", "status"
+                "max_tokens", "status", "supported_languages", "prompts", "speculative_mode",
+                "speculative_confidence_threshold", "speculative_cost_cap",
+                "speaker_verification_threshold", "few_shot_examples",
+                "latency_slo_ms", "turn_budget_ms", "llm_models"
             ]
+            unknown_models = [model for model in updates.get("llm_models") or [] if model not in LLM_MODEL_PROFILES]
+            if unknown_models:
+                return {"success": False, "error": f"Unknown llm_models: {', '.join(unknown_models)}"}
             
             for key, value in updates.items():
                 if key in allowed_fields:
                     agent_config[key] = value
             
             agent_config["updated_at"] = datetime.utcnow().isoformat()
+            agent_config["version"] = agent_config.get("version", 1) + 1
             
-            with open(agent_path, "w") as f:
-                json.dump(agent_config, f, indent=2)
+            self._save(agent_config)
+            # A read already in flight may predate this write
+            self.flight.forget(agent_id)
+            if self.prompt_bank and self.prompt_bank.needs_rerender(previous, agent_config):
+                self._schedule_render(agent_config)
             
             return {"success": True, "agent": agent_config}
         except Exception as e:
             logger.error(f"Error updating agent: {e}")
             return {"success": False, "error": str(e)}
 
+    async def update_agent_async(self, agent_id: str, updates: Dict) -> dict:
+        """update_agent off the event loop"""
+        return await self._in_thread(self.update_agent, agent_id, updates)
+
     def list_agents(self, language: Optional[str] = None) -> dict:
         """List all agents, optionally filtered by language"""
         try:
-            agents = []
-            for agent_file in os.listdir(self.agents_dir):
-                if agent_file.endswith(".json"):
-                    with open(os.path.join(self.agents_dir, agent_file), "r") as f:
-                        agent_config = json.load(f)
-                        if language is None or agent_config.get("language") == language:
-                            agents.append(agent_config)
+            agents = [
+                agent_config for agent_config in self.state.list_json("agents")
+                if language is None or agent_config.get("language") == language
+            ]
             
             return {"success": True, "agents": agents, "count": len(agents)}
         except Exception as e:
             logger.error(f"Error listing agents: {e}")
             return {"success": False, "error": str(e)}
 
+    async def list_agents_async(self, language: Optional[str] = None) -> dict:
+        """list_agents off the event loop"""
+        return await self._in_thread(self.list_agents, language)
+
     def delete_agent(self, agent_id: str) -> dict:
         """Delete an agent"""
         try:
-            agent_path = os.path.join(self.agents_dir, f"{agent_id}.json")
-            if os.path.exists(agent_path):
-                os.remove(agent_path)
+            if self.state.delete("agents", agent_id):
+                self.flight.forget(agent_id)
                 return {"success": True, "message": f"Agent {agent_id} deleted"}
             else:
                 return {"success": False, "error": "Agent not found"}
@@ -151,21 +248,8 @@ class AgentManagementService:
         system_instruction: str,
         language: str
     ) -> str:
-        """Enhance system prompt with language-specific context"""
-        language_context = {
-            "hi": "You are speaking in Hindi. Use appropriate Hindi grammar and phrases.",
-            "ta": "You are speaking in Tamil. Use appropriate Tamil grammar and phrases.",
-            "te": "You are speaking in Telugu. Use appropriate Telugu grammar and phrases.",
-            "kn": "You are speaking in Kannada. Use appropriate Kannada grammar and phrases.",
-            "ml": "You are speaking in Malayalam. Use appropriate Malayalam grammar and phrases.",
-            "bn": "You are speaking in Bengali. Use appropriate Bengali grammar and phrases.",
-            "gu": "You are speaking in Gujarati. Use appropriate Gujarati grammar and phrases.",
-            "mr": "You are speaking in Marathi. Use appropriate Marathi grammar and phrases.",
-            "en-IN": "You are speaking in Indian English. Use Indian English vocabulary and expressions."
-        }
-        
-        enhanced_prompt = f"{system_instruction}\n\n{language_context.get(language, '')}\n\nAlways be respectful, helpful, and culturally sensitive."
-        return enhanced_prompt
+        """Enhance system prompt with language-specific context (uncached; calls use PromptCompiler)"""
+        return build_system_prompt(system_instruction, language)
 
     def clone_agent(
         self,
@@ -174,28 +258,27 @@ class AgentManagementService:
     ) -> dict:
         """Clone an existing agent with a new name"""
         try:
-            source_path = os.path.join(self.agents_dir, f"{source_agent_id}.json")
-            if not os.path.exists(source_path):
+            source_config = self._load(source_agent_id)
+            if source_config is None:
                 return {"success": False, "error": "Source agent not found"}
             
-            with open(source_path, "r") as f:
-                source_config = json.load(f)
-            
             new_agent_id = str(uuid.uuid4())
             source_config["id"] = new_agent_id
             source_config["name"] = new_name
             source_config["created_at"] = datetime.utcnow().isoformat()
             source_config["updated_at"] = datetime.utcnow().isoformat()
             
-            agent_path = os.path.join(self.agents_dir, f"{new_agent_id}.json")
-            with open(agent_path, "w") as f:
-                json.dump(source_config, f, indent=2)
+            self._save(source_config)
             
             return {"success": True, "agent_id": new_agent_id, "agent": source_config}
         except Exception as e:
             logger.error(f"Error cloning agent: {e}")
             return {"success": False, "error": str(e)}
 
+    async def clone_agent_async(self, source_agent_id: str, new_name: str) -> dict:
+        """clone_agent off the event loop"""
+        return await self._in_thread(self.clone_agent, source_agent_id, new_name)
+
     def get_indian_language_support(self) -> dict:
         """Get supported Indian languages"""
         return {
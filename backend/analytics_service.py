@@ -0,0 +1,349 @@
+# Analytics Service
+# Incremental per-minute/hour/day rollups of conversation turns (per agent, language and provider),
+# with mergeable latency sketches so dashboards read O(buckets) rows instead of scanning call logs
+
+import asyncio
+import logging
+import math
+import sqlite3
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Bucket key = ISO timestamp truncated to the resolution, so keys sort and compare as strings
+RESOLUTIONS = {"minute": 16, "hour": 13, "day": 10}
+RESOLUTION_STEP = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+RETENTION = {"minute": timedelta(days=2), "hour": timedelta(days=90), "day": None}
+# Pads a coarse end bound to the last bucket inside it ("2026-10-05" -> "2026-10-05T23" for hours)
+END_OF_PERIOD = "9999-12-31T23:59:59"
+
+# Dimension name -> how a turn maps to its value (None = turn not counted under the dimension)
+DIMENSIONS = {
+    "all": lambda turn: "all",
+    "agent": lambda turn: turn.get("agent_id"),
+    "language": lambda turn: turn.get("language"),
+    "channel": lambda turn: turn.get("channel"),
+    "llm_provider": lambda turn: turn.get("providers", {}).get("llm"),
+    "stt_provider": lambda turn: turn.get("providers", {}).get("stt"),
+    "tts_provider": lambda turn: turn.get("providers", {}).get("tts"),
+    # Provider mix by language
+    "language_llm_provider": lambda turn: f"{turn.get('language')}|{turn.get('providers', {}).get('llm')}",
+    "agent_language": lambda turn: f"{turn.get('agent_id')}|{turn.get('language')}",
+}
+LATENCY_STAGES = ("stt", "llm", "tts_first_audio", "total")
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+FLUSH_INTERVAL_SECONDS = 10
+MAX_QUERY_BUCKETS = 2000
+
+
+class LatencySketch:
+    """Log-bucketed quantile sketch (DDSketch-style): relative error <= `accuracy`, exactly mergeable"""
+
+    def __init__(self, accuracy: float = 0.01):
+        self.accuracy = accuracy
+        self._gamma_log = math.log((1 + accuracy) / (1 - accuracy))
+        self.bins: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def index(self, value: float) -> Optional[int]:
+        """Bin of a value (None for zero); lets callers adding one value to many sketches compute it once"""
+        return math.ceil(math.log(value) / self._gamma_log) if value > 0 else None
+
+    def add(self, value: float, index: Optional[int] = None):
+        if value <= 0:
+            self.zeros += 1
+        else:
+            if index is None:
+                index = self.index(value)
+            self.bins[index] = self.bins.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "LatencySketch"):
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Midpoint of the bucket (in the relative-error sense)
+                value = 2 * math.exp(index * self._gamma_log) / (1 + math.exp(self._gamma_log))
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {"count": 0}
+        result = {"count": self.count, "mean": round(self.sum / self.count, 1),
+                  "min": round(self.min, 1), "max": round(self.max, 1)}
+        for q in QUANTILES:
+            result[f"p{round(q * 100)}"] = round(self.quantile(q), 1)
+        return result
+
+    def to_dict(self) -> dict:
+        return {"a": self.accuracy, "b": self.bins, "z": self.zeros, "n": self.count, "s": self.sum,
+                "lo": self.min if self.count else None, "hi": self.max if self.count else None}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencySketch":
+        sketch = cls(data["a"])
+        sketch.bins = {int(index): count for index, count in data["b"].items()}
+        sketch.zeros, sketch.count, sketch.sum = data["z"], data["n"], data["s"]
+        if sketch.count:
+            sketch.min, sketch.max = data["lo"], data["hi"]
+        return sketch
+
+
+_BINNER = LatencySketch()
+
+
+class RollupCell:
+    """Turn counts, outcomes and per-stage latency sketches for one (bucket, dimension, value)"""
+
+    def __init__(self):
+        self.turns = 0
+        self.outcomes: Dict[str, int] = {}
+        self.latency: Dict[str, LatencySketch] = {}
+
+    def add(self, outcome: str, samples: List[Tuple[str, float, Optional[int]]]):
+        """Count one turn; `samples` are (stage, latency ms, sketch bin)"""
+        self.turns += 1
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+        for stage, ms, index in samples:
+            sketch = self.latency.get(stage)
+            if sketch is None:
+                sketch = self.latency[stage] = LatencySketch()
+            sketch.add(ms, index)
+
+    def merge(self, other: "RollupCell"):
+        self.turns += other.turns
+        for outcome, count in other.outcomes.items():
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + count
+        for stage, sketch in other.latency.items():
+            self.latency.setdefault(stage, LatencySketch(sketch.accuracy)).merge(sketch)
+
+    def summary(self) -> dict:
+        return {
+            "turns": self.turns,
+            "outcomes": self.outcomes,
+            "latency_ms": {stage: sketch.summary() for stage, sketch in self.latency.items()}
+        }
+
+    def to_bytes(self) -> bytes:
+        return dumps({"t": self.turns, "o": self.outcomes,
+                      "l": {stage: sketch.to_dict() for stage, sketch in self.latency.items()}})
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "RollupCell":
+        raw = loads(data)
+        cell = cls()
+        cell.turns, cell.outcomes = raw["t"], raw["o"]
+        cell.latency = {stage: LatencySketch.from_dict(sketch) for stage, sketch in raw["l"].items()}
+        return cell
+
+
+class AnalyticsService:
+    """Rolls turns up in memory as they complete and merges the deltas into SQLite periodically
+
+    Sketches merge exactly, so several workers can flush into the same database.
+    """
+
+    def __init__(self, db_path: str = "/tmp/analytics.db"):
+        self.db_path = db_path
+        self._pending: Dict[Tuple[str, str, str, str], RollupCell] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_prune: Optional[str] = None
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rollups (
+                    resolution TEXT NOT NULL,
+                    bucket TEXT NOT NULL,
+                    dimension TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (resolution, dimension, value, bucket)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS rollups_bucket ON rollups (resolution, dimension, bucket)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def record(self, turn: dict):
+        """Add a completed turn to every rollup it belongs to (memory only)"""
+        ts = turn.get("ts") or datetime.utcnow().isoformat()
+        outcome = turn.get("outcome", "completed")
+        samples = [
+            (stage, ms, _BINNER.index(ms)) for stage, ms in (turn.get("latency_ms") or {}).items()
+            if stage in LATENCY_STAGES and ms is not None
+        ]
+        values = [(dimension, key(turn)) for dimension, key in DIMENSIONS.items()]
+        for resolution, length in RESOLUTIONS.items():
+            bucket = ts[:length]
+            for dimension, value in values:
+                if value is None:
+                    continue
+                cell = self._pending.get((resolution, bucket, dimension, value))
+                if cell is None:
+                    cell = self._pending[(resolution, bucket, dimension, value)] = RollupCell()
+                cell.add(outcome, samples)
+
+    async def start(self):
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Analytics flush error: {e}")
+
+    async def flush(self):
+        """Merge pending deltas into the stored rollups"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            await asyncio.to_thread(self._merge_into_db, pending)
+        except Exception:
+            # Keep the deltas (merged with anything recorded meanwhile) for the next flush
+            for key, cell in pending.items():
+                if key in self._pending:
+                    cell.merge(self._pending[key])
+                self._pending[key] = cell
+            raise
+
+    def _merge_into_db(self, pending: Dict[Tuple[str, str, str, str], RollupCell]):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for (resolution, bucket, dimension, value), cell in pending.items():
+                row = conn.execute(
+                    "SELECT data FROM rollups WHERE resolution = ? AND dimension = ? AND value = ? AND bucket = ?",
+                    (resolution, dimension, value, bucket)
+                ).fetchone()
+                if row is not None:
+                    stored = RollupCell.from_bytes(row["data"])
+                    stored.merge(cell)
+                    cell = stored
+                conn.execute(
+                    "INSERT OR REPLACE INTO rollups (resolution, bucket, dimension, value, data) VALUES (?, ?, ?, ?, ?)",
+                    (resolution, bucket, dimension, value, cell.to_bytes())
+                )
+            self._prune(conn)
+
+    def _prune(self, conn: sqlite3.Connection):
+        """Drop fine-grained buckets past their retention (at most once an hour)"""
+        now = datetime.utcnow()
+        hour = now.isoformat()[:13]
+        if self._last_prune == hour:
+            return
+        self._last_prune = hour
+        for resolution, keep in RETENTION.items():
+            if keep is not None:
+                cutoff = (now - keep).isoformat()[:RESOLUTIONS[resolution]]
+                conn.execute("DELETE FROM rollups WHERE resolution = ? AND bucket < ?", (resolution, cutoff))
+
+    @staticmethod
+    def _range(resolution: str, date_from: Optional[str], date_to: Optional[str], buckets: int) -> Tuple[str, str]:
+        """Bucket keys bounding the query; defaults to the latest `buckets` buckets"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution} (use {', '.join(RESOLUTIONS)})")
+        length = RESOLUTIONS[resolution]
+        end = (date_to + END_OF_PERIOD[len(date_to):])[:length] if date_to else datetime.utcnow().isoformat()[:length]
+        if date_from:
+            start = date_from[:length]
+        else:
+            start = (datetime.fromisoformat(end) - RESOLUTION_STEP[resolution] * (buckets - 1)).isoformat()[:length]
+        return start, end
+
+    async def _cells(self, resolution: str, dimension: str, value: Optional[str],
+                     start: str, end: str) -> List[Tuple[str, str, RollupCell]]:
+        """(bucket, value, cell) for stored rollups plus deltas not flushed yet"""
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown dimension: {dimension} (use {', '.join(DIMENSIONS)})")
+        # record() and flush() change the pending cells on the loop; snapshot them here, not in the thread
+        pending = []
+        for (res, bucket, dim, val), cell in self._pending.items():
+            if res == resolution and dim == dimension and start <= bucket <= end and value in (None, val):
+                snapshot = RollupCell()
+                snapshot.merge(cell)
+                pending.append((bucket, val, snapshot))
+        return await asyncio.to_thread(self._merge_stored, resolution, dimension, value, start, end, pending)
+
+    def _merge_stored(self, resolution: str, dimension: str, value: Optional[str], start: str, end: str,
+                      pending: List[Tuple[str, str, RollupCell]]) -> List[Tuple[str, str, RollupCell]]:
+        query = "SELECT bucket, value, data FROM rollups WHERE resolution = ? AND dimension = ? AND bucket BETWEEN ? AND ?"
+        params = [resolution, dimension, start, end]
+        if value is not None:
+            query += " AND value = ?"
+            params.append(value)
+        with self._connect() as conn:
+            rows = conn.execute(query + " LIMIT ?", (*params, MAX_QUERY_BUCKETS * 50)).fetchall()
+        cells = {(row["bucket"], row["value"]): RollupCell.from_bytes(row["data"]) for row in rows}
+        for bucket, val, delta in pending:
+            cells.setdefault((bucket, val), RollupCell()).merge(delta)
+        return [(bucket, val, cell) for (bucket, val), cell in cells.items()]
+
+    async def timeseries(self, resolution: str = "hour", dimension: str = "all", value: Optional[str] = None,
+                         date_from: Optional[str] = None, date_to: Optional[str] = None, buckets: int = 24) -> dict:
+        """Per-bucket turn counts and latency percentiles"""
+        start, end = self._range(resolution, date_from, date_to, min(buckets, MAX_QUERY_BUCKETS))
+        value = "all" if dimension == "all" else value
+        by_bucket: Dict[str, RollupCell] = {}
+        for bucket, _, cell in await self._cells(resolution, dimension, value, start, end):
+            by_bucket.setdefault(bucket, RollupCell()).merge(cell)
+        series = [{"bucket": bucket, **by_bucket[bucket].summary()} for bucket in sorted(by_bucket)]
+        return {"resolution": resolution, "dimension": dimension, "value": value,
+                "from": start, "to": end, "series": series}
+
+    async def breakdown(self, dimension: str = "agent", resolution: str = "day",
+                        date_from: Optional[str] = None, date_to: Optional[str] = None, buckets: int = 7) -> dict:
+        """Totals and latency percentiles per dimension value, merged over the range"""
+        start, end = self._range(resolution, date_from, date_to, min(buckets, MAX_QUERY_BUCKETS))
+        by_value: Dict[str, RollupCell] = {}
+        for _, value, cell in await self._cells(resolution, dimension, None, start, end):
+            by_value.setdefault(value, RollupCell()).merge(cell)
+        rows = sorted(({"value": value, **cell.summary()} for value, cell in by_value.items()),
+                      key=lambda row: row["turns"], reverse=True)
+        return {"dimension": dimension, "resolution": resolution, "from": start, "to": end, "rows": rows}
+
+    async def summary(self, resolution: str = "hour", date_from: Optional[str] = None,
+                      date_to: Optional[str] = None, buckets: int = 24, agent_id: Optional[str] = None) -> dict:
+        """Totals and latency percentiles over a range, for everything or one agent"""
+        dimension, value = ("agent", agent_id) if agent_id else ("all", "all")
+        start, end = self._range(resolution, date_from, date_to, min(buckets, MAX_QUERY_BUCKETS))
+        total = RollupCell()
+        for _, _, cell in await self._cells(resolution, dimension, value, start, end):
+            total.merge(cell)
+        return {"resolution": resolution, "from": start, "to": end, "agent_id": agent_id, **total.summary()}
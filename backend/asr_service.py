@@ -7,6 +7,8 @@ import os
 from typing import Optional
 import httpx
 
+from speaker_verification_service import SpeakerVerificationService
+
 logger = logging.getLogger(__name__)
 
 class ASRService:
@@ -21,6 +23,7 @@ class ASRService:
         self.deepgram_key = os.getenv("DEEPGRAM_API_KEY")
         self.speechtext_key = os.getenv("SPEECHTEXT_API_KEY")
         self.wav2vec_key = os.getenv("WAV2VEC_API_KEY")
+        self.speaker_verification = SpeakerVerificationService()
 
     async def transcribe_with_speaker_verification(
         self,
@@ -28,7 +31,9 @@ class ASRService:
         language: str,
         provider: str = "google_asr",
         verify_speaker: bool = False,
-        speaker_embedding_model: str = "speaker_verification_net"
+        speaker_embedding_model: str = "mfcc_stats",
+        speaker_id: Optional[str] = None,
+        verification_threshold: Optional[float] = None
     ) -> dict:
         """Transcribe audio with optional speaker verification"""
         try:
@@ -58,7 +63,9 @@ class ASRService:
                     
                 if result:
                     if verify_speaker:
-                        speaker_info = await self._verify_speaker(audio_path, speaker_embedding_model)
+                        speaker_info = await self._verify_speaker(
+                            audio_path, speaker_embedding_model, speaker_id, verification_threshold
+                        )
                         result["speaker_verified"] = speaker_info
                     return result
             
@@ -181,16 +188,22 @@ class ASRService:
     async def _verify_speaker(
         self,
         audio_path: str,
-        embedding_model: str
+        embedding_model: str,
+        speaker_id: Optional[str] = None,
+        threshold: Optional[float] = None
     ) -> dict:
-        """Verify speaker identity using speaker embedding models"""
+        """Verify speaker identity against enrolled speaker embeddings"""
         try:
-            # Speaker verification using embeddings
-            return {
-                "speaker_verified": False,
-                "confidence": 0.0,
-                "embedding_model": embedding_model
-            }
+            if not speaker_id:
+                return {
+                    "speaker_verified": False,
+                    "confidence": 0.0,
+                    "embedding_model": embedding_model,
+                    "error": "No speaker_id to verify against"
+                }
+            result = await self.speaker_verification.verify(audio_path, speaker_id, threshold)
+            result["embedding_model"] = embedding_model
+            return result
         except Exception as e:
             logger.error(f"Speaker verification error: {e}")
             return {"speaker_verified": False, "error": str(e)}
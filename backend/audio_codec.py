@@ -0,0 +1,271 @@
+# Audio Codec
+# Vectorized G.711 (mu-law / A-law) and PCM16 transcoding, streaming polyphase resampling and ffmpeg decode
+
+import asyncio
+import functools
+import logging
+from math import gcd
+from typing import AsyncIterator, Optional, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 22050, 24000, 44100, 48000)
+CODECS = ("mulaw", "alaw", "pcm16")
+
+MULAW_BIAS = 0x84
+MULAW_CLIP_14 = 8159
+ALAW_SEGMENT_ENDS = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+def _mulaw_encode_exact(pcm: np.ndarray) -> np.ndarray:
+    """Reference G.711 mu-law encoder on the 14-bit magnitude (used once to build the lookup table)"""
+    pcm14 = pcm.astype(np.int32) >> 2
+    negative = pcm14 < 0
+    magnitude = np.minimum(np.where(negative, -pcm14, pcm14), MULAW_CLIP_14) + (MULAW_BIAS >> 2)
+    segment = np.maximum(np.floor(np.log2(magnitude)).astype(np.int32) - 5, 0)
+    code = np.where(segment > 7, 0x7F, (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F))
+    return (code ^ np.where(negative, 0x7F, 0xFF)).astype(np.uint8)
+
+
+def _mulaw_decode_exact(codes: np.ndarray) -> np.ndarray:
+    codes = ~codes.astype(np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    magnitude = (((codes & 0x0F) << 3) + MULAW_BIAS) << exponent
+    sample = magnitude - MULAW_BIAS
+    return np.where(codes & 0x80, -sample, sample).astype(np.int16)
+
+
+def _alaw_encode_exact(pcm: np.ndarray) -> np.ndarray:
+    """Reference G.711 A-law encoder on the 13-bit magnitude (used once to build the lookup table)"""
+    pcm13 = pcm.astype(np.int32) >> 3
+    negative = pcm13 < 0
+    magnitude = np.where(negative, -pcm13 - 1, pcm13)
+    segment = np.searchsorted(ALAW_SEGMENT_ENDS, magnitude)
+    mantissa = np.where(segment < 2, magnitude >> 1, magnitude >> np.maximum(segment, 1)) & 0x0F
+    code = np.where(segment > 7, 0x7F, (np.minimum(segment, 7) << 4) | mantissa)
+    return (code ^ np.where(negative, 0x55, 0xD5)).astype(np.uint8)
+
+
+def _alaw_decode_exact(codes: np.ndarray) -> np.ndarray:
+    codes = codes.astype(np.int32) ^ 0x55
+    segment = (codes & 0x70) >> 4
+    magnitude = ((codes & 0x0F) << 4) + np.where(segment == 0, 8, 0x108)
+    magnitude = np.where(segment > 1, magnitude << np.maximum(segment - 1, 0), magnitude)
+    return np.where(codes & 0x80, magnitude, -magnitude).astype(np.int16)
+
+
+# 256-entry decode tables and 64K-entry encode tables indexed by the int16 bit pattern
+_ALL_PCM16 = np.arange(65536, dtype=np.uint32).astype(np.uint16).view(np.int16)
+_MULAW_DECODE = _mulaw_decode_exact(np.arange(256))
+_MULAW_ENCODE = _mulaw_encode_exact(_ALL_PCM16)
+_ALAW_DECODE = _alaw_decode_exact(np.arange(256))
+_ALAW_ENCODE = _alaw_encode_exact(_ALL_PCM16)
+
+
+def pcm16_from_bytes(data: BytesLike) -> np.ndarray:
+    """Little-endian PCM16 bytes as an int16 array view (no copy)"""
+    return np.frombuffer(data, dtype="<i2")
+
+
+def pcm16_to_bytes(pcm: np.ndarray) -> memoryview:
+    """int16 array as little-endian PCM16 bytes (no copy when already int16)"""
+    return memoryview(np.ascontiguousarray(pcm, dtype="<i2")).cast("B")
+
+
+def mulaw_decode(data: BytesLike) -> np.ndarray:
+    """mu-law bytes to int16 PCM (one table lookup per sample)"""
+    return _MULAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def mulaw_encode(pcm: np.ndarray) -> bytes:
+    """int16 PCM to mu-law bytes (one table lookup per sample)"""
+    return _MULAW_ENCODE[np.ascontiguousarray(pcm, dtype=np.int16).view(np.uint16)].tobytes()
+
+
+def alaw_decode(data: BytesLike) -> np.ndarray:
+    """A-law bytes to int16 PCM (one table lookup per sample)"""
+    return _ALAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+
+def alaw_encode(pcm: np.ndarray) -> bytes:
+    """int16 PCM to A-law bytes (one table lookup per sample)"""
+    return _ALAW_ENCODE[np.ascontiguousarray(pcm, dtype=np.int16).view(np.uint16)].tobytes()
+
+
+def decode(data: BytesLike, codec: str) -> np.ndarray:
+    """Codec bytes ("mulaw", "alaw" or "pcm16") to int16 PCM"""
+    if codec == "mulaw":
+        return mulaw_decode(data)
+    if codec == "alaw":
+        return alaw_decode(data)
+    if codec == "pcm16":
+        return pcm16_from_bytes(data)
+    raise ValueError(f"Unsupported codec: {codec}")
+
+
+def encode(pcm: np.ndarray, codec: str) -> BytesLike:
+    """int16 PCM to codec bytes ("mulaw", "alaw" or "pcm16")"""
+    if codec == "mulaw":
+        return mulaw_encode(pcm)
+    if codec == "alaw":
+        return alaw_encode(pcm)
+    if codec == "pcm16":
+        return pcm16_to_bytes(pcm)
+    raise ValueError(f"Unsupported codec: {codec}")
+
+
+def pcm16_to_float(pcm: np.ndarray) -> np.ndarray:
+    """int16 PCM to float32 in [-1, 1]"""
+    return pcm.astype(np.float32) / 32768.0
+
+
+def float_to_pcm16(samples: np.ndarray) -> np.ndarray:
+    """float32 in [-1, 1] to int16 PCM"""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+@functools.lru_cache(maxsize=16)
+def _polyphase_filter(up: int, down: int, half_len: int):
+    """Kaiser-windowed sinc low-pass split into `up` reversed phases, plus its delay in output samples
+
+    The filter centre is placed on a multiple of `down` so the delay is a whole number of output samples.
+    """
+    delay = -(-half_len * max(up, down) // down)
+    center = delay * down
+    n_taps = 2 * center + 1
+    taps_per_phase = -(-n_taps // up)
+    cutoff = 0.92 / max(up, down)  # a little under Nyquist so the transition band does not alias
+    t = np.arange(n_taps) - center
+    h = cutoff * np.sinc(cutoff * t) * np.kaiser(n_taps, 8.0) * up
+    h = np.pad(h, (0, taps_per_phase * up - n_taps))
+    # Phase p holds h[p], h[p + up], ... - reversed so each output is a dot product with a forward window
+    phases = np.ascontiguousarray(h.reshape(taps_per_phase, up).T[:, ::-1]).astype(np.float32)
+    return phases, delay
+
+
+class StreamingResampler:
+    """Polyphase rational resampler that carries filter history between frames
+
+    Frames can be any size; the output is identical to resampling the concatenated stream.
+    """
+
+    def __init__(self, from_sr: int, to_sr: int, half_len: int = 12):
+        g = gcd(from_sr, to_sr)
+        self.up, self.down = to_sr // g, from_sr // g
+        self.passthrough = self.up == self.down
+        if self.passthrough:
+            self.phases, self.delay, self.taps = None, 0, 1
+        else:
+            self.phases, self.delay = _polyphase_filter(self.up, self.down, half_len)
+            self.taps = self.phases.shape[1]
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0   # input samples seen before the current frame
+        self._produced = 0   # output samples emitted so far
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Resample the next float32 frame"""
+        samples = np.asarray(samples, dtype=np.float32)
+        if self.passthrough:
+            return samples
+        buffer = np.concatenate([self._history, samples])
+        total = self._consumed + samples.size
+        end = -(-total * self.up // self.down)
+        if end == self._produced:
+            # Too few new samples for an output (e.g. an empty frame); keep them as history
+            self._history = buffer[buffer.size - (self.taps - 1):]
+            self._consumed = total
+            return np.zeros(0, dtype=np.float32)
+        n = np.arange(self._produced, end, dtype=np.int64)
+        positions = n * self.down
+        # Output n uses input samples ending at k = nM // L through filter phase nM % L
+        starts = positions // self.up - self._consumed
+        windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps)[starts]
+        out = np.einsum("ij,ij->i", windows, self.phases[positions % self.up])
+
+        self._history = buffer[buffer.size - (self.taps - 1):]
+        self._consumed = total
+        self._produced = end
+        return out.astype(np.float32, copy=False)
+
+    def flush(self) -> np.ndarray:
+        """Drain the filter tail at the end of a stream"""
+        if self.passthrough:
+            return np.zeros(0, dtype=np.float32)
+        return self.process(np.zeros(self.taps, dtype=np.float32))
+
+
+def resample(samples: np.ndarray, from_sr: int, to_sr: int) -> np.ndarray:
+    """Resample a whole float32 signal, compensating the filter delay"""
+    if from_sr == to_sr:
+        return np.asarray(samples, dtype=np.float32)
+    resampler = StreamingResampler(from_sr, to_sr)
+    out = np.concatenate([resampler.process(samples), resampler.flush()])
+    length = -(-len(samples) * resampler.up // resampler.down)
+    return out[resampler.delay:resampler.delay + length]
+
+
+class StreamTranscoder:
+    """Stateful codec + sample-rate conversion for one direction of a call, frame by frame"""
+
+    def __init__(self, in_codec: str, in_sr: int, out_codec: str, out_sr: int):
+        self.in_codec = in_codec
+        self.out_codec = out_codec
+        self.resampler = StreamingResampler(in_sr, out_sr)
+        self._carry = b""
+
+    def process(self, data: BytesLike) -> BytesLike:
+        """Transcode the next frame; a trailing odd byte of PCM16 is held for the next call"""
+        if self.in_codec == "pcm16":
+            if self._carry or len(data) % 2:
+                data = self._carry + bytes(data)
+                usable = len(data) - len(data) % 2
+                data, self._carry = data[:usable], data[usable:]
+        pcm = decode(data, self.in_codec)
+        if not self.resampler.passthrough:
+            pcm = float_to_pcm16(self.resampler.process(pcm16_to_float(pcm)))
+        elif self.in_codec == self.out_codec:
+            return data
+        return encode(pcm, self.out_codec)
+
+
+async def decode_stream(chunks: AsyncIterator[bytes], sample_rate: int, read_size: int = 3200) -> AsyncIterator[np.ndarray]:
+    """Transcode a stream of encoded audio (mp3/wav/opus...) to mono int16 PCM as it arrives"""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    carry = b""
+    try:
+        while True:
+            data = await process.stdout.read(read_size)
+            if not data:
+                break
+            data = carry + data
+            usable = len(data) - len(data) % 2
+            carry = data[usable:]
+            if usable:
+                yield np.frombuffer(data[:usable], dtype="<i2")
+        await feeder
+    finally:
+        if not feeder.done():
+            feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
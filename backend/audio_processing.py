@@ -0,0 +1,219 @@
+# Audio Processing
+# Vectorized NumPy helpers for decoding, framing and speaker features (MFCC)
+
+import functools
+import io
+import logging
+import subprocess
+import wave
+from typing import Tuple
+
+import numpy as np
+
+from audio_codec import pcm16_from_bytes, pcm16_to_bytes, pcm16_to_float, float_to_pcm16, resample
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 16000
+
+
+def decode_audio(data: bytes, target_sr: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """Decode audio bytes to mono float32 in [-1, 1] at target_sr (WAV natively, anything else via ffmpeg)"""
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            sr, channels, width = wav.getframerate(), wav.getnchannels(), wav.getsampwidth()
+            frames = wav.readframes(wav.getnframes())
+        if width == 2:
+            samples = pcm16_to_float(pcm16_from_bytes(frames))
+            if channels > 1:
+                samples = samples.reshape(-1, channels).mean(axis=1)
+            return resample(samples, sr, target_sr)
+    except (wave.Error, EOFError):
+        pass
+
+    result = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-loglevel", "error", "-i", "pipe:0",
+         "-ac", "1", "-ar", str(target_sr), "-f", "s16le", "pipe:1"],
+        input=data, capture_output=True, check=True
+    )
+    return pcm16_to_float(pcm16_from_bytes(result.stdout))
+
+
+def load_audio(path: str, target_sr: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """Decode an audio file to mono float32 at target_sr"""
+    with open(path, "rb") as f:
+        return decode_audio(f.read(), target_sr)
+
+
+def frame_signal(samples: np.ndarray, frame_len: int, hop: int) -> np.ndarray:
+    """Overlapping frames as a (n_frames, frame_len) strided view - no copy"""
+    if samples.size < frame_len:
+        samples = np.pad(samples, (0, frame_len - samples.size))
+    n_frames = 1 + (samples.size - frame_len) // hop
+    return np.lib.stride_tricks.as_strided(
+        samples,
+        shape=(n_frames, frame_len),
+        strides=(samples.strides[0] * hop, samples.strides[0]),
+        writeable=False
+    )
+
+
+def frame_energy_db(frames: np.ndarray) -> np.ndarray:
+    """Per-frame RMS energy in dBFS"""
+    rms = np.sqrt(np.mean(frames.astype(np.float64) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_mask(energy_db: np.ndarray, margin_db: float = 15.0, floor_db: float = -55.0) -> np.ndarray:
+    """Energy VAD: frames within margin_db of the loud end and above an absolute floor"""
+    if energy_db.size == 0:
+        return np.zeros(0, dtype=bool)
+    return (energy_db > np.percentile(energy_db, 95) - margin_db) & (energy_db > floor_db)
+
+
+@functools.lru_cache(maxsize=8)
+def mel_filterbank(sr: int, n_fft: int, n_mels: int) -> np.ndarray:
+    """Triangular mel filterbank of shape (n_mels, n_fft // 2 + 1)"""
+    def hz_to_mel(hz):
+        return 2595.0 * np.log10(1.0 + hz / 700.0)
+
+    def mel_to_hz(mel):
+        return 700.0 * (10 ** (mel / 2595.0) - 1.0)
+
+    mel_points = np.linspace(hz_to_mel(20.0), hz_to_mel(sr / 2), n_mels + 2)
+    bins = np.floor((n_fft + 1) * mel_to_hz(mel_points) / sr).astype(int)
+    bank = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            bank[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            bank[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return bank
+
+
+@functools.lru_cache(maxsize=4)
+def _dct_matrix(n_mels: int, n_mfcc: int) -> np.ndarray:
+    n = np.arange(n_mels)
+    k = np.arange(n_mfcc)[:, None]
+    return (np.cos(np.pi * k * (2 * n + 1) / (2 * n_mels)) * np.sqrt(2.0 / n_mels)).astype(np.float32)
+
+
+def mfcc(samples: np.ndarray, sr: int = DEFAULT_SAMPLE_RATE, n_mfcc: int = 20, n_mels: int = 40) -> Tuple[np.ndarray, np.ndarray]:
+    """MFCCs (n_frames, n_mfcc) with 25 ms / 10 ms framing, plus per-frame energy in dB"""
+    frame_len, hop = int(0.025 * sr), int(0.010 * sr)
+    n_fft = 1 << (frame_len - 1).bit_length()
+    emphasized = np.append(samples[:1], samples[1:] - 0.97 * samples[:-1]).astype(np.float32)
+    frames = frame_signal(emphasized, frame_len, hop)
+    energy_db = frame_energy_db(frames)
+    spectrum = np.abs(np.fft.rfft(frames * np.hamming(frame_len).astype(np.float32), n=n_fft)) ** 2
+    mel_energy = np.log(np.maximum(spectrum @ mel_filterbank(sr, n_fft, n_mels).T, 1e-10))
+    return mel_energy @ _dct_matrix(n_mels, n_mfcc).T, energy_db
+
+
+def speaker_embedding(samples: np.ndarray, sr: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """Fixed-size, L2-normalized speaker embedding from MFCC + delta statistics over speech frames"""
+    coeffs, energy_db = mfcc(samples, sr)
+    mask = speech_mask(energy_db)
+    if mask.sum() >= 10:
+        coeffs = coeffs[mask]
+    coeffs = coeffs[:, 1:]  # c0 tracks loudness, not the speaker
+    deltas = np.gradient(coeffs, axis=0) if coeffs.shape[0] > 1 else np.zeros_like(coeffs)
+    embedding = np.concatenate([coeffs.mean(axis=0), coeffs.std(axis=0), deltas.std(axis=0)])
+    # Standardize dimensions against each other so no single statistic dominates the cosine
+    embedding = (embedding - embedding.mean()) / (embedding.std() + 1e-8)
+    return (embedding / (np.linalg.norm(embedding) + 1e-8)).astype(np.float32)
+
+
+def encode_wav(samples: np.ndarray, sr: int = DEFAULT_SAMPLE_RATE) -> bytes:
+    """Encode mono float32 samples as 16-bit PCM WAV"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sr)
+        wav.writeframes(pcm16_to_bytes(float_to_pcm16(samples)))
+    return buffer.getvalue()
+
+
+# Voice sample quality gates for cloning
+MIN_SNR_DB = 15.0
+MAX_CLIPPING_RATIO = 0.01
+MIN_SPEECH_RATIO = 0.2
+SEGMENT_FRAME_MS = 30
+MIN_SEGMENT_MS = 300
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """(start, end) frame indices of consecutive True runs"""
+    padded = np.concatenate([[False], mask, [False]])
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return edges.reshape(-1, 2)
+
+
+def analyze_voice_sample(path: str, sr: int = DEFAULT_SAMPLE_RATE) -> dict:
+    """Decode one sample, score SNR/clipping/speech ratio and cut out its clean speech segments
+
+    Runs in a worker process, so it takes a path and returns plain arrays.
+    """
+    samples = load_audio(path, sr)
+    frame_len = int(sr * SEGMENT_FRAME_MS / 1000)
+    frames = frame_signal(samples, frame_len, frame_len)
+    energy_db = frame_energy_db(frames)
+    speech = speech_mask(energy_db)
+    clipped = np.any(np.abs(frames) >= 0.999, axis=1)
+
+    noise_db = np.percentile(energy_db[~speech], 50) if (~speech).any() else -90.0
+    speech_db = np.percentile(energy_db[speech], 50) if speech.any() else -90.0
+    report = {
+        "path": path,
+        "duration_s": round(samples.size / sr, 2),
+        "snr_db": round(float(speech_db - noise_db), 1),
+        "clipping_ratio": round(float(clipped.mean()) if clipped.size else 0.0, 4),
+        "speech_ratio": round(float(speech.mean()) if speech.size else 0.0, 3),
+    }
+
+    # Bridge short pauses (< 150 ms) so words are not chopped apart, then drop clipped frames
+    gap = int(150 / SEGMENT_FRAME_MS)
+    for start, end in _runs(~speech):
+        if 0 < start and end < speech.size and end - start <= gap:
+            speech[start:end] = True
+    usable = speech & ~clipped
+    min_frames = MIN_SEGMENT_MS // SEGMENT_FRAME_MS
+    segments = [
+        samples[start * frame_len:end * frame_len]
+        for start, end in _runs(usable) if end - start >= min_frames
+    ]
+    report["segments"] = segments
+    report["usable_s"] = round(sum(seg.size for seg in segments) / sr, 2)
+    report["accepted"] = (
+        report["snr_db"] >= MIN_SNR_DB
+        and report["clipping_ratio"] <= MAX_CLIPPING_RATIO
+        and report["speech_ratio"] >= MIN_SPEECH_RATIO
+        and bool(segments)
+    )
+    return report
+
+
+def merge_voice_segments(reports: list, target_seconds: float, sr: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """Concatenate the cleanest speech segments from accepted samples up to target_seconds"""
+    accepted = sorted((r for r in reports if r["accepted"]), key=lambda r: r["snr_db"], reverse=True)
+    if not accepted:
+        # Every sample failed a gate - fall back to the best one rather than refusing to clone
+        accepted = sorted((r for r in reports if r["segments"]), key=lambda r: r["snr_db"], reverse=True)[:1]
+    target = int(target_seconds * sr)
+    pause = np.zeros(int(0.15 * sr), dtype=np.float32)
+    pieces, total = [], 0
+    for report in accepted:
+        for segment in report["segments"]:
+            if total >= target:
+                break
+            segment = segment[:target - total]
+            pieces.extend([segment, pause])
+            total += segment.size
+    if not pieces:
+        return np.zeros(0, dtype=np.float32)
+    merged = np.concatenate(pieces[:-1])
+    # Normalize to -3 dBFS peak so samples recorded at different levels match
+    peak = np.max(np.abs(merged))
+    return merged * (0.708 / peak) if peak > 0 else merged
@@ -0,0 +1,68 @@
+# Serialization Benchmark
+# Compares stdlib json with the fast serializer on the voice agent's hot-path payloads
+#
+# Usage: python bench_serialization.py
+
+import base64
+import json
+import os
+import timeit
+
+from serialization import BACKEND, dumps_str, loads
+from ws_messages import parse_client_message
+
+
+def _payloads() -> dict:
+    audio_b64 = base64.b64encode(os.urandom(300 * 1024)).decode("ascii")
+    agents = [
+        {
+            "agent_id": f"agent_{i}",
+            "name": f"Agent {i}",
+            "job_role": "Customer Support",
+            "system_instruction": "You are a helpful support agent for an Indian telecom company. " * 4,
+            "language": "hi",
+            "supported_languages": ["hi", "en-IN", "ta"],
+            "temperature": 0.7,
+            "max_tokens": 500,
+            "prompts": {"opening": {"hi": "Namaste!", "en-IN": "Hello!"}},
+            "created_at": "2024-01-01T00:00:00",
+        }
+        for i in range(200)
+    ]
+    return {
+        "audio_chunk (300 KB)": {"type": "audio_chunk", "audio": audio_b64, "seq": 3},
+        "audio_frame (20 ms)": {"type": "audio_frame", "audio": base64.b64encode(os.urandom(640)).decode("ascii")},
+        "agent list (200)": {"agents": agents, "count": len(agents)},
+    }
+
+
+def _time(fn, number: int) -> float:
+    """Best-of-5 microseconds per call"""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print(f"fast serializer backend: {BACKEND}\n")
+    print(f"{'payload':<24}{'op':<22}{'stdlib us':>12}{'fast us':>12}{'speedup':>10}")
+    for name, payload in _payloads().items():
+        encoded = json.dumps(payload)
+        number = 200 if len(encoded) > 100_000 else 2000
+        rows = [
+            ("encode", lambda: json.dumps(payload), lambda: dumps_str(payload)),
+            ("decode", lambda: json.loads(encoded), lambda: loads(encoded)),
+        ]
+        if payload.get("type") in ("audio_frame",) or name.startswith("audio_chunk"):
+            # Client audio frames are decoded and validated together
+            client = json.dumps({"type": "audio", "audio": payload["audio"]})
+            rows.append((
+                "decode + validate",
+                lambda: json.loads(client)["audio"],
+                lambda: parse_client_message(client).audio,
+            ))
+        for op, slow, fast in rows:
+            slow_us, fast_us = _time(slow, number), _time(fast, number)
+            print(f"{name:<24}{op:<22}{slow_us:>12.1f}{fast_us:>12.1f}{slow_us / fast_us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
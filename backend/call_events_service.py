@@ -0,0 +1,270 @@
+# Call Events Service
+# Normalizes Twilio/Vapi/Exotel status webhooks into one call-event stream with a live call state table
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Normalized call statuses, in lifecycle order; the last four are final
+CALL_STATUSES = ("queued", "ringing", "in_progress", "completed", "busy", "no_answer", "failed")
+FINAL_STATUSES = ("completed", "busy", "no_answer", "failed")
+
+MAX_CACHED_CALLS = 10000
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+
+def classify_call_status(status: Optional[str], ended_reason: Optional[str] = None) -> Optional[str]:
+    """Map provider call statuses to completed/busy/no_answer/failed, or None while the call is live"""
+    status = (status or "").lower().replace("_", "-")
+    reason = (ended_reason or "").lower()
+    if "busy" in status or "busy" in reason:
+        return "busy"
+    if status in ("no-answer", "noanswer") or "did-not-answer" in reason or "no-answer" in reason:
+        return "no_answer"
+    if status in ("failed", "canceled", "cancelled"):
+        return "failed"
+    if status in ("completed", "ended"):
+        return "completed"
+    return None
+
+
+def normalize_status(status: Optional[str], ended_reason: Optional[str] = None) -> str:
+    """Map any provider status onto CALL_STATUSES"""
+    final = classify_call_status(status, ended_reason)
+    if final:
+        return final
+    status = (status or "").lower().replace("_", "-")
+    if status in ("ringing", "forwarding"):
+        return "ringing"
+    if status in ("in-progress", "answered", "inprogress"):
+        return "in_progress"
+    return "queued"
+
+
+def call_event(call_id: str, provider: str, status: Optional[str], ended_reason: Optional[str] = None,
+               duration=None, event_type: str = "status") -> dict:
+    """Normalized call event"""
+    normalized = normalize_status(status, ended_reason)
+    return {
+        "call_id": call_id,
+        "provider": provider,
+        "type": event_type,
+        "status": normalized,
+        "raw_status": status,
+        "ended_reason": ended_reason,
+        "duration": float(duration) if duration not in (None, "") else None,
+        "final": normalized in FINAL_STATUSES,
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+def normalize_twilio(form: dict) -> Optional[dict]:
+    """Twilio StatusCallback form fields"""
+    if not form.get("CallSid"):
+        return None
+    return call_event(form["CallSid"], "twilio", form.get("CallStatus"), duration=form.get("CallDuration"))
+
+
+def normalize_vapi(body: dict) -> Optional[dict]:
+    """Vapi server message (status-update and end-of-call-report)"""
+    message = body.get("message", body)
+    call_id = (message.get("call") or {}).get("id")
+    if not call_id:
+        return None
+    if message.get("type") == "end-of-call-report":
+        return call_event(call_id, "vapi", "ended", message.get("endedReason"),
+                          message.get("durationSeconds"), event_type="end-of-call-report")
+    if message.get("type") == "status-update":
+        return call_event(call_id, "vapi", message.get("status"), message.get("endedReason"))
+    return None
+
+
+def normalize_exotel(form: dict) -> Optional[dict]:
+    """Exotel StatusCallback form fields"""
+    if not form.get("CallSid"):
+        return None
+    return call_event(form["CallSid"], "exotel", form.get("Status") or form.get("CallStatus"),
+                      duration=form.get("ConversationDuration") or form.get("Duration"))
+
+
+def validate_twilio_signature(auth_token: str, url: str, params: dict, signature: str) -> bool:
+    """X-Twilio-Signature: base64 HMAC-SHA1 of the URL followed by the sorted POST params"""
+    payload = url + "".join(f"{key}{params[key]}" for key in sorted(params))
+    expected = base64.b64encode(hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()).decode()
+    return hmac.compare_digest(expected, signature or "")
+
+
+class CallEventService:
+    """Call state table kept in memory and SQLite, with event fan-out to subscribers"""
+
+    def __init__(self, db_path: str = "/tmp/call_events.db"):
+        self.db_path = db_path
+        self.twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
+        self.vapi_webhook_secret = os.getenv("VAPI_WEBHOOK_SECRET")
+        self.exotel_webhook_token = os.getenv("EXOTEL_WEBHOOK_TOKEN")
+        self._calls: "OrderedDict[str, dict]" = OrderedDict()
+        self._subscribers: List[Tuple[asyncio.Queue, Optional[str]]] = []
+        self._waiters: Dict[str, List[asyncio.Future]] = {}
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS calls (
+                    call_id TEXT PRIMARY KEY,
+                    provider TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    raw_status TEXT,
+                    ended_reason TEXT,
+                    duration REAL,
+                    updated_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS call_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    call_id TEXT NOT NULL,
+                    event TEXT NOT NULL,
+                    received_at TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS call_events_call ON call_events (call_id, id);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def verify_twilio(self, url: str, params: dict, signature: Optional[str]) -> bool:
+        """Check a Twilio webhook signature (skipped when no auth token is configured)"""
+        if not self.twilio_auth_token:
+            return True
+        return validate_twilio_signature(self.twilio_auth_token, url, params, signature)
+
+    def verify_vapi(self, secret: Optional[str]) -> bool:
+        """Check the x-vapi-secret header (skipped when no secret is configured)"""
+        if not self.vapi_webhook_secret:
+            return True
+        return hmac.compare_digest(self.vapi_webhook_secret, secret or "")
+
+    def verify_exotel(self, token: Optional[str], authorization: Optional[str]) -> bool:
+        """Check an Exotel callback's shared token, sent as ?token= or a Basic auth password (skipped when unset)"""
+        if not self.exotel_webhook_token:
+            return True
+        if token and hmac.compare_digest(self.exotel_webhook_token, token):
+            return True
+        scheme, _, credentials = (authorization or "").partition(" ")
+        if scheme.lower() != "basic":
+            return False
+        try:
+            password = base64.b64decode(credentials, validate=True).decode().partition(":")[2]
+        except (ValueError, UnicodeDecodeError):
+            return False
+        return hmac.compare_digest(self.exotel_webhook_token, password)
+
+    def _persist(self, state: dict, event: dict):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO calls (call_id, provider, status, raw_status, ended_reason, duration, updated_at) "
+                "VALUES (:call_id, :provider, :status, :raw_status, :ended_reason, :duration, :updated_at) "
+                "ON CONFLICT(call_id) DO UPDATE SET status = excluded.status, raw_status = excluded.raw_status, "
+                "ended_reason = excluded.ended_reason, duration = excluded.duration, updated_at = excluded.updated_at",
+                state
+            )
+            conn.execute(
+                "INSERT INTO call_events (call_id, event, received_at) VALUES (?, ?, ?)",
+                (event["call_id"], json.dumps(event), event["timestamp"])
+            )
+
+    async def ingest(self, event: dict) -> dict:
+        """Apply an event to the state table, persist it and notify subscribers"""
+        call_id = event["call_id"]
+        current = self._calls.get(call_id) or await asyncio.to_thread(self._load_call, call_id)
+        state = dict(current) if current else {
+            "call_id": call_id, "provider": event["provider"], "status": "queued",
+            "raw_status": None, "ended_reason": None, "duration": None
+        }
+        # Webhooks can arrive out of order - never move a call backwards in its lifecycle
+        if CALL_STATUSES.index(event["status"]) >= CALL_STATUSES.index(state["status"]) and state["status"] not in FINAL_STATUSES:
+            state.update(status=event["status"], raw_status=event["raw_status"])
+        if event["ended_reason"]:
+            state["ended_reason"] = event["ended_reason"]
+        if event["duration"] is not None:
+            state["duration"] = event["duration"]
+        state["updated_at"] = event["timestamp"]
+
+        self._cache(call_id, state)
+        await asyncio.to_thread(self._persist, state, event)
+        self._publish(event)
+        if state["status"] in FINAL_STATUSES:
+            for future in self._waiters.pop(call_id, []):
+                if not future.done():
+                    future.set_result(state["status"])
+        return state
+
+    def _cache(self, call_id: str, state: dict):
+        self._calls[call_id] = state
+        self._calls.move_to_end(call_id)
+        while len(self._calls) > MAX_CACHED_CALLS:
+            self._calls.popitem(last=False)
+
+    def _load_call(self, call_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM calls WHERE call_id = ?", (call_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_call(self, call_id: str) -> Optional[dict]:
+        """Current state of a call (memory first, then SQLite)"""
+        state = self._calls.get(call_id)
+        if state is None:
+            state = self._load_call(call_id)
+            if state:
+                self._cache(call_id, state)
+        return dict(state) if state else None
+
+    def get_events(self, call_id: str) -> List[dict]:
+        """Every event received for a call, oldest first"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT event FROM call_events WHERE call_id = ? ORDER BY id", (call_id,)).fetchall()
+        return [json.loads(row["event"]) for row in rows]
+
+    def subscribe(self, call_id: Optional[str] = None) -> asyncio.Queue:
+        """Queue receiving every event (or only one call's events)"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.append((queue, call_id))
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers = [(q, c) for q, c in self._subscribers if q is not queue]
+
+    def _publish(self, event: dict):
+        for queue, call_id in self._subscribers:
+            if call_id and call_id != event["call_id"]:
+                continue
+            if queue.full():
+                # Slow consumer - drop its oldest event rather than block ingestion
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def wait_for_final(self, call_id: str, timeout: float) -> Optional[str]:
+        """Final status of a call, waiting up to timeout seconds for it to end"""
+        state = self.get_call(call_id)
+        if state and state["status"] in FINAL_STATUSES:
+            return state["status"]
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(call_id, []).append(future)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            waiters = self._waiters.get(call_id)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    self._waiters.pop(call_id, None)
@@ -0,0 +1,363 @@
+# Campaign Service
+# Bulk outbound calling campaigns with per-provider concurrency, CPS pacing and retries
+
+import asyncio
+import logging
+import os
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from call_events_service import classify_call_status
+
+logger = logging.getLogger(__name__)
+
+# Default concurrent-call and calls-per-second limits per provider (override via env)
+PROVIDER_LIMITS = {
+    "vapi": {"concurrency": int(os.getenv("VAPI_MAX_CONCURRENT_CALLS", "10")), "cps": float(os.getenv("VAPI_CPS", "1"))},
+    "twilio": {"concurrency": int(os.getenv("TWILIO_MAX_CONCURRENT_CALLS", "50")), "cps": float(os.getenv("TWILIO_CPS", "1"))},
+    "exotel": {"concurrency": int(os.getenv("EXOTEL_MAX_CONCURRENT_CALLS", "20")), "cps": float(os.getenv("EXOTEL_CPS", "2"))},
+}
+
+# Normalized call outcomes
+RETRYABLE_OUTCOMES = ("busy", "no_answer")
+TERMINAL_STATUSES = ("completed", "busy", "no_answer", "failed")
+
+STATUS_POLL_SECONDS = 5
+# How often a started service looks for campaigns created or resumed by other processes
+ADOPT_SECONDS = 5
+# With webhooks, only check the provider directly if no final event arrives for this long
+RECONCILE_SECONDS = 120
+MAX_CALL_SECONDS = 3600
+
+
+class RateLimiter:
+    """Spaces out call attempts to stay under a calls-per-second limit"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(now, self._next) + self.interval
+
+
+class CampaignService:
+    """Dials thousands of numbers for an agent and persists per-number state"""
+
+    def __init__(self, phone_service, call_events=None, db_path: str = "/tmp/campaigns.db"):
+        self.phone_service = phone_service
+        self.call_events = call_events
+        self.db_path = db_path
+        self._runners: Dict[str, asyncio.Task] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self._provider_slots = {p: asyncio.Semaphore(l["concurrency"]) for p, l in PROVIDER_LIMITS.items()}
+        self._pacers = {p: RateLimiter(l["cps"]) for p, l in PROVIDER_LIMITS.items()}
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS campaigns (
+                    id TEXT PRIMARY KEY,
+                    agent_id TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    message TEXT,
+                    status TEXT NOT NULL,
+                    concurrency INTEGER NOT NULL,
+                    max_attempts INTEGER NOT NULL,
+                    retry_base_seconds INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS campaign_numbers (
+                    campaign_id TEXT NOT NULL,
+                    phone_number TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at TEXT NOT NULL,
+                    call_id TEXT,
+                    last_error TEXT,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (campaign_id, phone_number)
+                );
+                CREATE INDEX IF NOT EXISTS campaign_numbers_due
+                    ON campaign_numbers (campaign_id, status, next_attempt_at);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    async def start(self):
+        """Resume campaigns that were running before a restart and dial from this process"""
+        with self._connect() as conn:
+            # Calls that never got a call id may or may not have been placed - retry them
+            conn.execute("UPDATE campaign_numbers SET status = 'pending' WHERE status = 'dialing'")
+        self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watcher:
+            self._watcher.cancel()
+            self._watcher = None
+        for task in self._runners.values():
+            task.cancel()
+        self._runners = {}
+
+    async def _watch(self):
+        """Run every campaign marked running, including ones created through other workers"""
+        while True:
+            try:
+                with self._connect() as conn:
+                    running = conn.execute("SELECT id FROM campaigns WHERE status = 'running'").fetchall()
+                for row in running:
+                    if row["id"] not in self._runners or self._runners[row["id"]].done():
+                        self._launch(row["id"])
+            except Exception as e:
+                logger.error(f"Campaign watcher error: {e}")
+            await asyncio.sleep(ADOPT_SECONDS)
+
+    def create_campaign(
+        self,
+        agent_id: str,
+        phone_numbers: List[str],
+        provider: str = "twilio",
+        message: Optional[str] = None,
+        concurrency: Optional[int] = None,
+        max_attempts: int = 3,
+        retry_base_seconds: int = 300
+    ) -> dict:
+        """Create a campaign and start dialing"""
+        if provider not in PROVIDER_LIMITS:
+            return {"success": False, "error": f"Unsupported provider: {provider}"}
+        campaign_id = f"campaign_{uuid.uuid4().hex[:12]}"
+        now = datetime.utcnow().isoformat()
+        concurrency = min(concurrency or PROVIDER_LIMITS[provider]["concurrency"], PROVIDER_LIMITS[provider]["concurrency"])
+        numbers = list(dict.fromkeys(n.strip() for n in phone_numbers if n.strip()))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO campaigns (id, agent_id, provider, message, status, concurrency, max_attempts, "
+                "retry_base_seconds, created_at, started_at) VALUES (?, ?, ?, ?, 'running', ?, ?, ?, ?, ?)",
+                (campaign_id, agent_id, provider, message, concurrency, max_attempts, retry_base_seconds, now, now)
+            )
+            conn.executemany(
+                "INSERT INTO campaign_numbers (campaign_id, phone_number, status, next_attempt_at, updated_at) "
+                "VALUES (?, ?, 'pending', ?, ?)",
+                [(campaign_id, number, now, now) for number in numbers]
+            )
+        if self._watcher:
+            self._launch(campaign_id)
+        logger.info(f"Campaign {campaign_id} created with {len(numbers)} numbers")
+        return {"success": True, "campaign_id": campaign_id, "numbers": len(numbers), "concurrency": concurrency}
+
+    def _launch(self, campaign_id: str):
+        self._runners[campaign_id] = asyncio.create_task(self._run(campaign_id))
+
+    def set_status(self, campaign_id: str, status: str) -> dict:
+        """Pause, resume or cancel a campaign"""
+        with self._connect() as conn:
+            updated = conn.execute(
+                "UPDATE campaigns SET status = ? WHERE id = ? AND status NOT IN ('completed', 'cancelled')",
+                (status, campaign_id)
+            ).rowcount
+        if not updated:
+            return {"success": False, "error": "Campaign not found or already finished"}
+        if self._watcher and status == "running" and (campaign_id not in self._runners or self._runners[campaign_id].done()):
+            self._launch(campaign_id)
+        return {"success": True, "campaign_id": campaign_id, "status": status}
+
+    def _campaign(self, campaign_id: str) -> Optional[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+
+    def _claim_due(self, campaign_id: str, limit: int) -> List[sqlite3.Row]:
+        now = datetime.utcnow().isoformat()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT * FROM campaign_numbers WHERE campaign_id = ? AND status = 'pending' "
+                "AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (campaign_id, now, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE campaign_numbers SET status = 'dialing', updated_at = ? WHERE campaign_id = ? AND phone_number = ?",
+                [(now, campaign_id, row["phone_number"]) for row in rows]
+            )
+        return rows
+
+    def _resumable_calls(self, campaign_id: str) -> List[sqlite3.Row]:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT * FROM campaign_numbers WHERE campaign_id = ? AND status = 'in_progress'", (campaign_id,)
+            ).fetchall()
+
+    def _remaining(self, campaign_id: str) -> int:
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM campaign_numbers WHERE campaign_id = ? AND status IN ('pending', 'dialing', 'in_progress')",
+                (campaign_id,)
+            ).fetchone()[0]
+
+    def _update_number(self, campaign_id: str, phone_number: str, **fields):
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE campaign_numbers SET {assignments} WHERE campaign_id = ? AND phone_number = ?",
+                (*fields.values(), campaign_id, phone_number)
+            )
+
+    def _finish(self, campaign_id: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE campaigns SET status = 'completed', finished_at = ? WHERE id = ? AND status = 'running'",
+                (datetime.utcnow().isoformat(), campaign_id)
+            )
+
+    async def _run(self, campaign_id: str):
+        """Keep up to `concurrency` calls in flight until every number reaches a final state"""
+        active = set()
+        for row in await asyncio.to_thread(self._resumable_calls, campaign_id):
+            campaign = await asyncio.to_thread(self._campaign, campaign_id)
+            task = asyncio.create_task(self._follow_call(campaign, row["phone_number"], row["call_id"], row["attempts"]))
+            active.add(task)
+            task.add_done_callback(active.discard)
+
+        while True:
+            campaign = await asyncio.to_thread(self._campaign, campaign_id)
+            if campaign is None or campaign["status"] == "cancelled":
+                for task in active:
+                    task.cancel()
+                return
+            if campaign["status"] == "paused":
+                await asyncio.sleep(1)
+                continue
+
+            free = campaign["concurrency"] - len(active)
+            rows = await asyncio.to_thread(self._claim_due, campaign_id, free) if free > 0 else []
+            for row in rows:
+                task = asyncio.create_task(self._dial(campaign, row))
+                active.add(task)
+                task.add_done_callback(active.discard)
+
+            if not rows:
+                if not active and await asyncio.to_thread(self._remaining, campaign_id) == 0:
+                    await asyncio.to_thread(self._finish, campaign_id)
+                    logger.info(f"Campaign {campaign_id} completed")
+                    return
+                await asyncio.sleep(1)
+
+    async def _dial(self, campaign: sqlite3.Row, row: sqlite3.Row):
+        """Place one call attempt within provider concurrency and CPS limits"""
+        provider, number = campaign["provider"], row["phone_number"]
+        attempts = row["attempts"] + 1
+        async with self._provider_slots[provider]:
+            await self._pacers[provider].wait()
+            result = await self.phone_service.make_call(
+                phone_number=number,
+                agent_id=campaign["agent_id"],
+                provider=provider,
+                message=campaign["message"],
+                fallback=False
+            )
+            if not result.get("success") or not result.get("call_id"):
+                await self._record_outcome(campaign, number, attempts, "failed", result.get("error", "Call initiation failed"))
+                return
+            await asyncio.to_thread(
+                self._update_number, campaign["id"], number,
+                status="in_progress", attempts=attempts, call_id=result["call_id"]
+            )
+            await self._follow_call(campaign, number, result["call_id"], attempts)
+
+    async def _follow_call(self, campaign: sqlite3.Row, number: str, call_id: str, attempts: int):
+        try:
+            outcome = await self._wait_for_outcome(call_id, campaign["provider"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Campaign call {call_id} status error: {e}")
+            await self._record_outcome(campaign, number, attempts, "failed", str(e))
+            return
+        await self._record_outcome(campaign, number, attempts, outcome)
+
+    async def _wait_for_outcome(self, call_id: str, provider: str) -> str:
+        """Wait for the call's final status event, reconciling against the provider if webhooks go quiet"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + MAX_CALL_SECONDS
+        while loop.time() < deadline:
+            if self.call_events:
+                outcome = await self.call_events.wait_for_final(call_id, RECONCILE_SECONDS)
+                if outcome:
+                    return outcome
+            status = await self.phone_service.get_call_status(call_id, provider, refresh=True)
+            outcome = classify_call_status(status.get("status"), status.get("ended_reason"))
+            if outcome:
+                return outcome
+            if not self.call_events:
+                await asyncio.sleep(STATUS_POLL_SECONDS)
+        return "failed"
+
+    async def _record_outcome(self, campaign: sqlite3.Row, number: str, attempts: int, outcome: str, error: Optional[str] = None):
+        """Store the outcome, scheduling a retry with exponential backoff for busy/no-answer"""
+        if outcome in RETRYABLE_OUTCOMES and attempts < campaign["max_attempts"]:
+            delay = campaign["retry_base_seconds"] * 2 ** (attempts - 1)
+            next_attempt = (datetime.utcnow() + timedelta(seconds=delay)).isoformat()
+            await asyncio.to_thread(
+                self._update_number, campaign["id"], number,
+                status="pending", attempts=attempts, next_attempt_at=next_attempt, last_error=outcome
+            )
+            return
+        await asyncio.to_thread(
+            self._update_number, campaign["id"], number,
+            status=outcome, attempts=attempts, last_error=error
+        )
+
+    def get_campaign(self, campaign_id: str) -> dict:
+        """Campaign settings with progress, outcome counts and throughput"""
+        campaign = self._campaign(campaign_id)
+        if campaign is None:
+            return {"success": False, "error": "Campaign not found"}
+        with self._connect() as conn:
+            counts = dict(conn.execute(
+                "SELECT status, COUNT(*) FROM campaign_numbers WHERE campaign_id = ? GROUP BY status", (campaign_id,)
+            ).fetchall())
+            attempts = conn.execute(
+                "SELECT COALESCE(SUM(attempts), 0) FROM campaign_numbers WHERE campaign_id = ?", (campaign_id,)
+            ).fetchone()[0]
+        total = sum(counts.values())
+        finished = sum(counts.get(s, 0) for s in TERMINAL_STATUSES)
+        end = datetime.fromisoformat(campaign["finished_at"]) if campaign["finished_at"] else datetime.utcnow()
+        elapsed_minutes = max((end - datetime.fromisoformat(campaign["started_at"])).total_seconds() / 60, 1 / 60)
+        return {
+            "success": True,
+            "campaign": dict(campaign),
+            "stats": {
+                "total_numbers": total,
+                "by_status": counts,
+                "finished": finished,
+                "completion_rate": round(finished / total, 4) if total else 0.0,
+                "connect_rate": round(counts.get("completed", 0) / finished, 4) if finished else 0.0,
+                "call_attempts": attempts,
+                "attempts_per_minute": round(attempts / elapsed_minutes, 2),
+                "finished_per_minute": round(finished / elapsed_minutes, 2),
+                "active_calls": counts.get("in_progress", 0) + counts.get("dialing", 0)
+            }
+        }
+
+    def list_numbers(self, campaign_id: str, status: Optional[str] = None, limit: int = 100, offset: int = 0) -> List[dict]:
+        """Per-number state, optionally filtered by status"""
+        query = "SELECT * FROM campaign_numbers WHERE campaign_id = ?"
+        params = [campaign_id]
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        query += " ORDER BY phone_number LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._connect() as conn:
+            return [dict(row) for row in conn.execute(query, params).fetchall()]
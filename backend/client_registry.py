@@ -0,0 +1,150 @@
+# Client Registry
+# Provider SDK clients imported and constructed on first use, shared process-wide, with timing and warm-up
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List
+
+logger = logging.getLogger(__name__)
+
+
+def _groq():
+    from groq import Groq
+    return Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+
+def _groq_async():
+    from groq import AsyncGroq
+    return AsyncGroq(api_key=os.getenv("GROQ_API_KEY"))
+
+
+def _openai():
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+
+def _anthropic():
+    import anthropic
+    return anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+
+def _gemini():
+    import google.generativeai as genai
+    genai.configure(api_key=os.getenv("GOOGLE_GEMINI_API_KEY"))
+    return genai.GenerativeModel("gemini-pro")
+
+
+def _google_speech():
+    from google.cloud import speech_v1
+    return speech_v1.SpeechClient()
+
+
+def _google_tts():
+    from google.cloud import texttospeech
+    return texttospeech.TextToSpeechClient()
+
+
+def _azure_speech():
+    # Recognizers are configured per request, so the shared "client" is the SDK module itself
+    import azure.cognitiveservices.speech as speechsdk
+    return speechsdk
+
+
+def _firestore():
+    import firebase_admin
+    from firebase_admin import firestore
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app()
+    return firestore.client()
+
+
+def _firestore_async():
+    import firebase_admin
+    from firebase_admin import firestore_async
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app()
+    return firestore_async.client()
+
+
+_FACTORIES: Dict[str, Callable[[], Any]] = {
+    "groq": _groq,
+    "groq_async": _groq_async,
+    "openai": _openai,
+    "anthropic": _anthropic,
+    "gemini": _gemini,
+    "google_speech": _google_speech,
+    "google_tts": _google_tts,
+    "azure_speech": _azure_speech,
+    "firestore": _firestore,
+    "firestore_async": _firestore_async,
+}
+
+# Provider prefixes per pipeline stage (matching the services' model dispatch) -> SDK client
+PROVIDER_CLIENTS = {
+    "llm_provider": {"groq": "groq", "openai": "openai", "anthropic": "anthropic", "gemini": "gemini"},
+    "stt_provider": {"google": "google_speech", "openai": "openai", "azure": "azure_speech", "groq": "groq"},
+    "tts_provider": {"google": "google_tts"},
+}
+
+_clients: Dict[str, Any] = {}
+_build_ms: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def register(name: str, factory: Callable[[], Any]):
+    """Add or replace a client factory"""
+    _FACTORIES[name] = factory
+    _clients.pop(name, None)
+
+
+def get_client(name: str) -> Any:
+    """Shared client for a provider, importing its SDK and constructing it on first use"""
+    client = _clients.get(name)
+    if client is not None:
+        return client
+    with _lock:
+        if name not in _clients:
+            started = time.perf_counter()
+            _clients[name] = _FACTORIES[name]()
+            _build_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(f"Loaded {name} client in {_build_ms[name]} ms")
+    return _clients[name]
+
+
+def loaded_clients() -> Dict[str, float]:
+    """Clients built so far with their import + construction time in ms"""
+    return dict(_build_ms)
+
+
+def clients_for_agents(agents: Iterable[dict]) -> List[str]:
+    """SDK clients referenced by agents' llm/stt/tts providers (HTTP-only providers need none)"""
+    needed = []
+    for agent in agents:
+        for key, prefixes in PROVIDER_CLIENTS.items():
+            provider = agent.get(key) or ""
+            for prefix, client in prefixes.items():
+                if provider.startswith(prefix) and client not in needed:
+                    needed.append(client)
+    return needed
+
+
+async def warm_up(names: Iterable[str]) -> Dict[str, Any]:
+    """Build clients in worker threads, concurrently; failures are logged and reported, not raised"""
+    names = [name for name in dict.fromkeys(names) if name in _FACTORIES]
+
+    async def build(name: str):
+        try:
+            await asyncio.to_thread(get_client, name)
+            return name, _build_ms.get(name)
+        except Exception as e:
+            logger.error(f"Warm-up of {name} client failed: {e}")
+            return name, f"error: {e}"
+
+    return dict(await asyncio.gather(*(build(name) for name in names)))
@@ -106,6 +106,22 @@ LLM_PROVIDERS = {
     }
 }
 
+# Latency priors for routing between LLM_PROVIDERS models ("provider:model"); live measurements replace them.
+# ttft_ms: time to first token for a short prompt; prefill_ms_per_1k: extra TTFT per 1k prompt tokens;
+# concurrency: in-flight requests before the provider starts queueing; quality: higher is better;
+# api_model: the provider's API identifier when it differs from the catalogue name.
+LLM_MODEL_PROFILES = {
+    "groq:llama2-13b-chat": {"ttft_ms": 150, "tokens_per_second": 500, "prefill_ms_per_1k": 10, "concurrency": 50, "quality": 1},
+    "groq:mixtral-8x7b-32768": {"ttft_ms": 220, "tokens_per_second": 450, "prefill_ms_per_1k": 20, "concurrency": 50, "quality": 2},
+    "groq:llama2-70b-4096": {"ttft_ms": 300, "tokens_per_second": 280, "prefill_ms_per_1k": 30, "concurrency": 30, "quality": 3},
+    "mistral:mistral-7b": {"ttft_ms": 300, "tokens_per_second": 120, "prefill_ms_per_1k": 60, "concurrency": 20, "quality": 1, "api_model": "open-mistral-7b"},
+    "openai:gpt-3.5-turbo": {"ttft_ms": 450, "tokens_per_second": 90, "prefill_ms_per_1k": 60, "concurrency": 50, "quality": 3},
+    "openai:gpt-4": {"ttft_ms": 900, "tokens_per_second": 35, "prefill_ms_per_1k": 150, "concurrency": 20, "quality": 5},
+    "anthropic:claude-3-sonnet": {"ttft_ms": 700, "tokens_per_second": 60, "prefill_ms_per_1k": 100, "concurrency": 20, "quality": 4, "api_model": "claude-3-sonnet-20240229"},
+    "anthropic:claude-3-opus": {"ttft_ms": 1300, "tokens_per_second": 25, "prefill_ms_per_1k": 200, "concurrency": 10, "quality": 5, "api_model": "claude-3-opus-20240229"},
+    "grok:grok-4": {"ttft_ms": 900, "tokens_per_second": 50, "prefill_ms_per_1k": 120, "concurrency": 20, "quality": 5},
+}
+
 # TTS Provider Configuration
 TTS_PROVIDERS = {
     "replicate_xtts": {
@@ -0,0 +1,177 @@
+# Firestore Repository
+# Non-blocking data access for agents and the voice library: async client, projections, pagination, batched writes
+
+import logging
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from client_registry import get_client
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Firestore caps a write batch at 500 operations
+MAX_BATCH_WRITES = 500
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Fields the voice loop needs from an agent document
+SESSION_AGENT_FIELDS = [
+    "id", "system_instruction", "primary_language", "supported_languages", "stt_provider",
+    "llm_provider", "tts_provider", "speculative_mode", "speculative_confidence_threshold",
+    "speculative_cost_cap", "few_shot_examples", "version", "updated_at", "latency_slo_ms",
+    "turn_budget_ms", "llm_models", "max_tokens",
+]
+AGENT_PROVIDER_FIELDS = ["llm_provider", "stt_provider", "tts_provider"]
+
+
+def _page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE))
+
+
+class FirestoreRepository:
+    """Agents and voices in Firestore through the async client - handlers never block the event loop
+
+    Honors FIRESTORE_EMULATOR_HOST, so local runs can point at the Firestore emulator.
+    """
+
+    def __init__(self, client=None):
+        self._client = client
+        # Sessions of one agent starting together (a campaign) share one document read
+        self.agent_flight = SingleFlight("agent_reads")
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client("firestore_async")
+        return self._client
+
+    async def get(self, collection: str, doc_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        """One document, optionally projected to `fields`; None if it does not exist"""
+        snapshot = await self.client.collection(collection).document(doc_id).get(field_paths=fields)
+        return snapshot.to_dict() if snapshot.exists else None
+
+    async def set(self, collection: str, doc_id: str, data: dict):
+        await self.client.collection(collection).document(doc_id).set(data)
+
+    async def query(
+        self,
+        collection: str,
+        filters: Iterable[Tuple[str, str, object]] = (),
+        fields: Optional[List[str]] = None,
+        limit: Optional[int] = None,
+        page_token: Optional[str] = None
+    ) -> Tuple[List[dict], Optional[str]]:
+        """One page of matching documents and the token for the next page (None on the last page)
+
+        Pages are ordered by document id, so equality filters need no composite index.
+        """
+        size = _page_size(limit)
+        ref = self.client.collection(collection)
+        query = ref
+        for field, op, value in filters:
+            query = query.where(field, op, value)
+        if fields:
+            query = query.select(fields)
+        query = query.order_by("__name__")
+        if page_token:
+            query = query.start_after({"__name__": ref.document(page_token)})
+        # Fetch one extra document to know whether another page exists
+        snapshots = [snapshot async for snapshot in query.limit(size + 1).stream()]
+        next_token = snapshots[size - 1].id if len(snapshots) > size else None
+        return [snapshot.to_dict() for snapshot in snapshots[:size]], next_token
+
+    async def set_many(self, collection: str, docs: Dict[str, dict]) -> int:
+        """Write many documents in as few round-trips as possible (chunks of MAX_BATCH_WRITES)"""
+        items = list(docs.items())
+        ref = self.client.collection(collection)
+        for start in range(0, len(items), MAX_BATCH_WRITES):
+            batch = self.client.batch()
+            for doc_id, data in items[start:start + MAX_BATCH_WRITES]:
+                batch.set(ref.document(doc_id), data)
+            await batch.commit()
+        return len(items)
+
+    # Agents and voices
+
+    async def create_agent(self, agent: dict):
+        await self.set("agents", agent["id"], agent)
+
+    async def create_agents(self, agents: List[dict]) -> int:
+        return await self.set_many("agents", {agent["id"]: agent for agent in agents})
+
+    async def get_agent(self, agent_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        """The agent document; concurrent identical reads share one call (treat the result as read-only)"""
+        key = (agent_id, tuple(fields) if fields else None)
+        return await self.agent_flight.do(key, lambda: self.get("agents", agent_id, fields))
+
+    async def list_agents(self, user_id: str, fields: Optional[List[str]] = None,
+                          limit: Optional[int] = None, page_token: Optional[str] = None):
+        return await self.query("agents", [("user_id", "==", user_id)], fields, limit, page_token)
+
+    async def agent_providers(self, limit: int) -> List[dict]:
+        """Provider fields of up to `limit` agents (for client warm-up)"""
+        agents, _ = await self.query("agents", fields=AGENT_PROVIDER_FIELDS, limit=limit)
+        return agents
+
+    async def add_voice(self, voice: dict):
+        await self.set("voice_library", voice["voice_id"], voice)
+
+    async def list_voices(self, user_id: str, fields: Optional[List[str]] = None,
+                          limit: Optional[int] = None, page_token: Optional[str] = None):
+        return await self.query("voice_library", [("user_id", "==", user_id)], fields, limit, page_token)
+
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+}
+
+
+class InMemoryRepository(FirestoreRepository):
+    """Dict-backed stand-in with the same interface, for tests and offline development"""
+
+    def __init__(self):
+        super().__init__(client=None)
+        self._collections: Dict[str, Dict[str, dict]] = {}
+
+    @staticmethod
+    def _project(data: dict, fields: Optional[List[str]]) -> dict:
+        return {k: v for k, v in data.items() if k in fields} if fields else dict(data)
+
+    async def get(self, collection: str, doc_id: str, fields: Optional[List[str]] = None) -> Optional[dict]:
+        data = self._collections.get(collection, {}).get(doc_id)
+        return self._project(data, fields) if data is not None else None
+
+    async def set(self, collection: str, doc_id: str, data: dict):
+        self._collections.setdefault(collection, {})[doc_id] = dict(data)
+
+    async def query(self, collection, filters=(), fields=None, limit=None, page_token=None):
+        size = _page_size(limit)
+        docs = sorted(self._collections.get(collection, {}).items())
+        matches = [
+            (doc_id, data) for doc_id, data in docs
+            if (page_token is None or doc_id > page_token)
+            and all(_OPERATORS[op](data.get(field), value) for field, op, value in filters)
+        ]
+        next_token = matches[size - 1][0] if len(matches) > size else None
+        return [self._project(data, fields) for _, data in matches[:size]], next_token
+
+    async def set_many(self, collection: str, docs: Dict[str, dict]) -> int:
+        for doc_id, data in docs.items():
+            await self.set(collection, doc_id, data)
+        return len(docs)
+
+
+def create_repository() -> FirestoreRepository:
+    """FIRESTORE_BACKEND=memory selects the in-memory stand-in; otherwise Firestore (or its emulator)"""
+    if os.getenv("FIRESTORE_BACKEND", "firestore").lower() == "memory":
+        logger.info("Using in-memory Firestore stand-in")
+        return InMemoryRepository()
+    return FirestoreRepository()
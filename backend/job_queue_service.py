@@ -0,0 +1,198 @@
+# Job Queue Service
+# Persistent background job queue with a bounded worker pool, progress tracking and completion webhooks
+
+import asyncio
+import ipaddress
+import json
+import logging
+import socket
+import sqlite3
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# handler(payload, progress) -> result dict; progress(fraction, message) is awaitable
+JobHandler = Callable[[dict, Callable[[float, str], Awaitable[None]]], Awaitable[dict]]
+
+WEBHOOK_ATTEMPTS = 3
+# Workers also poll so jobs submitted by other processes are picked up
+POLL_SECONDS = 2
+
+
+def validate_webhook_url(url: str):
+    """Raise ValueError unless url is http(s) and every address its host resolves to is public"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("Webhook URL must be an http or https URL")
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+    except (socket.gaierror, UnicodeError, ValueError):
+        raise ValueError(f"Webhook host does not resolve: {parts.hostname}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if getattr(address, "ipv4_mapped", None):
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise ValueError(f"Webhook host is not a public address: {parts.hostname}")
+
+
+class JobQueue:
+    """SQLite-backed job queue; jobs survive restarts and are picked up by a fixed number of workers"""
+
+    def __init__(self, db_path: str = "/tmp/jobs.db", workers: int = 2):
+        self.db_path = db_path
+        self.workers = workers
+        self._handlers: Dict[str, JobHandler] = {}
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = []
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress REAL NOT NULL DEFAULT 0,
+                    message TEXT,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    webhook_url TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def register(self, kind: str, handler: JobHandler):
+        """Register the coroutine that runs jobs of a given kind"""
+        self._handlers[kind] = handler
+
+    async def start(self):
+        """Requeue jobs interrupted by a restart and start the workers"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', message = 'Requeued after restart' WHERE status = 'running'"
+            )
+        for i in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker(i)))
+        self._wakeup.set()
+
+    async def stop(self):
+        """Stop the workers; running jobs are requeued on next start"""
+        for task in self._worker_tasks:
+            task.cancel()
+        self._worker_tasks = []
+
+    def submit(self, kind: str, payload: dict, webhook_url: Optional[str] = None) -> dict:
+        """Queue a job and return its record (blocking: resolves the webhook host; call via to_thread)"""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for job kind: {kind}")
+        if webhook_url:
+            validate_webhook_url(webhook_url)
+        job_id = f"job_{uuid.uuid4().hex}"
+        now = datetime.utcnow().isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, payload, webhook_url, created_at, updated_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), webhook_url, now, now)
+            )
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Job status, progress and result"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job.pop("payload")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Atomically move the oldest queued job to running"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', updated_at = ? WHERE id = ?",
+                    (datetime.utcnow().isoformat(), row["id"])
+                )
+            return row
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = datetime.utcnow().isoformat()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    async def _worker(self, worker_id: int):
+        while True:
+            # Clear before claiming so a submit racing with an empty claim still wakes us
+            self._wakeup.clear()
+            row = await asyncio.to_thread(self._claim)
+            if row is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(row)
+
+    async def _run(self, row: sqlite3.Row):
+        job_id = row["id"]
+
+        async def progress(fraction: float, message: str):
+            await asyncio.to_thread(self._update, job_id, progress=round(fraction, 3), message=message)
+
+        try:
+            result = await self._handlers[row["kind"]](json.loads(row["payload"]), progress)
+            if result.get("success", True):
+                await asyncio.to_thread(
+                    self._update, job_id, status="succeeded", progress=1.0, message="Done", result=json.dumps(result)
+                )
+            else:
+                await asyncio.to_thread(
+                    self._update, job_id, status="failed", error=result.get("error", "Job failed"), result=json.dumps(result)
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {e}")
+            await asyncio.to_thread(self._update, job_id, status="failed", error=str(e))
+
+        if row["webhook_url"]:
+            await self._notify(row["webhook_url"], await asyncio.to_thread(self.get, job_id))
+
+    async def _notify(self, webhook_url: str, job: dict):
+        """POST the finished job to its webhook, retrying with backoff"""
+        # Re-checked at send time: the host may resolve differently than when the job was submitted
+        try:
+            await asyncio.to_thread(validate_webhook_url, webhook_url)
+        except ValueError as e:
+            logger.error(f"Webhook {webhook_url} rejected: {e}")
+            return
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            try:
+                async with httpx.AsyncClient(timeout=10) as client:
+                    response = await client.post(webhook_url, json=job)
+                if response.status_code < 500:
+                    return
+            except Exception as e:
+                logger.error(f"Webhook {webhook_url} error: {e}")
+            await asyncio.sleep(2 ** attempt)
@@ -0,0 +1,247 @@
+# Language Identification
+# Per-turn language detection for code-switching callers: provider-detected language when available,
+# otherwise a local script + character n-gram classifier over the transcript
+
+import logging
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Unicode blocks of Indic scripts (Latin is handled separately)
+SCRIPT_RANGES = [
+    (0x0900, 0x097F, "devanagari"),
+    (0x0980, 0x09FF, "bengali"),
+    (0x0A00, 0x0A7F, "gurmukhi"),
+    (0x0A80, 0x0AFF, "gujarati"),
+    (0x0B00, 0x0B7F, "oriya"),
+    (0x0B80, 0x0BFF, "tamil"),
+    (0x0C00, 0x0C7F, "telugu"),
+    (0x0C80, 0x0CFF, "kannada"),
+    (0x0D00, 0x0D7F, "malayalam"),
+]
+SCRIPT_LANGUAGES = {
+    "devanagari": ["hi", "mr"],
+    "bengali": ["bn"],
+    "gurmukhi": ["pa"],
+    "gujarati": ["gu"],
+    "oriya": ["or"],
+    "tamil": ["ta"],
+    "telugu": ["te"],
+    "kannada": ["kn"],
+    "malayalam": ["ml"],
+}
+
+# Seed vocabulary for the n-gram profiles: high-frequency function words and call-centre phrases.
+# Latin entries cover English and romanized Indic speech (Hinglish, Tanglish, ...).
+LATIN_SEEDS = {
+    "en": "the and is are was you what how can could i will would have has this that for with please thank thanks "
+          "yes no my your we it to of in on at help call order payment time want need know about do not hello sorry "
+          "okay sure right there here when where why which who account number problem check tell me",
+    "hi": "hai hain kya nahi nahin mein main aap aapka aapko mujhe mera meri kaise kaisa theek thik haan han ji bhai "
+          "kyun kyon kab kahan kuch bahut accha acha karna karo kar raha rahi hoga tha thi chahiye sakta sakte batao "
+          "bataiye paisa abhi phir lekin aur bhi toh ke ki ka se ko ye yeh woh wo hum humko dijiye kijiye samajh "
+          "apna apni apne hua hui gaya gayi diya liya wala wali",
+    "ta": "enna enaku ennaku illa illai irukku iruku irukken vanakkam romba nandri sollunga sollu panna pannunga "
+          "venum vendam epdi eppadi enga inga anga naan neenga unga ungal avan aval seri sari theriyum theriyala "
+          "konjam paakalam vaanga ponga aama aamam ille pa da di",
+    "te": "emi enti ledu undi unnaru nenu meeru mee naaku naku cheppandi cheppu cheyyandi kavali vaddu ela ekkada "
+          "ikkada akkada avunu kaadu chala bagundi dhanyavadalu andi garu entha",
+    "kn": "enu yenu illa ide nanu neevu nimma nanage nange heli maadi madi beku beda hege elli ivattu houdu alla "
+          "tumba chennagide dhanyavadagalu swalpa saar",
+    "ml": "enthu enthanu illa undu njan ningal ningalude enikku parayu parayoo cheyyu venam venda engane evide "
+          "sheri athe alla valare nanni kollam",
+    "bn": "ki kemon achen acho ami tumi apni amar tomar apnar bolun korun chai na haan hae kothay ekhon dhonnobad "
+          "bhalo ache nei kichu",
+    "gu": "shu che chhe nathi hu tame tamaru mane kaho karo joie joiye kem kya ha na aabhar saru chho",
+    "mr": "kay aahe ahe aahet nahi mi tumhi tumcha tumchi mala sanga kara pahije kasa kashi kuthe ho nako dhanyavad "
+          "chan mhanun",
+}
+NATIVE_SEEDS = {
+    "hi": "है हैं क्या नहीं में मैं आप आपका आपको मुझे मेरा मेरी कैसे ठीक हाँ जी क्यों कब कहाँ कुछ बहुत अच्छा करना "
+          "रहा रही होगा था थी चाहिए सकता सकते बताइए पैसा अभी फिर लेकिन और भी तो के की का से को यह वह हम दीजिए",
+    "mr": "आहे आहेत नाही काय मी तुम्ही तुमचा तुमची मला माझा माझी कसे कशी ठीक हो का कधी कुठे काही खूप चांगले "
+          "करायचे होते पाहिजे शकतो सांगा पैसे आता पण आणि तर चा ची चे ला ने हे ते आम्ही द्या",
+}
+
+# Whisper and other providers report full language names
+LANGUAGE_NAMES = {
+    "hindi": "hi", "tamil": "ta", "telugu": "te", "kannada": "kn", "malayalam": "ml", "bengali": "bn",
+    "gujarati": "gu", "marathi": "mr", "english": "en", "punjabi": "pa", "odia": "or", "oriya": "or",
+}
+
+DEFAULT_SWITCH_CONFIDENCE = 0.75
+MIN_WORDS_TO_SWITCH = 2
+CACHE_SIZE = 256
+
+
+def normalize_language(code: Optional[str]) -> Optional[str]:
+    """Base language code: 'hi-IN' -> 'hi', 'Hindi' -> 'hi'"""
+    if not code:
+        return None
+    code = code.strip().lower()
+    return LANGUAGE_NAMES.get(code, code.replace("_", "-").split("-")[0])
+
+
+def _trigrams(word: str) -> Iterable[str]:
+    padded = f" {word} "
+    return (padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[^\W\d_]+", text.lower())
+
+
+def _profiles(seeds: Dict[str, str], alpha: float = 0.5) -> Dict[str, Dict[str, float]]:
+    """Smoothed trigram log-probabilities per language; '' holds the unseen-trigram probability
+
+    Smoothing is over the vocabulary shared by all languages of a script, so a shorter seed list
+    does not make unseen trigrams look likelier.
+    """
+    counts = {language: Counter(gram for word in seed.split() for gram in _trigrams(word))
+              for language, seed in seeds.items()}
+    vocabulary = len(set().union(*counts.values()))
+    profiles = {}
+    for language, grams in counts.items():
+        total = sum(grams.values()) + alpha * vocabulary
+        profile = {gram: math.log((count + alpha) / total) for gram, count in grams.items()}
+        profile[""] = math.log(alpha / total)
+        profiles[language] = profile
+    return profiles
+
+
+_PROFILES = {"latin": _profiles(LATIN_SEEDS), "devanagari": _profiles(NATIVE_SEEDS)}
+
+
+def detect_script(text: str) -> Optional[str]:
+    """Dominant script of the letters in `text` (None if there are none)"""
+    counts = Counter()
+    for char in text:
+        point = ord(char)
+        if char.isascii():
+            if char.isalpha():
+                counts["latin"] += 1
+            continue
+        for start, end, script in SCRIPT_RANGES:
+            if start <= point <= end:
+                counts[script] += 1
+                break
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def classify(text: str, candidates: Optional[Iterable[str]] = None) -> Optional[dict]:
+    """Best guess {language, confidence, script, romanized} among `candidates` (base codes), or None"""
+    script = detect_script(text)
+    if script is None:
+        return None
+    allowed = set(candidates) if candidates is not None else None
+    if script == "latin":
+        options = list(LATIN_SEEDS)
+    else:
+        options = SCRIPT_LANGUAGES.get(script, [])
+    if allowed is not None:
+        options = [language for language in options if language in allowed]
+    if not options:
+        return None
+    romanized = script == "latin"
+
+    profiles = _PROFILES.get(script)
+    if len(options) == 1 or profiles is None:
+        # A script used by one candidate identifies the language by itself
+        return {"language": options[0], "confidence": 1.0 if len(options) == 1 else 1 / len(options),
+                "script": script, "romanized": romanized and options[0] != "en"}
+
+    grams = [gram for word in _words(text) for gram in _trigrams(word)]
+    if not grams:
+        return None
+    scores = {
+        language: sum(profiles[language].get(gram, profiles[language][""]) for gram in grams)
+        for language in options if language in profiles
+    }
+    if not scores:
+        return None
+    best = max(scores, key=scores.get)
+    # Posterior under a uniform prior
+    confidence = 1 / sum(math.exp(score - scores[best]) for score in scores.values())
+    return {"language": best, "confidence": round(confidence, 3), "script": script,
+            "romanized": romanized and best != "en"}
+
+
+class LanguageRouter:
+    """Per-session choice of response language among the agent's supported languages
+
+    Sticks with the current language unless a turn is confidently in another one, so short replies
+    ("ok", "haan") do not flip the conversation. Guesses are cached per normalized transcript.
+    """
+
+    def __init__(
+        self,
+        primary_language: str,
+        supported_languages: Optional[List[str]] = None,
+        switch_confidence: float = DEFAULT_SWITCH_CONFIDENCE
+    ):
+        # Keep the agent's own spelling of each code (e.g. "en-IN") for the providers
+        self.codes = {}
+        for code in [primary_language, *(supported_languages or [])]:
+            self.codes.setdefault(normalize_language(code), code)
+        self.current = primary_language
+        self.switch_confidence = switch_confidence
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self.stats = {"turns": 0, "switches": 0, "from_provider": 0, "cache_hits": 0}
+
+    @classmethod
+    def for_agent(cls, agent: dict) -> "LanguageRouter":
+        primary = agent.get("primary_language") or agent.get("language") or "hi"
+        return cls(primary, agent.get("supported_languages"))
+
+    @property
+    def multilingual(self) -> bool:
+        return len(self.codes) > 1
+
+    def stt_language(self) -> str:
+        """Language to request from batch STT: auto-detect when several are possible"""
+        return "auto" if self.multilingual else self.current
+
+    def choose(self, text: str, detected: Optional[str] = None) -> str:
+        """Response language for a transcript; `detected` is the STT provider's language, if reported"""
+        provider_language = self.codes.get(normalize_language(detected))
+        if provider_language is not None:
+            return provider_language
+        if not self.multilingual or not text:
+            return self.current
+
+        key = " ".join(_words(text))
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return self._cache[key]
+
+        guess = classify(text, self.codes)
+        language = self.current
+        if guess is not None and (guess["language"] == normalize_language(self.current) or (
+            guess["confidence"] >= self.switch_confidence and len(key.split()) >= MIN_WORDS_TO_SWITCH
+        )):
+            language = self.codes[guess["language"]]
+        self._cache[key] = language
+        if len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return language
+
+    def observe(self, language: str, from_provider: bool = False):
+        """Commit a turn's language as the conversation's current one"""
+        self.stats["turns"] += 1
+        if from_provider:
+            self.stats["from_provider"] += 1
+        if language != self.current:
+            self.stats["switches"] += 1
+            self.current = language
+            # Cached choices were made relative to the old language
+            self._cache.clear()
+
+    def route(self, text: str, detected: Optional[str] = None) -> str:
+        """choose() then observe(): the language of a completed transcript"""
+        language = self.choose(text, detected)
+        self.observe(language, from_provider=self.codes.get(normalize_language(detected)) is not None)
+        return language
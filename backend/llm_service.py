@@ -4,8 +4,12 @@ import httpx
 from typing import Optional, Dict
 from enum import Enum
 
+from client_registry import get_client
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_TOKENS = 500
+
 class LLMProvider(Enum):
     GROQ = "groq"
     OPENAI = "openai"
@@ -31,161 +35,222 @@ class LLMService:
         self.together_key = os.getenv("TOGETHER_API_KEY")
         self.hf_key = os.getenv("HUGGINGFACE_API_KEY")
     
-    async def generate(self, prompt: str, model: str = "groq-mixtral", language: str = "hi") -> Optional[str]:
-        """Generate text with fallback logic"""
+    async def generate(
+        self,
+        prompt: str,
+        model: str = "groq-mixtral",
+        language: str = "hi",
+        system_prompt: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        fallback: bool = True
+    ) -> Optional[str]:
+        """Generate text with fallback logic
+
+        `model` is a provider ("groq", "openai-gpt4") or "provider:model" to pick the provider's model
+        (e.g. "groq:llama2-13b-chat"). `system_prompt` (e.g. an agent's compiled prompt) replaces the
+        default "Respond in <language>" instruction; `max_tokens` caps the reply length. If the provider
+        fails, Groq answers instead unless `fallback` is False, in which case the result is None.
+        """
+        model_name = model.partition(":")[2] or None
         try:
             if model.startswith("groq"):
-                return await self._call_groq(prompt, language)
+                return await self._call_groq(prompt, language, system_prompt, model_name, max_tokens)
             elif model.startswith("openai"):
-                return await self._call_openai(prompt, language)
+                reply = await self._call_openai(prompt, language, system_prompt, model_name, max_tokens)
             elif model.startswith("anthropic"):
-                return await self._call_anthropic(prompt, language)
+                reply = await self._call_anthropic(prompt, language, system_prompt, model_name, max_tokens)
             elif model.startswith("gemini"):
-                return await self._call_gemini(prompt, language)
+                reply = await self._call_gemini(prompt, language, system_prompt, model_name, max_tokens)
             elif model.startswith("mistral"):
-                return await self._call_mistral(prompt, language)
+                reply = await self._call_mistral(prompt, language, system_prompt, model_name, max_tokens)
             elif model.startswith("grok"):
-                return await self._call_grok(prompt, language)
+                reply = await self._call_grok(prompt, language, system_prompt, model_name, max_tokens)
             elif model.startswith("deepseek"):
-                return await self._call_deepseek(prompt, language)
+                reply = await self._call_deepseek(prompt, language, system_prompt, model_name, max_tokens)
             elif model.startswith("sarvam"):
-                return await self._call_sarvam(prompt, language)
+                reply = await self._call_sarvam(prompt, language, system_prompt, model_name, max_tokens)
             else:
-                return await self._call_groq(prompt, language)
+                return await self._call_groq(prompt, language, system_prompt, max_tokens=max_tokens)
         except Exception as e:
-            logger.error(f"Error with {model}: {e}, falling back to Groq")
-            return await self._call_groq(prompt, language)
+            logger.error(f"Error with {model}: {e}")
+            reply = None
+        if reply is None and fallback:
+            logger.warning(f"{model} returned nothing, falling back to Groq")
+            return await self._call_groq(prompt, language, system_prompt, max_tokens=max_tokens)
+        return reply
     
-    async def _call_groq(self, prompt: str, language: str) -> Optional[str]:
+    @staticmethod
+    def _system(language: str, system_prompt: Optional[str]) -> str:
+        return system_prompt or f"Respond in {language}. Keep response concise."
+    
+    async def _call_groq(
+        self, prompt: str, language: str, system_prompt: Optional[str] = None,
+        model_name: Optional[str] = None, max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         try:
-            from groq import Groq
-            client = Groq(api_key=self.groq_key)
+            client = get_client("groq")
             response = client.chat.completions.create(
-                model="mixtral-8x7b-32768",
+                model=model_name or "mixtral-8x7b-32768",
                 messages=[
-                    {"role": "system", "content": f"Respond in {language}. Keep response concise."},
+                    {"role": "system", "content": self._system(language, system_prompt)},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=500
+                max_tokens=max_tokens or DEFAULT_MAX_TOKENS
             )
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Groq error: {e}")
             return None
     
-    async def _call_openai(self, prompt: str, language: str) -> Optional[str]:
+    async def _call_openai(
+        self, prompt: str, language: str, system_prompt: Optional[str] = None,
+        model_name: Optional[str] = None, max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.openai_key)
+            client = get_client("openai")
             response = client.chat.completions.create(
-                model="gpt-4-turbo",
+                model=model_name or "gpt-4-turbo",
                 messages=[
-                    {"role": "system", "content": f"Respond in {language}"},
+                    {"role": "system", "content": self._system(language, system_prompt)},
                     {"role": "user", "content": prompt}
                 ],
-                max_tokens=500
+                max_tokens=max_tokens or DEFAULT_MAX_TOKENS
             )
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"OpenAI error: {e}")
-            return await self._call_groq(prompt, language)
+            return None
     
-    async def _call_anthropic(self, prompt: str, language: str) -> Optional[str]:
+    async def _call_anthropic(
+        self, prompt: str, language: str, system_prompt: Optional[str] = None,
+        model_name: Optional[str] = None, max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         try:
-            import anthropic
-            client = anthropic.Anthropic(api_key=self.anthropic_key)
+            client = get_client("anthropic")
             response = client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=500,
-                messages=[{"role": "user", "content": f"Respond in {language}. {prompt}"}]
+                model=model_name or "claude-3-opus-20240229",
+                max_tokens=max_tokens or DEFAULT_MAX_TOKENS,
+                system=self._system(language, system_prompt),
+                messages=[{"role": "user", "content": prompt}]
             )
             return response.content[0].text
         except Exception as e:
             logger.error(f"Anthropic error: {e}")
-            return await self._call_groq(prompt, language)
+            return None
     
-    async def _call_gemini(self, prompt: str, language: str) -> Optional[str]:
+    async def _call_gemini(
+        self, prompt: str, language: str, system_prompt: Optional[str] = None,
+        model_name: Optional[str] = None, max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         try:
-            import google.generativeai as genai
-            genai.configure(api_key=self.gemini_key)
-            model = genai.GenerativeModel("gemini-pro")
-            response = model.generate_content(f"Respond in {language}. {prompt}")
+            model = get_client("gemini")
+            if model_name:
+                import google.generativeai as genai
+                model = genai.GenerativeModel(model_name)
+            response = model.generate_content(
+                f"{self._system(language, system_prompt)}\n\n{prompt}",
+                generation_config={"max_output_tokens": max_tokens or DEFAULT_MAX_TOKENS}
+            )
             return response.text
         except Exception as e:
             logger.error(f"Gemini error: {e}")
-            return await self._call_groq(prompt, language)
+            return None
     
-    async def _call_mistral(self, prompt: str, language: str) -> Optional[str]:
+    async def _call_mistral(
+        self, prompt: str, language: str, system_prompt: Optional[str] = None,
+        model_name: Optional[str] = None, max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.post(
                     "https://api.mistral.ai/v1/chat/completions",
                     headers={"Authorization": f"Bearer {self.mistral_key}"},
                     json={
-                        "model": "mistral-large",
-                        "messages": [{"role": "user", "content": f"Respond in {language}. {prompt}"}],
-                        "max_tokens": 500
+                        "model": model_name or "mistral-large",
+                        "messages": [
+                            {"role": "system", "content": self._system(language, system_prompt)},
+                            {"role": "user", "content": prompt}
+                        ],
+                        "max_tokens": max_tokens or DEFAULT_MAX_TOKENS
                     }
                 )
                 data = response.json()
                 return data["choices"][0]["message"]["content"]
         except Exception as e:
             logger.error(f"Mistral error: {e}")
-            return await self._call_groq(prompt, language)
+            return None
     
-    async def _call_grok(self, prompt: str, language: str) -> Optional[str]:
+    async def _call_grok(
+        self, prompt: str, language: str, system_prompt: Optional[str] = None,
+        model_name: Optional[str] = None, max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.post(
                     "https://api.x.ai/v1/chat/completions",
                     headers={"Authorization": f"Bearer {self.grok_key}"},
                     json={
-                        "model": "grok-4",
-                        "messages": [{"role": "user", "content": f"Respond in {language}. {prompt}"}],
-                        "max_tokens": 500
+                        "model": model_name or "grok-4",
+                        "messages": [
+                            {"role": "system", "content": self._system(language, system_prompt)},
+                            {"role": "user", "content": prompt}
+                        ],
+                        "max_tokens": max_tokens or DEFAULT_MAX_TOKENS
                     }
                 )
                 data = response.json()
                 return data["choices"][0]["message"]["content"]
         except Exception as e:
             logger.error(f"Grok error: {e}")
-            return await self._call_groq(prompt, language)
+            return None
     
-    async def _call_deepseek(self, prompt: str, language: str) -> Optional[str]:
+    async def _call_deepseek(
+        self, prompt: str, language: str, system_prompt: Optional[str] = None,
+        model_name: Optional[str] = None, max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.post(
                     "https://api.deepseek.com/v1/chat/completions",
                     headers={"Authorization": f"Bearer {self.deepseek_key}"},
                     json={
-                        "model": "deepseek-chat",
-                        "messages": [{"role": "user", "content": f"Respond in {language}. {prompt}"}],
-                        "max_tokens": 500
+                        "model": model_name or "deepseek-chat",
+                        "messages": [
+                            {"role": "system", "content": self._system(language, system_prompt)},
+                            {"role": "user", "content": prompt}
+                        ],
+                        "max_tokens": max_tokens or DEFAULT_MAX_TOKENS
                     }
                 )
                 data = response.json()
                 return data["choices"][0]["message"]["content"]
         except Exception as e:
             logger.error(f"Deepseek error: {e}")
-            return await self._call_groq(prompt, language)
+            return None
     
-    async def _call_sarvam(self, prompt: str, language: str) -> Optional[str]:
+    async def _call_sarvam(
+        self, prompt: str, language: str, system_prompt: Optional[str] = None,
+        model_name: Optional[str] = None, max_tokens: Optional[int] = None
+    ) -> Optional[str]:
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.post(
                     "https://api.sarvam.ai/chat",
                     headers={"Authorization": f"Bearer {self.sarvam_key}"},
                     json={
-                        "model": "sarvam-1",
-                        "messages": [{"role": "user", "content": f"Respond in {language}. {prompt}"}],
-                        "max_tokens": 500
+                        "model": model_name or "sarvam-1",
+                        "messages": [
+                            {"role": "system", "content": self._system(language, system_prompt)},
+                            {"role": "user", "content": prompt}
+                        ],
+                        "max_tokens": max_tokens or DEFAULT_MAX_TOKENS
                     }
                 )
                 data = response.json()
                 return data["choices"][0]["message"]["content"]
         except Exception as e:
             logger.error(f"Sarvam error: {e}")
-            return await self._call_groq(prompt, language)
+            return None
     
     def get_available_models(self) -> list:
         return [
@@ -1,32 +1,61 @@
-from fastapi import FastAPI, WebSocket, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, WebSocket, File, UploadFile, HTTPException, Form, Request, Body
 from fastapi.middleware.cors import CORSMiddleware
-import firebase_admin
-from firebase_admin import firestore, storage as fb_storage, credentials
-from groq import Groq
 import httpx
 import json
 import os
 import asyncio
+import time
+import uuid
 from datetime import datetime, timedelta
 import base64
-from typing import Dict, List
+from typing import Dict, List, Optional
 import logging
 
+from voice_session import VoiceSession
+from speculative_llm import SpeculativeResponder
+from streaming_stt_service import open_streaming_session
+from tts_service import stream_audio_url
+from audio_codec import StreamTranscoder
+from outbound_audio import AUDIO_FORMATS, AudioFramer
+from serialization import FastJSONResponse, send_message
+from ws_messages import parse_client_message, describe_errors
+from client_registry import get_client, loaded_clients, clients_for_agents, warm_up
+from state_backend import NODE_ID, SessionRegistry, create_state_backend
+from firestore_repository import SESSION_AGENT_FIELDS, create_repository
+from turn_log_service import TurnLog, turn_record
+from analytics_service import AnalyticsService
+from language_id import LanguageRouter
+from prompt_compiler import PromptCompiler, count_tokens
+from model_router import ModelRouter
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Init Firebase
-try:
-    if not firebase_admin.get_app():
-        firebase_admin.initialize_app()
-except ValueError:
-    pass
+# Async Firestore access (FIRESTORE_BACKEND=memory for an in-memory stand-in)
+repo = create_repository()
+# Call history, written behind the call path
+turn_log = TurnLog(os.getenv("TURN_LOG_DIR", "/tmp/turn_log"))
+# Usage rollups, fed as turns are logged
+analytics = AnalyticsService(os.getenv("ANALYTICS_DB_PATH", "/tmp/analytics.db"))
+turn_log.subscribe(analytics.record)
+# System prompts compiled once per agent revision and language
+prompt_compiler = PromptCompiler()
+# Per-turn model choice for agents with a latency SLO
+model_router = ModelRouter()
+# Voice sessions on this worker, and the largest outbound audio buffer of finished ones
+live_sessions: Dict[str, VoiceSession] = {}
+_audio_memory = {"sessions": 0, "peak_queued_bytes": 0}
+
+
+def upload_to_storage(path: str, contents: bytes, content_type: Optional[str]):
+    """Blocking Cloud Storage upload - call through asyncio.to_thread"""
+    from firebase_admin import storage as fb_storage
+    get_client("firestore_async")  # initialises the Firebase app
+    fb_storage.bucket().blob(path).upload_from_string(contents, content_type=content_type)
 
-db = firestore.client()
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
 
-app = FastAPI(title="Indian Voice Agent Builder")
+app = FastAPI(title="Indian Voice Agent Builder", default_response_class=FastJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -37,9 +66,26 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Agents and voices already live in Firestore; the state backend tracks which worker owns each live session
+sessions = SessionRegistry(create_state_backend())
+AFFINITY_COOKIE = os.getenv("AFFINITY_COOKIE", "va_node")
+
+
+@app.middleware("http")
+async def add_node_affinity(request: Request, call_next):
+    """Name the serving worker so load balancers can keep a client's traffic on it"""
+    response = await call_next(request)
+    response.headers["X-Served-By"] = NODE_ID
+    if request.cookies.get(AFFINITY_COOKIE) != NODE_ID:
+        response.set_cookie(AFFINITY_COOKIE, NODE_ID, httponly=True, samesite="lax")
+    return response
+
 REPLICATE_API_KEY = os.getenv("REPLICATE_API_KEY")
 REPLICATE_API = "https://api.replicate.com/v1"
 
+# Keeps fire-and-forget tasks (e.g. prediction cancels) alive until they finish
+_background_tasks = set()
+
 INDIAN_LANGUAGES = {
     "hi": {"name": "Hindi", "code": "hi-IN"},
     "ta": {"name": "Tamil", "code": "ta-IN"},
@@ -59,6 +105,142 @@ async def health_check():
     return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
 
 
+# Provider clients are built on first use; warm-up preloads the ones this deployment needs
+_warm_up = {"ready": False, "clients": {}, "duration_ms": None}
+WARM_UP_AGENT_SCAN = int(os.getenv("WARM_UP_AGENT_SCAN", "500"))
+
+
+async def _run_warm_up():
+    started = time.perf_counter()
+    # Groq is always used; the agent scan itself brings up the Firestore client on the event loop
+    names = ["groq_async"]
+    try:
+        names += clients_for_agents(await repo.agent_providers(WARM_UP_AGENT_SCAN))
+    except Exception as e:
+        logger.error(f"Warm-up agent scan error: {e}")
+    _warm_up["clients"] = await warm_up(names)
+    _warm_up["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _warm_up["ready"] = True
+    logger.info(f"Warm-up finished in {_warm_up['duration_ms']} ms: {_warm_up['clients']}")
+
+
+@app.on_event("startup")
+async def startup():
+    """Serve immediately; preload provider clients in the background"""
+    await turn_log.start()
+    await analytics.start()
+    task = asyncio.create_task(_run_warm_up())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await turn_log.stop()
+    await analytics.stop()
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until provider clients are warmed up"""
+    body = {**_warm_up, "loaded": loaded_clients()}
+    return FastJSONResponse(body, status_code=200 if _warm_up["ready"] else 503)
+
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Which worker owns a live voice session"""
+    session = await asyncio.to_thread(sessions.get, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+@app.get("/api/sessions/{session_id}/turns")
+async def get_session_turns(session_id: str, limit: int = 200):
+    """Conversation history of one session, oldest turn first"""
+    turns = await turn_log.query(session_id=session_id, limit=limit)
+    return {"session_id": session_id, "turns": turns[::-1], "count": len(turns)}
+
+
+@app.get("/api/turns")
+async def list_turns(
+    agent_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = 100
+):
+    """Logged turns, newest first, by agent and ISO date range (e.g. date_from=2024-05-01&date_to=2024-05-07)"""
+    turns = await turn_log.query(agent_id=agent_id, date_from=date_from, date_to=date_to, limit=limit)
+    return {"turns": turns, "count": len(turns), "log": turn_log.stats()}
+
+
+@app.get("/api/analytics/summary")
+async def analytics_summary(
+    resolution: str = "hour",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    buckets: int = 24,
+    agent_id: Optional[str] = None
+):
+    """Turn totals, outcomes and latency percentiles over a range (default: last 24 hours)"""
+    try:
+        return await analytics.summary(resolution, date_from, date_to, buckets, agent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/analytics/timeseries")
+async def analytics_timeseries(
+    resolution: str = "hour",
+    dimension: str = "all",
+    value: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    buckets: int = 24
+):
+    """Per-minute/hour/day turn counts and latency percentiles, e.g. dimension=agent&value=<agent_id>"""
+    try:
+        return await analytics.timeseries(resolution, dimension, value, date_from, date_to, buckets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/analytics/breakdown")
+async def analytics_breakdown(
+    dimension: str = "agent",
+    resolution: str = "day",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    buckets: int = 7
+):
+    """Totals per agent, language or provider (language_llm_provider gives the provider mix by language)"""
+    try:
+        return await analytics.breakdown(dimension, resolution, date_from, date_to, buckets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/llm/router")
+async def llm_router_stats():
+    """Live latency estimates the model router is using, per model"""
+    return {"models": model_router.stats()}
+
+
+@app.get("/api/audio/memory")
+async def audio_memory_stats():
+    """Outbound audio buffered per live voice session (bytes held beyond what the socket has sent)"""
+    live = {session_id: session.outbound.stats() for session_id, session in live_sessions.items()}
+    return {
+        "sessions": live,
+        "queued_bytes": sum(stats["queued_bytes"] for stats in live.values()),
+        "peak_queued_bytes": max(
+            [_audio_memory["peak_queued_bytes"], *(stats["peak_queued_bytes"] for stats in live.values())]
+        ),
+        "finished_sessions": _audio_memory["sessions"]
+    }
+
+
 @app.get("/api/languages")
 async def get_supported_languages():
     """Get list of supported Indian languages"""
@@ -76,8 +258,18 @@ async def create_agent(
     primary_language: str = Form(default="hi"),
     supported_languages: List[str] = Form(default=["hi", "en"]),
     user_id: str = Form(...),
+    stt_provider: str = Form(default="replicate_whisper"),
+    speculative_mode: bool = Form(default=False),
+    speculative_confidence_threshold: float = Form(default=0.85),
+    speculative_cost_cap: int = Form(default=2000),
+    latency_slo_ms: Optional[int] = Form(default=None),
+    turn_budget_ms: Optional[int] = Form(default=None),
+    llm_models: Optional[List[str]] = Form(default=None),
 ):
     """Create a new voice agent"""
+    unknown_models = [model for model in llm_models or [] if model not in model_router.profiles]
+    if unknown_models:
+        raise HTTPException(status_code=400, detail=f"Unknown llm_models: {', '.join(unknown_models)}")
     try:
         agent_id = f"agent_{int(datetime.utcnow().timestamp())}_{os.urandom(4).hex()}"
         
@@ -90,10 +282,18 @@ async def create_agent(
             "supported_languages": supported_languages,
             "created_at": datetime.utcnow().isoformat(),
             "user_id": user_id,
+            "stt_provider": stt_provider,
+            "speculative_mode": speculative_mode,
+            "speculative_confidence_threshold": speculative_confidence_threshold,
+            "speculative_cost_cap": speculative_cost_cap,
+            # Time-to-first-token target and whole-turn budget; the router picks among llm_models to meet them
+            "latency_slo_ms": latency_slo_ms,
+            "turn_budget_ms": turn_budget_ms,
+            "llm_models": llm_models,
             "status": "active"
         }
         
-        db.collection("agents").document(agent_id).set(agent_data)
+        await repo.create_agent(agent_data)
         
         logger.info(f"Agent created: {agent_id}")
         return {
@@ -107,25 +307,48 @@ async def create_agent(
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@app.post("/api/agents/import")
+async def import_agents(user_id: str, agents: List[Dict] = Body(...)):
+    """Create many agents at once with batched writes"""
+    now = datetime.utcnow().isoformat()
+    records = [
+        {
+            "primary_language": "hi",
+            "supported_languages": ["hi", "en"],
+            "status": "active",
+            **agent,
+            "id": agent.get("id") or f"agent_{int(datetime.utcnow().timestamp())}_{os.urandom(4).hex()}",
+            "user_id": user_id,
+            "created_at": agent.get("created_at") or now,
+        }
+        for agent in agents
+    ]
+    try:
+        written = await repo.create_agents(records)
+    except Exception as e:
+        logger.error(f"Error importing agents: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "count": written, "agent_ids": [record["id"] for record in records]}
+
+
 @app.get("/api/agents/{agent_id}")
 async def get_agent(agent_id: str):
     """Get agent details"""
     try:
-        agent_doc = db.collection("agents").document(agent_id).get()
-        if not agent_doc.exists:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        return {"success": True, "agent": agent_doc.to_dict()}
+        agent = await repo.get_agent(agent_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return {"success": True, "agent": agent}
 
 
 @app.get("/api/agents")
-async def list_agents(user_id: str):
-    """List all agents for a user"""
+async def list_agents(user_id: str, limit: int = 50, page_token: Optional[str] = None):
+    """List a user's agents, one page at a time"""
     try:
-        agents_ref = db.collection("agents").where("user_id", "==", user_id).stream()
-        agents = [doc.to_dict() for doc in agents_ref]
-        return {"success": True, "agents": agents, "count": len(agents)}
+        agents, next_page_token = await repo.list_agents(user_id, limit=limit, page_token=page_token)
+        return {"success": True, "agents": agents, "count": len(agents), "next_page_token": next_page_token}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -137,13 +360,13 @@ async def clone_voice(user_id: str = Form(...), file: UploadFile = File(...)):
         contents = await file.read()
         
         # Store in Cloud Storage
-        bucket = fb_storage.bucket()
-        blob = bucket.blob(f"voice_clones/{user_id}/{file.filename}")
-        blob.upload_from_string(contents, content_type=file.content_type)
+        await asyncio.to_thread(
+            upload_to_storage, f"voice_clones/{user_id}/{file.filename}", contents, file.content_type
+        )
         
         # Store metadata
         voice_id = f"voice_{int(datetime.utcnow().timestamp())}_{os.urandom(4).hex()}"
-        db.collection("voice_library").document(voice_id).set({
+        await repo.add_voice({
             "voice_id": voice_id,
             "user_id": user_id,
             "voice_file": f"voice_clones/{user_id}/{file.filename}",
@@ -160,93 +383,295 @@ async def clone_voice(user_id: str = Form(...), file: UploadFile = File(...)):
 
 
 @app.get("/api/voice-library/{user_id}")
-async def get_voice_library(user_id: str):
-    """Get user's voice library"""
+async def get_voice_library(user_id: str, limit: int = 50, page_token: Optional[str] = None):
+    """Get user's voice library, one page at a time"""
     try:
-        voices_ref = db.collection("voice_library").where("user_id", "==", user_id).stream()
-        voices = [doc.to_dict() for doc in voices_ref]
-        return {"success": True, "voices": voices, "count": len(voices)}
+        voices, next_page_token = await repo.list_voices(user_id, limit=limit, page_token=page_token)
+        return {"success": True, "voices": voices, "count": len(voices), "next_page_token": next_page_token}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @app.websocket("/ws/voice-agent/{agent_id}")
-async def websocket_endpoint(websocket: WebSocket, agent_id: str):
-    """WebSocket endpoint for real-time voice conversations"""
+async def websocket_endpoint(websocket: WebSocket, agent_id: str, audio_format: str = "json"):
+    """WebSocket endpoint for real-time voice conversations
+
+    `audio_format=binary` sends agent audio as raw binary frames instead of base64 in JSON.
+    """
     await websocket.accept()
-    
+    if audio_format not in AUDIO_FORMATS:
+        await send_message(websocket, {"error": f"audio_format must be one of {', '.join(AUDIO_FORMATS)}"})
+        await websocket.close(code=1008)
+        return
+    session_id = f"voice_{uuid.uuid4().hex}"
+    session = VoiceSession(websocket, agent_id, session_id, audio_format=audio_format)
+    live_sessions[session_id] = session
+    try:
+        async with sessions.hold(session_id, kind="voice", agent_id=agent_id):
+            await run_voice_session(websocket, session, agent_id, session_id)
+    finally:
+        del live_sessions[session_id]
+        _audio_memory["sessions"] += 1
+        _audio_memory["peak_queued_bytes"] = max(
+            _audio_memory["peak_queued_bytes"], session.outbound.peak_queued_bytes
+        )
+
+
+async def run_voice_session(websocket: WebSocket, session: VoiceSession, agent_id: str, session_id: str):
+    """Receive loop for one conversation"""
     try:
         # Get agent details
-        agent_doc = db.collection("agents").document(agent_id).get()
-        if not agent_doc.exists:
-            await websocket.send_json({"error": "Agent not found"})
+        agent = await repo.get_agent(agent_id, fields=SESSION_AGENT_FIELDS)
+        if agent is None:
+            await send_message(websocket, {"error": "Agent not found"})
             await websocket.close()
             return
         
-        agent = agent_doc.to_dict()
         lang = agent.get("primary_language", "hi")
+        # Callers may switch language mid-call; each turn's language is picked from the transcript
+        session.languages = LanguageRouter.for_agent(agent)
         
-        await websocket.send_json({"type": "ready", "message": "Agent ready for conversation"})
+        session.speculation = SpeculativeResponder.for_agent(
+            agent, lambda text, **routing: generate_response(agent, session.languages.choose(text), text, **routing)
+        )
+        session.start()
+        await session.send({
+            "type": "ready", "message": "Agent ready for conversation", "session_id": session_id, "node": NODE_ID
+        })
         
         while True:
-            data = await websocket.receive_json()
+            try:
+                message = parse_client_message(await websocket.receive_text())
+            except ValueError as e:
+                # Malformed JSON or a frame that does not match its schema (pydantic's ValidationError is a ValueError)
+                await session.send({"type": "error", "error": "Invalid message", "details": describe_errors(e)})
+                continue
+            msg_type = message.type
             
-            if data.get("type") == "audio":
-                audio_b64 = data.get("audio")
-                
-                try:
-                    # STT via Replicate Whisper
-                    stt_response = await call_replicate_async(
-                        model="openai/whisper",
-                        input={"audio": f"data:audio/wav;base64,{audio_b64}", "language": lang}
-                    )
-                    user_text = stt_response.get("transcription", "")
-                    
-                    if user_text:
-                        await websocket.send_json({"type": "transcription", "text": user_text})
-                        
-                        # LLM via Groq
-                        llm_response = groq_client.chat.completions.create(
-                            model="mixtral-8x7b-32768",
-                            messages=[
-                                {
-                                    "role": "system",
-                                    "content": f"{agent.get('system_instruction')} (Respond in {INDIAN_LANGUAGES[lang]['name']}, keep response under 50 words)"
-                                },
-                                {"role": "user", "content": user_text}
-                            ],
-                            max_tokens=100,
-                        )
-                        ai_response = llm_response.choices[0].message.content
-                        
-                        await websocket.send_json({"type": "ai_response", "text": ai_response})
-                        
-                        # TTS via Replicate XTTS-v2
-                        tts_response = await call_replicate_async(
-                            model="cjwbw/xtts_v2",
-                            input={
-                                "text": ai_response,
-                                "language": lang.split("-")[0]  # Use language code only
-                            }
+            if msg_type in ("interrupt", "speech_start"):
+                # Caller started talking over the agent (explicit or client-side VAD)
+                await session.interrupt(played_ms=message.played_ms)
+            elif msg_type == "partial_transcript":
+                await on_partial_transcript(
+                    session, message.text, message.confidence, message.stable, played_ms=message.played_ms
+                )
+            elif msg_type == "final_transcript":
+                await on_final_transcript(session, agent, message.text, played_ms=message.played_ms)
+            elif msg_type == "audio_frame":
+                # Raw audio frames (PCM16 16 kHz by default) for agents using a real-time STT provider
+                if session.stt_error is not None:
+                    continue
+                if session.stt_stream is None:
+                    try:
+                        session.frame_transcoder = StreamTranscoder(message.codec, message.sample_rate, "pcm16", 16000)
+                        session.stt_stream = await open_streaming_session(
+                            agent.get("stt_provider", "deepgram"), language=session.languages.stt_language()
                         )
-                        
-                        audio_url = tts_response.get("audio", tts_response.get("audio_url"))
-                        if audio_url:
-                            async with httpx.AsyncClient(timeout=60) as client:
-                                try:
-                                    audio_data = (await client.get(audio_url)).content
-                                    audio_b64_response = base64.b64encode(audio_data).decode()
-                                    await websocket.send_json({"type": "audio", "audio": audio_b64_response})
-                                except Exception as e:
-                                    logger.error(f"Error fetching audio: {str(e)}")
-                                    await websocket.send_json({"type": "error", "message": "Audio generation failed"})
-                except Exception as e:
-                    logger.error(f"Error in conversation: {str(e)}")
-                    await websocket.send_json({"type": "error", "message": str(e)})
+                    except Exception as e:
+                        # Unsupported provider or provider unreachable: keep the session, the client can
+                        # still send whole utterances as "audio" messages (batch STT)
+                        logger.error(f"Streaming STT unavailable for agent {agent_id}: {e}")
+                        session.stt_error = str(e)
+                        await session.send({
+                            "type": "error",
+                            "message": "Streaming speech recognition unavailable, send complete utterances as audio",
+                            "details": session.stt_error
+                        })
+                        continue
+                    session.stt_task = asyncio.create_task(consume_stt_stream(session, agent))
+                frame = session.frame_transcoder.process(base64.b64decode(message.audio))
+                await session.stt_stream.send_audio(bytes(frame))
+            elif msg_type == "audio":
+                # New user audio while the agent is still responding is a barge-in
+                await session.interrupt(played_ms=message.played_ms)
+                session.start_turn(run_turn(session, agent, audio_b64=message.audio))
     
     except Exception as e:
         logger.error(f"WebSocket error: {str(e)}")
         await websocket.close()
+    finally:
+        await session.close()
+
+
+async def on_partial_transcript(
+    session: VoiceSession,
+    text: str,
+    confidence: float,
+    stable: bool,
+    played_ms: Optional[int] = None
+):
+    """Interim transcript: the caller is speaking, so barge in and maybe speculate"""
+    await session.interrupt(played_ms=played_ms)
+    if session.speculation is not None:
+        session.speculation.on_partial(text, confidence=confidence, stable=stable)
+
+
+async def on_final_transcript(
+    session: VoiceSession,
+    agent: dict,
+    text: str,
+    played_ms: Optional[int] = None,
+    detected_language: Optional[str] = None
+):
+    """Final transcript of an utterance: start the response turn"""
+    await session.interrupt(played_ms=played_ms)
+    session.start_turn(run_turn(session, agent, user_text=text, detected_language=detected_language))
+
+
+async def consume_stt_stream(session: VoiceSession, agent: dict):
+    """Route interim and final transcripts from a streaming STT session"""
+    try:
+        async for event in session.stt_stream:
+            await session.send({
+                "type": "transcription" if event["is_final"] else "partial_transcription",
+                "text": event["text"]
+            })
+            if event["is_final"]:
+                await on_final_transcript(session, agent, event["text"], detected_language=event.get("language"))
+            else:
+                await on_partial_transcript(session, event["text"], event["confidence"], event["stable"])
+    except Exception as e:
+        logger.error(f"Streaming STT error: {str(e)}")
+        await session.send({"type": "error", "message": "Speech recognition failed"})
+
+
+async def run_turn(
+    session: VoiceSession,
+    agent: dict,
+    audio_b64: Optional[str] = None,
+    user_text: Optional[str] = None,
+    detected_language: Optional[str] = None
+):
+    """Run one STT -> LLM -> TTS turn; cancelled as a whole on barge-in"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    latency = {}
+    providers = {"stt": "replicate_whisper" if user_text is None else agent.get("stt_provider"),
+                 "llm": "groq-mixtral", "tts": "replicate_xtts"}
+    ai_response = ""
+    lang = session.languages.current
+    # Stays "interrupted" if the turn is cancelled by a barge-in
+    outcome = "interrupted"
+    try:
+        if user_text is None:
+            # STT via Replicate Whisper
+            stt_response = await call_replicate_async(
+                model="openai/whisper",
+                input={"audio": f"data:audio/wav;base64,{audio_b64}", "language": session.languages.stt_language()}
+            )
+            user_text = stt_response.get("transcription", "")
+            detected_language = stt_response.get("detected_language")
+            latency["stt"] = (loop.time() - started) * 1000
+        
+            if user_text:
+                await session.send({"type": "transcription", "text": user_text})
+        
+        if not user_text:
+            return
+        session.set_user_text(user_text)
+        # Respond (and speak) in the language the caller used this turn
+        lang = session.languages.route(user_text, detected_language)
+        
+        # LLM via Groq, reusing a speculative response when the final transcript matches
+        llm_started = loop.time()
+        route = {}
+        elapsed_ms = (llm_started - started) * 1000
+        if session.speculation is not None:
+            ai_response = await session.speculation.resolve(user_text, elapsed_ms=elapsed_ms, route=route)
+        else:
+            ai_response = await generate_response(agent, lang, user_text, elapsed_ms=elapsed_ms, route=route)
+        latency["llm"] = (loop.time() - llm_started) * 1000
+        providers["llm"] = route.get("key") or providers["llm"]
+        session.set_ai_text(ai_response)
+        
+        await session.send({"type": "ai_response", "text": ai_response, "language": lang})
+        
+        # TTS via Replicate XTTS-v2
+        tts_started = loop.time()
+        tts_response = await call_replicate_async(
+            model="cjwbw/xtts_v2",
+            input={
+                "text": ai_response,
+                "language": lang.split("-")[0]  # Use language code only
+            }
+        )
+        
+        audio_url = tts_response.get("audio", tts_response.get("audio_url"))
+        if audio_url:
+            try:
+                # Forward audio as it downloads, in fixed-duration frames paced to playback
+                # Frames are views into the downloaded chunks, base64-encoded only as they go out
+                framer = AudioFramer()
+                seq = 0
+                async for chunk in stream_audio_url(audio_url):
+                    if "tts_first_audio" not in latency:
+                        latency["tts_first_audio"] = (loop.time() - tts_started) * 1000
+                    for frame, duration_ms in framer.feed(chunk):
+                        await session.send_audio(frame, seq, duration_ms)
+                        seq += 1
+                for frame, duration_ms in framer.flush():
+                    await session.send_audio(frame, seq, duration_ms)
+                    seq += 1
+                await session.send({"type": "audio_end", "chunks": seq})
+            except Exception as e:
+                logger.error(f"Error fetching audio: {str(e)}")
+                await session.send({"type": "error", "message": "Audio generation failed"})
+        outcome = "completed"
+    except Exception as e:
+        outcome = "error"
+        logger.error(f"Error in conversation: {str(e)}")
+        await session.send({"type": "error", "message": str(e)})
+    finally:
+        # Runs on barge-in cancellation too; logging is a memory append
+        if user_text:
+            latency["total"] = (loop.time() - started) * 1000
+            turn_log.append(turn_record(
+                agent_id=session.agent_id, session_id=session.session_id, user_text=user_text,
+                ai_text=ai_response, language=lang, providers=providers, latency_ms=latency,
+                outcome=outcome, speculative=session.speculation is not None
+            ))
+
+
+async def generate_response(
+    agent: dict,
+    lang: str,
+    user_text: str,
+    elapsed_ms: float = 0.0,
+    route: Optional[dict] = None
+) -> str:
+    """Generate the agent's reply via Groq (streamed so cancellation stops generation)
+
+    Agents with a latency SLO get a model and output cap picked per call; `route` receives that choice.
+    """
+    system_prompt = prompt_compiler.compile(agent, lang, channel="web")
+    prompt_tokens = system_prompt["tokens"] + count_tokens(user_text)
+    # Only the Groq client is wired into this loop
+    choice = model_router.select(agent, prompt_tokens, elapsed_ms, providers=["groq"], default_max_tokens=100)
+    if route is not None:
+        route.update(choice)
+    loop = asyncio.get_running_loop()
+    with model_router.track(choice["key"], prompt_tokens) as observation:
+        started = loop.time()
+        stream = await get_client("groq_async").chat.completions.create(
+            model=choice["model"].partition(":")[2] if choice["model"] else "mixtral-8x7b-32768",
+            messages=[
+                {"role": "system", "content": system_prompt["text"]},
+                {"role": "user", "content": user_text}
+            ],
+            max_tokens=choice["max_tokens"],
+            stream=True,
+        )
+        ai_response = ""
+        try:
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content or ""
+                if delta and "ttft_ms" not in observation:
+                    observation["ttft_ms"] = (loop.time() - started) * 1000
+                ai_response += delta
+        finally:
+            await stream.response.aclose()
+        observation["output_tokens"] = count_tokens(ai_response)
+    return ai_response
 
 
 async def call_replicate_async(model: str, input: dict):
@@ -268,20 +693,27 @@ async def call_replicate_async(model: str, input: dict):
             pred_id = response.json().get("id")
             
             # Poll for result
-            for attempt in range(120):  # 2 minutes timeout
-                result = (await client.get(
-                    f"{REPLICATE_API}/predictions/{pred_id}",
-                    headers=headers
-                )).json()
-                
-                if result.get("status") == "succeeded":
-                    return result.get("output", {})
-                elif result.get("status") == "failed":
-                    error_msg = result.get("error", "Unknown error")
-                    logger.error(f"Replicate prediction failed: {error_msg}")
-                    return {"error": error_msg}
-                
-                await asyncio.sleep(1)
+            try:
+                for attempt in range(120):  # 2 minutes timeout
+                    result = (await client.get(
+                        f"{REPLICATE_API}/predictions/{pred_id}",
+                        headers=headers
+                    )).json()
+                    
+                    if result.get("status") == "succeeded":
+                        return result.get("output", {})
+                    elif result.get("status") == "failed":
+                        error_msg = result.get("error", "Unknown error")
+                        logger.error(f"Replicate prediction failed: {error_msg}")
+                        return {"error": error_msg}
+                    
+                    await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                # Turn was interrupted - stop paying for a prediction nobody will hear
+                task = asyncio.create_task(cancel_replicate_prediction(pred_id))
+                _background_tasks.add(task)
+                task.add_done_callback(_background_tasks.discard)
+                raise
             
             return {"error": "Request timeout"}
     except Exception as e:
@@ -289,6 +721,18 @@ async def call_replicate_async(model: str, input: dict):
         return {"error": str(e)}
 
 
+async def cancel_replicate_prediction(pred_id: str):
+    """Cancel a running Replicate prediction"""
+    try:
+        headers = {"Authorization": f"Token {REPLICATE_API_KEY}"}
+        async with httpx.AsyncClient(timeout=10) as client:
+            await client.post(f"{REPLICATE_API}/predictions/{pred_id}/cancel", headers=headers)
+    except Exception as e:
+        logger.error(f"Error cancelling Replicate prediction {pred_id}: {str(e)}")
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # WEB_CONCURRENCY > 1 runs several worker processes; sessions are tracked in the shared state backend
+    uvicorn.run("main:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")),
+                workers=int(os.getenv("WEB_CONCURRENCY", "1")))
@@ -1,11 +1,16 @@
 # Indian Voice Agent Builder - Main FastAPI Application
 # Comprehensive API endpoint for all voice agent services
 
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
+import asyncio
 import logging
-from typing import Optional, List
+import os
+import time
+import uuid
+from typing import AsyncIterator, Optional, List, Dict, Union
 
 # Import all service modules
 from llm_service import LLMService
@@ -15,6 +20,18 @@ from asr_service import ASRService
 from voice_cloning_service import VoiceCloningService
 from phone_integration_service import PhoneIntegrationService
 from agent_management_service import AgentManagementService
+from prompt_bank_service import PromptBankService
+from job_queue_service import JobQueue
+from campaign_service import CampaignService
+from media_bridge import MediaStreamBridge
+from serialization import FastJSONResponse, dumps_str, send_message
+from call_events_service import CallEventService, normalize_twilio, normalize_vapi, normalize_exotel
+from client_registry import loaded_clients, clients_for_agents, warm_up
+from state_backend import HOST_ID, NODE_ID, SessionRegistry, create_state_backend
+from turn_log_service import TurnLog
+from analytics_service import AnalyticsService
+from prompt_compiler import PromptCompiler
+from model_router import ModelRouter
 from config import (
     INDIAN_LANGUAGES,
     LLM_PROVIDERS,
@@ -30,7 +47,8 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Indian Voice Agent Builder API",
     description="Comprehensive API for creating and managing Indian voice agents",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=FastJSONResponse
 )
 
 # Add CORS middleware
@@ -42,16 +60,126 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Sticky routing: load balancers can pin a client to the worker named in this cookie
+AFFINITY_COOKIE = os.getenv("AFFINITY_COOKIE", "va_node")
+
+@app.middleware("http")
+async def add_node_affinity(request: Request, call_next):
+    response = await call_next(request)
+    response.headers["X-Served-By"] = NODE_ID
+    if request.cookies.get(AFFINITY_COOKIE) != NODE_ID:
+        response.set_cookie(AFFINITY_COOKIE, NODE_ID, httponly=True, samesite="lax")
+    return response
+
+# Shared state (agents, voices, prompt audio, live sessions) - SQLite per node or Redis across nodes
+state = create_state_backend()
+sessions = SessionRegistry(state)
+
 # Initialize all services
 llm_service = LLMService()
 tts_service = TTSService()
 stt_service = STTService()
 asr_service = ASRService()
-voice_cloning_service = VoiceCloningService()
-phone_service = PhoneIntegrationService()
-agent_service = AgentManagementService()
+voice_cloning_service = VoiceCloningService(state)
+call_events = CallEventService()
+phone_service = PhoneIntegrationService(call_events)
+prompt_bank_service = PromptBankService(tts_service, voice_cloning_service, state)
+agent_service = AgentManagementService(state, prompt_bank_service)
+job_queue = JobQueue(workers=int(os.getenv("CLONING_WORKERS", "2")))
+campaign_service = CampaignService(phone_service, call_events)
+turn_log = TurnLog(os.getenv("TURN_LOG_DIR", "/tmp/turn_log"))
+analytics = AnalyticsService(os.getenv("ANALYTICS_DB_PATH", "/tmp/analytics.db"))
+turn_log.subscribe(analytics.record)
+prompt_compiler = PromptCompiler()
+model_router = ModelRouter()
+
+async def _run_clone_job(payload: dict, progress) -> dict:
+    """Job handler: clone a voice, then remove the uploaded samples once the job has finished"""
+    try:
+        result = await voice_cloning_service.clone_voice(
+            voice_samples=payload["voice_samples"],
+            voice_name=payload["voice_name"],
+            provider=payload["provider"],
+            language=payload["language"],
+            on_progress=progress
+        )
+    except asyncio.CancelledError:
+        # A cancelled job is requeued on the next start and needs its samples again
+        raise
+    except Exception:
+        _remove_uploads(payload["voice_samples"])
+        raise
+    _remove_uploads(payload["voice_samples"])
+    return result
+
+job_queue.register("voice_clone", _run_clone_job)
+
+# Provider SDK clients are built on first use; warm-up preloads the ones configured agents reference
+_warm_up = {"ready": False, "clients": {}, "duration_ms": None}
+_warm_up_task: Optional[asyncio.Task] = None
+
+async def _run_warm_up():
+    started = time.perf_counter()
+    agents = (await agent_service.list_agents_async()).get("agents", [])
+    # Groq is the LLM fallback for every provider, so it is always needed
+    _warm_up["clients"] = await warm_up(["groq"] + clients_for_agents(agents))
+    _warm_up["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _warm_up["ready"] = True
+    logger.info(f"Warm-up finished in {_warm_up['duration_ms']} ms: {_warm_up['clients']}")
+
+# Job and campaign workers run in one process per host: whichever holds that host's lease. The job
+# and campaign queues and uploaded samples are local files, so each host drains its own.
+LEASE_SECONDS = 15
+WORKER_LEASE = f"background-workers:{HOST_ID}"
+_background_running = False
+_leader_task: Optional[asyncio.Task] = None
+
+async def _lead_background_workers():
+    global _background_running
+    while True:
+        try:
+            leader = await asyncio.to_thread(state.acquire_lease, WORKER_LEASE, NODE_ID, LEASE_SECONDS)
+        except Exception as e:
+            logger.error(f"Lease renewal error: {e}")
+            leader = False
+        if leader and not _background_running:
+            logger.info(f"{NODE_ID} took over job and campaign workers")
+            await job_queue.start()
+            await campaign_service.start()
+            _background_running = True
+        elif not leader and _background_running:
+            logger.info(f"{NODE_ID} lost the background worker lease")
+            await job_queue.stop()
+            await campaign_service.stop()
+            _background_running = False
+        await asyncio.sleep(LEASE_SECONDS / 3)
+
+@app.on_event("startup")
+async def start_background_workers():
+    global _warm_up_task, _leader_task
+    await turn_log.start()
+    await analytics.start()
+    _leader_task = asyncio.create_task(_lead_background_workers())
+    _warm_up_task = asyncio.create_task(_run_warm_up())
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    if _warm_up_task and not _warm_up_task.done():
+        _warm_up_task.cancel()
+    if _leader_task:
+        _leader_task.cancel()
+    await job_queue.stop()
+    await campaign_service.stop()
+    await turn_log.stop()
+    await analytics.stop()
 
 # Pydantic models
+class FewShotExample(BaseModel):
+    user: str
+    assistant: str
+    # Only compiled into prompts for this language; omit to use it for every language
+    language: Optional[str] = None
+
 class AgentCreateRequest(BaseModel):
     name: str
     job_role: str
@@ -63,10 +191,49 @@ class AgentCreateRequest(BaseModel):
     voice_id: Optional[str] = None
     temperature: Optional[float] = 0.7
     max_tokens: Optional[int] = 500
+    supported_languages: Optional[List[str]] = None
+    # Fixed phrases to pre-render, e.g. {"opening": "Namaste!"} or {"opening": {"hi": "...", "en-IN": "..."}}
+    prompts: Optional[Dict[str, Union[str, Dict[str, str]]]] = None
+    speculative_mode: Optional[bool] = False
+    speculative_confidence_threshold: Optional[float] = 0.85
+    speculative_cost_cap: Optional[int] = 2000
+    speaker_verification_threshold: Optional[float] = None
+    few_shot_examples: Optional[List[FewShotExample]] = None
+    # Time-to-first-token target; with it the model is picked per turn from llm_models
+    # (keys of config.LLM_MODEL_PROFILES, default: every profiled model of llm_provider)
+    latency_slo_ms: Optional[int] = None
+    # Whole-turn target; output length is capped to fit what is left of it
+    turn_budget_ms: Optional[int] = None
+    llm_models: Optional[List[str]] = None
+
+class AgentUpdateRequest(BaseModel):
+    name: Optional[str] = None
+    job_role: Optional[str] = None
+    system_instruction: Optional[str] = None
+    language: Optional[str] = None
+    llm_provider: Optional[str] = None
+    tts_provider: Optional[str] = None
+    stt_provider: Optional[str] = None
+    voice_id: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    supported_languages: Optional[List[str]] = None
+    prompts: Optional[Dict[str, Union[str, Dict[str, str]]]] = None
+    speculative_mode: Optional[bool] = None
+    speculative_confidence_threshold: Optional[float] = None
+    speculative_cost_cap: Optional[int] = None
+    speaker_verification_threshold: Optional[float] = None
+    few_shot_examples: Optional[List[FewShotExample]] = None
+    latency_slo_ms: Optional[int] = None
+    turn_budget_ms: Optional[int] = None
+    llm_models: Optional[List[str]] = None
+    status: Optional[str] = None
 
 class TextGenerationRequest(BaseModel):
     prompt: str
     language: str
+    # Generate as this agent (its compiled system prompt)
+    agent_id: Optional[str] = None
     provider: Optional[str] = "groq"
     temperature: Optional[float] = 0.7
     max_tokens: Optional[int] = 500
@@ -84,12 +251,102 @@ class PhoneCallRequest(BaseModel):
     provider: Optional[str] = "vapi"
     message: Optional[str] = None
 
+class CampaignCreateRequest(BaseModel):
+    agent_id: str
+    phone_numbers: List[str]
+    provider: Optional[str] = "twilio"
+    message: Optional[str] = None
+    concurrency: Optional[int] = None
+    max_attempts: Optional[int] = 3
+    retry_base_seconds: Optional[int] = 300
+
 # Health Check Endpoints
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "service": "Indian Voice Agent Builder"}
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until provider clients are warmed up"""
+    body = {**_warm_up, "loaded": loaded_clients()}
+    return FastJSONResponse(body, status_code=200 if _warm_up["ready"] else 503)
+
+@app.get("/sessions")
+async def list_sessions(node: Optional[str] = None):
+    """Live WebSocket sessions across all workers, optionally for one node"""
+    result = await asyncio.to_thread(sessions.list, node)
+    return {"node": NODE_ID, "sessions": result, "count": len(result)}
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Which node owns a live session (for routing follow-up requests to it)"""
+    session = await asyncio.to_thread(sessions.get, session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+@app.get("/sessions/{session_id}/turns")
+async def get_session_turns(session_id: str, limit: int = 200):
+    """Conversation history of one call, oldest turn first"""
+    turns = await turn_log.query(session_id=session_id, limit=limit)
+    return {"session_id": session_id, "turns": turns[::-1], "count": len(turns)}
+
+@app.get("/turns")
+async def list_turns(
+    agent_id: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    limit: int = 100
+):
+    """Logged turns, newest first, by agent and ISO date range"""
+    turns = await turn_log.query(agent_id=agent_id, date_from=date_from, date_to=date_to, limit=limit)
+    return {"turns": turns, "count": len(turns), "log": turn_log.stats()}
+
+# Analytics Endpoints (precomputed rollups; cost grows with buckets, not turns)
+@app.get("/analytics/summary")
+async def analytics_summary(
+    resolution: str = "hour",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    buckets: int = 24,
+    agent_id: Optional[str] = None
+):
+    """Turn totals, outcomes and latency percentiles over a range"""
+    try:
+        return await analytics.summary(resolution, date_from, date_to, buckets, agent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analytics/timeseries")
+async def analytics_timeseries(
+    resolution: str = "hour",
+    dimension: str = "all",
+    value: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    buckets: int = 24
+):
+    """Per-minute/hour/day turn counts and latency percentiles for one dimension value"""
+    try:
+        return await analytics.timeseries(resolution, dimension, value, date_from, date_to, buckets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/analytics/breakdown")
+async def analytics_breakdown(
+    dimension: str = "agent",
+    resolution: str = "day",
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    buckets: int = 7
+):
+    """Totals per agent, language, channel or provider, or provider mix by language"""
+    try:
+        return await analytics.breakdown(dimension, resolution, date_from, date_to, buckets)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.get("/status")
 async def status():
     """Get service status"""
@@ -100,7 +357,15 @@ async def status():
         "asr_service": "active",
         "voice_cloning_service": "active",
         "phone_integration_service": "active",
-        "agent_management_service": "active"
+        "agent_management_service": "active",
+        # Identical concurrent calls served by one provider/state call
+        "single_flight": {
+            flight.name: flight.stats()
+            for flight in (
+                tts_service.flight, voice_cloning_service.synthesis_flight,
+                voice_cloning_service.voice_flight, agent_service.flight
+            )
+        }
     }
 
 # Configuration Endpoints
@@ -128,7 +393,7 @@ async def get_stt_providers():
 @app.post("/agents/create")
 async def create_agent(request: AgentCreateRequest):
     """Create a new voice agent"""
-    result = agent_service.create_agent(
+    result = await agent_service.create_agent_async(
         name=request.name,
         job_role=request.job_role,
         system_instruction=request.system_instruction,
@@ -138,16 +403,58 @@ async def create_agent(request: AgentCreateRequest):
         stt_provider=request.stt_provider,
         voice_id=request.voice_id,
         temperature=request.temperature,
-        max_tokens=request.max_tokens
+        max_tokens=request.max_tokens,
+        supported_languages=request.supported_languages,
+        prompts=request.prompts,
+        speculative_mode=request.speculative_mode,
+        speculative_confidence_threshold=request.speculative_confidence_threshold,
+        speculative_cost_cap=request.speculative_cost_cap,
+        speaker_verification_threshold=request.speaker_verification_threshold,
+        few_shot_examples=[example.model_dump() for example in request.few_shot_examples or []],
+        latency_slo_ms=request.latency_slo_ms,
+        turn_budget_ms=request.turn_budget_ms,
+        llm_models=request.llm_models
     )
     if not result["success"]:
         raise HTTPException(status_code=400, detail=result["error"])
     return result
 
+@app.patch("/agents/{agent_id}")
+async def update_agent(agent_id: str, request: AgentUpdateRequest):
+    """Update agent configuration (the service re-renders its prompt bank if the voice changed)"""
+    result = await agent_service.update_agent_async(agent_id, request.model_dump(exclude_unset=True))
+    if not result["success"]:
+        status_code = 404 if result["error"] == "Agent not found" else 400
+        raise HTTPException(status_code=status_code, detail=result["error"])
+    prompt_compiler.invalidate(agent_id)
+    return result
+
+@app.get("/agents/{agent_id}/prompts")
+async def list_agent_prompts(agent_id: str):
+    """List pre-rendered prompts for an agent"""
+    return {"agent_id": agent_id, "prompts": await prompt_bank_service.list_prompts(agent_id)}
+
+@app.post("/agents/{agent_id}/prompts/render")
+async def render_agent_prompts(agent_id: str):
+    """Force a background re-render of an agent's prompt bank"""
+    result = await agent_service.get_agent_async(agent_id)
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["error"])
+    prompt_bank_service.schedule_render(result["agent"])
+    return {"success": True, "agent_id": agent_id, "status": "rendering"}
+
+@app.get("/agents/{agent_id}/prompts/{key}")
+async def get_agent_prompt(agent_id: str, key: str, language: str):
+    """Play a pre-rendered prompt (Ogg/Opus)"""
+    audio = await prompt_bank_service.get_prompt(agent_id, key, language)
+    if audio is None:
+        raise HTTPException(status_code=404, detail="Prompt not rendered")
+    return Response(content=audio, media_type="audio/ogg")
+
 @app.get("/agents/{agent_id}")
 async def get_agent(agent_id: str):
     """Get agent configuration"""
-    result = agent_service.get_agent(agent_id)
+    result = await agent_service.get_agent_async(agent_id)
     if not result["success"]:
         raise HTTPException(status_code=404, detail=result["error"])
     return result
@@ -155,72 +462,184 @@ async def get_agent(agent_id: str):
 @app.get("/agents")
 async def list_agents(language: Optional[str] = None):
     """List all agents, optionally filtered by language"""
-    result = agent_service.list_agents(language)
+    result = await agent_service.list_agents_async(language)
     return result
 
 # LLM Endpoints
 @app.post("/llm/generate")
 async def generate_text(request: TextGenerationRequest):
-    """Generate text using LLM"""
-    result = await llm_service.generate(
+    """Generate text using LLM, optionally with an agent's compiled system prompt"""
+    system_prompt = None
+    if request.agent_id:
+        agent = await agent_service.get_agent_async(request.agent_id)
+        if not agent["success"]:
+            raise HTTPException(status_code=404, detail=agent["error"])
+        system_prompt = prompt_compiler.compile(agent["agent"], request.language)["text"]
+    text = await llm_service.generate(
         prompt=request.prompt,
+        model=request.provider,
         language=request.language,
-        provider=request.provider,
-        temperature=request.temperature,
+        system_prompt=system_prompt,
         max_tokens=request.max_tokens
     )
-    if "error" in result and result["error"]:
-        raise HTTPException(status_code=400, detail=result["error"])
-    return result
+    if not text:
+        raise HTTPException(status_code=502, detail="Text generation failed")
+    return {"success": True, "text": text, "provider": request.provider}
+
+@app.get("/llm/router")
+async def llm_router_stats():
+    """Live latency estimates the model router is using, per model"""
+    return {"models": model_router.stats()}
+
+@app.get("/agents/{agent_id}/system-prompt")
+async def get_agent_system_prompt(agent_id: str, language: Optional[str] = None, channel: str = "web"):
+    """Compiled system prompt with its token count and hash (for checking prompt-cache prefixes)"""
+    result = await agent_service.get_agent_async(agent_id)
+    if not result["success"]:
+        raise HTTPException(status_code=404, detail=result["error"])
+    agent = result["agent"]
+    return prompt_compiler.compile(agent, language or agent.get("language", "hi"), channel)
 
 # TTS Endpoints
 @app.post("/tts/synthesize")
 async def synthesize_speech(request: TextToSpeechRequest):
-    """Synthesize speech from text"""
-    result = await tts_service.synthesize(
-        text=request.text,
-        language=request.language,
-        voice_id=request.voice_id,
-        provider=request.tts_provider,
-        speed=request.speed
-    )
-    if "error" in result:
-        raise HTTPException(status_code=400, detail=result["error"])
-    return result
+    """Synthesize speech from text: audio bytes, or {"audio_url"} for providers that return a URL"""
+    if request.voice_id:
+        result = await voice_cloning_service.synthesize_with_cloned_voice(
+            text=request.text,
+            voice_id=request.voice_id,
+            language=request.language,
+            speed=request.speed
+        )
+        if result.get("error"):
+            raise HTTPException(status_code=400, detail=result["error"])
+        audio = result["audio"]
+    else:
+        audio = await tts_service.synthesize(request.text, request.language, model=request.provider)
+        if not audio:
+            raise HTTPException(status_code=502, detail="Speech synthesis failed")
+    if isinstance(audio, str):
+        return {"success": True, "audio_url": audio}
+    # Clips may be shared read-only memoryviews; Starlette responses take bytes
+    return Response(content=bytes(audio), media_type="audio/mpeg")
+
+async def _as_bytes(chunks: AsyncIterator) -> AsyncIterator[bytes]:
+    """Audio chunks for a StreamingResponse, which sends bytes (or str) only"""
+    async for chunk in chunks:
+        yield chunk if isinstance(chunk, bytes) else bytes(chunk)
+
+@app.post("/tts/stream")
+async def stream_speech(request: TextToSpeechRequest):
+    """Stream synthesized speech as the provider produces it"""
+    if request.voice_id:
+        chunks = voice_cloning_service.synthesize_stream_with_cloned_voice(
+            text=request.text,
+            voice_id=request.voice_id,
+            language=request.language,
+            speed=request.speed
+        )
+    else:
+        chunks = tts_service.synthesize_stream(
+            text=request.text,
+            language=request.language,
+            model=request.provider
+        )
+    return StreamingResponse(_as_bytes(chunks), media_type="audio/mpeg")
 
 # Voice Cloning Endpoints
-@app.post("/voice-cloning/clone")
+async def _save_uploads(files: List[UploadFile]) -> List[str]:
+    """Write uploaded audio to temporary files"""
+    import tempfile
+    paths = []
+    for upload in files:
+        with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
+            tmp_file.write(await upload.read())
+            paths.append(tmp_file.name)
+    return paths
+
+def _remove_uploads(paths: List[str]):
+    """Delete temporary files written by _save_uploads"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+@app.post("/voice-cloning/clone", status_code=202)
 async def clone_voice(
     voice_name: str,
     language: str,
     provider: Optional[str] = "replicate_xtts",
-    file: UploadFile = File(...)
+    webhook_url: Optional[str] = None,
+    files: List[UploadFile] = File(...)
 ):
-    """Clone voice from audio sample"""
-    # Save uploaded file temporarily
-    import tempfile
-    with tempfile.NamedTemporaryFile(delete=False) as tmp_file:
-        content = await file.read()
-        tmp_file.write(content)
-        tmp_path = tmp_file.name
-    
-    result = await voice_cloning_service.clone_voice(
-        voice_samples=[tmp_path],
-        voice_name=voice_name,
-        provider=provider,
-        language=language
-    )
-    
-    if not result.get("success"):
-        raise HTTPException(status_code=400, detail=result.get("error", "Voice cloning failed"))
-    return result
+    """Queue voice cloning from one or more audio samples; poll the job or pass a webhook_url"""
+    tmp_paths = await _save_uploads(files)
+    try:
+        job = await asyncio.to_thread(job_queue.submit, "voice_clone", {
+            "voice_samples": tmp_paths,
+            "voice_name": voice_name,
+            "provider": provider,
+            "language": language
+        }, webhook_url)
+    except ValueError as e:
+        _remove_uploads(tmp_paths)
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "success": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "status_url": f"/voice-cloning/jobs/{job['id']}"
+    }
+
+@app.get("/voice-cloning/jobs/{job_id}")
+async def get_clone_job(job_id: str):
+    """Voice cloning job status, progress and result"""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @app.get("/voice-cloning/voices")
 async def list_cloned_voices():
     """List all cloned voices"""
-    voices = voice_cloning_service.list_cloned_voices()
+    voices = await asyncio.to_thread(voice_cloning_service.list_cloned_voices)
     return {"voices": voices, "count": len(voices)}
 
+@app.get("/voice-cloning/voices/{voice_id}/similar")
+async def find_similar_voices(voice_id: str, k: int = 5):
+    """Find cloned voices similar to the given one"""
+    return {"voice_id": voice_id, "similar": await voice_cloning_service.find_similar_voices(voice_id, k)}
+
+# Speaker Verification Endpoints
+@app.post("/speaker-verification/{speaker_id}/enroll")
+async def enroll_speaker(speaker_id: str, files: List[UploadFile] = File(...)):
+    """Enroll one or more utterances for a speaker"""
+    paths = await _save_uploads(files)
+    try:
+        result = await asr_service.speaker_verification.enroll(speaker_id, paths)
+    finally:
+        _remove_uploads(paths)
+    if not result["success"]:
+        raise HTTPException(status_code=400, detail=result["error"])
+    return result
+
+@app.post("/speaker-verification/{speaker_id}/verify")
+async def verify_speaker(speaker_id: str, agent_id: Optional[str] = None, files: List[UploadFile] = File(...)):
+    """Verify utterances against a speaker, using the agent's threshold if given"""
+    threshold = None
+    if agent_id:
+        agent = await agent_service.get_agent_async(agent_id)
+        if not agent["success"]:
+            raise HTTPException(status_code=404, detail=agent["error"])
+        threshold = agent["agent"].get("speaker_verification_threshold")
+    paths = await _save_uploads(files)
+    try:
+        results = await asr_service.speaker_verification.verify_batch(paths, speaker_id, threshold)
+    finally:
+        _remove_uploads(paths)
+    return {"speaker_id": speaker_id, "results": results}
+
 # Phone Integration Endpoints
 @app.post("/phone/call")
 async def make_phone_call(request: PhoneCallRequest):
@@ -247,6 +666,153 @@ async def hang_up_call(call_id: str, provider: str):
     result = await phone_service.hang_up_call(call_id, provider)
     return result
 
+@app.get("/phone/call/{call_id}/events")
+async def get_call_events(call_id: str):
+    """Every status event received for a call"""
+    return {"call_id": call_id, "state": call_events.get_call(call_id), "events": call_events.get_events(call_id)}
+
+# Call status webhooks
+def _public_url(request: Request) -> str:
+    """URL the provider signed - PUBLIC_BASE_URL when running behind a proxy"""
+    if phone_service.webhook_base_url:
+        url = phone_service.webhook_base_url + request.url.path
+        return f"{url}?{request.url.query}" if request.url.query else url
+    return str(request.url)
+
+@app.post("/phone/webhooks/twilio")
+async def twilio_status_webhook(request: Request):
+    """Twilio StatusCallback receiver"""
+    form = dict(await request.form())
+    if not call_events.verify_twilio(_public_url(request), form, request.headers.get("X-Twilio-Signature")):
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+    event = normalize_twilio(form)
+    if event:
+        await call_events.ingest(event)
+    return Response(status_code=204)
+
+@app.post("/phone/webhooks/vapi")
+async def vapi_server_webhook(request: Request):
+    """Vapi server URL receiver (status-update and end-of-call-report messages)"""
+    if not call_events.verify_vapi(request.headers.get("x-vapi-secret")):
+        raise HTTPException(status_code=403, detail="Invalid Vapi secret")
+    event = normalize_vapi(await request.json())
+    if event:
+        await call_events.ingest(event)
+    return {"received": True}
+
+@app.post("/phone/webhooks/exotel")
+async def exotel_status_webhook(request: Request):
+    """Exotel StatusCallback receiver"""
+    if not call_events.verify_exotel(request.query_params.get("token"), request.headers.get("Authorization")):
+        raise HTTPException(status_code=403, detail="Invalid Exotel token")
+    event = normalize_exotel(dict(await request.form()))
+    if event:
+        await call_events.ingest(event)
+    return Response(status_code=204)
+
+@app.get("/phone/events")
+async def stream_call_events(call_id: Optional[str] = None):
+    """Server-sent stream of normalized call events (optionally for one call)"""
+    async def event_stream():
+        queue = call_events.subscribe(call_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                    yield f"data: {dumps_str(event)}\n\n"
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            call_events.unsubscribe(queue)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.websocket("/ws/phone/events")
+async def call_events_websocket(websocket: WebSocket, call_id: Optional[str] = None):
+    """WebSocket stream of normalized call events (optionally for one call)"""
+    await websocket.accept()
+    queue = call_events.subscribe(call_id)
+    try:
+        while True:
+            await send_message(websocket, await queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        call_events.unsubscribe(queue)
+
+# Telephony media streams
+@app.websocket("/ws/{provider}/media/{agent_id}")
+async def media_stream(websocket: WebSocket, provider: str, agent_id: str):
+    """Twilio Media Streams / Exotel Voicebot stream running the agent pipeline on call audio"""
+    await websocket.accept()
+    agent = await agent_service.get_agent_async(agent_id)
+    if provider not in ("twilio", "exotel") or not agent.get("success"):
+        await websocket.close(code=1008)
+        return
+    session_id = f"media_{uuid.uuid4().hex}"
+    bridge = MediaStreamBridge(
+        websocket, agent["agent"], stt_service, llm_service, tts_service,
+        voice_cloning_service, prompt_bank_service, provider=provider,
+        turn_log=turn_log, session_id=session_id, prompt_compiler=prompt_compiler,
+        model_router=model_router
+    )
+    try:
+        async with sessions.hold(session_id, kind="media", agent_id=agent_id, provider=provider):
+            await bridge.run()
+    except WebSocketDisconnect:
+        pass
+
+@app.get("/phone/twiml/{agent_id}")
+async def media_stream_twiml(agent_id: str):
+    """TwiML connecting an incoming call to the agent's media bridge"""
+    return Response(content=phone_service.media_stream_twiml(agent_id), media_type="application/xml")
+
+# Campaign Endpoints
+@app.post("/campaigns")
+async def create_campaign(request: CampaignCreateRequest):
+    """Start dialing a list of numbers for an agent"""
+    agent = await agent_service.get_agent_async(request.agent_id)
+    if not agent.get("success"):
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if not request.phone_numbers:
+        raise HTTPException(status_code=400, detail="No phone numbers provided")
+    result = campaign_service.create_campaign(
+        agent_id=request.agent_id,
+        phone_numbers=request.phone_numbers,
+        provider=request.provider,
+        message=request.message,
+        concurrency=request.concurrency,
+        max_attempts=request.max_attempts,
+        retry_base_seconds=request.retry_base_seconds
+    )
+    if not result.get("success"):
+        raise HTTPException(status_code=400, detail=result.get("error"))
+    return result
+
+@app.get("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str):
+    """Campaign progress and throughput stats"""
+    result = campaign_service.get_campaign(campaign_id)
+    if not result.get("success"):
+        raise HTTPException(status_code=404, detail=result.get("error"))
+    return result
+
+@app.get("/campaigns/{campaign_id}/numbers")
+async def list_campaign_numbers(campaign_id: str, status: Optional[str] = None, limit: int = 100, offset: int = 0):
+    """Per-number call state"""
+    return {"numbers": campaign_service.list_numbers(campaign_id, status, limit, offset)}
+
+@app.post("/campaigns/{campaign_id}/{action}")
+async def control_campaign(campaign_id: str, action: str):
+    """Pause, resume or cancel a campaign"""
+    statuses = {"pause": "paused", "resume": "running", "cancel": "cancelled"}
+    if action not in statuses:
+        raise HTTPException(status_code=404, detail=f"Unknown action: {action}")
+    result = campaign_service.set_status(campaign_id, statuses[action])
+    if not result.get("success"):
+        raise HTTPException(status_code=400, detail=result.get("error"))
+    return result
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -263,10 +829,13 @@ async def root():
             "llm": "/llm/*",
             "tts": "/tts/*",
             "voice_cloning": "/voice-cloning/*",
-            "phone": "/phone/*"
+            "phone": "/phone/*",
+            "campaigns": "/campaigns/*"
         }
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # WEB_CONCURRENCY > 1 runs several worker processes; they share state through the state backend
+    uvicorn.run("main_api:app", host="0.0.0.0", port=int(os.getenv("PORT", "8000")),
+                workers=int(os.getenv("WEB_CONCURRENCY", "1")))
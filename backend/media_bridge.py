@@ -0,0 +1,294 @@
+# Media Bridge
+# Runs the agent's STT -> LLM -> TTS pipeline directly on Twilio / Exotel phone media streams
+
+import asyncio
+import base64
+import logging
+import os
+import tempfile
+from collections import deque
+from typing import AsyncIterator, List, Optional
+
+import numpy as np
+
+from audio_codec import decode, encode, pcm16_to_float, decode_stream
+from audio_processing import frame_signal, frame_energy_db, encode_wav
+from language_id import LanguageRouter
+from prompt_compiler import PromptCompiler, count_tokens
+from model_router import ModelRouter
+from serialization import send_message, receive_message
+from turn_log_service import turn_record
+
+logger = logging.getLogger(__name__)
+
+TELEPHONY_SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_SAMPLES = TELEPHONY_SAMPLE_RATE * FRAME_MS // 1000
+
+# Energy endpointing
+SPEECH_MARGIN_DB = 12.0      # above the running noise floor
+MIN_SPEECH_DB = -45.0
+SPEECH_START_FRAMES = 3      # 60 ms of speech opens an utterance
+SPEECH_END_FRAMES = 35       # 700 ms of silence closes it
+PRE_ROLL_FRAMES = 10         # keep 200 ms before the detected start
+MIN_UTTERANCE_FRAMES = 15
+MAX_UTTERANCE_FRAMES = 750   # 15 s
+
+HISTORY_TURNS = 6
+
+
+class EnergyEndpointer:
+    """Splits caller audio into utterances with a frame-energy VAD and an adaptive noise floor"""
+
+    def __init__(self):
+        self.noise_db = -60.0
+        self.in_speech = False
+        self._speech_run = 0
+        self._silence_run = 0
+        self._carry = np.zeros(0, dtype=np.int16)
+        self._pre_roll = deque(maxlen=PRE_ROLL_FRAMES)
+        self._frames: List[np.ndarray] = []
+
+    def process(self, pcm: np.ndarray) -> list:
+        """Feed int16 PCM; returns ("speech_start", None) and ("utterance", int16 array) events"""
+        pcm = np.concatenate([self._carry, pcm]) if self._carry.size else pcm
+        n_frames = pcm.size // FRAME_SAMPLES
+        self._carry = pcm[n_frames * FRAME_SAMPLES:].copy()
+        if n_frames == 0:
+            return []
+        frames = frame_signal(pcm[:n_frames * FRAME_SAMPLES], FRAME_SAMPLES, FRAME_SAMPLES)
+        energies = frame_energy_db(pcm16_to_float(frames))
+
+        events = []
+        for frame, energy in zip(frames, energies):
+            is_speech = energy > max(self.noise_db + SPEECH_MARGIN_DB, MIN_SPEECH_DB)
+            if not is_speech:
+                # Track the noise floor only outside speech so the caller's voice does not raise it
+                self.noise_db += 0.05 * (energy - self.noise_db)
+
+            if not self.in_speech:
+                self._pre_roll.append(frame)
+                self._speech_run = self._speech_run + 1 if is_speech else 0
+                if self._speech_run >= SPEECH_START_FRAMES:
+                    self.in_speech = True
+                    self._silence_run = 0
+                    self._frames = list(self._pre_roll)
+                    self._pre_roll.clear()
+                    events.append(("speech_start", None))
+                continue
+
+            self._frames.append(frame)
+            self._silence_run = 0 if is_speech else self._silence_run + 1
+            if self._silence_run >= SPEECH_END_FRAMES or len(self._frames) >= MAX_UTTERANCE_FRAMES:
+                self.in_speech = False
+                self._speech_run = 0
+                voiced = self._frames[:len(self._frames) - self._silence_run]
+                self._frames = []
+                if len(voiced) >= MIN_UTTERANCE_FRAMES:
+                    events.append(("utterance", np.concatenate(voiced)))
+        return events
+
+
+class MediaStreamBridge:
+    """One phone call: decodes caller audio, endpoints turns and streams the agent's replies back"""
+
+    def __init__(self, websocket, agent: dict, stt_service, llm_service, tts_service,
+                 voice_cloning_service, prompt_bank_service, provider: str = "twilio",
+                 turn_log=None, session_id: Optional[str] = None, prompt_compiler: Optional[PromptCompiler] = None,
+                 model_router: Optional[ModelRouter] = None):
+        self.websocket = websocket
+        self.agent = agent
+        self.stt_service = stt_service
+        self.llm_service = llm_service
+        self.tts_service = tts_service
+        self.voice_cloning_service = voice_cloning_service
+        self.prompt_bank_service = prompt_bank_service
+        self.provider = provider
+        self.turn_log = turn_log
+        self.session_id = session_id
+        self.prompt_compiler = prompt_compiler or PromptCompiler()
+        self.model_router = model_router or ModelRouter()
+        # Twilio streams mu-law; Exotel streams raw 16-bit linear PCM, both at 8 kHz
+        self.codec = "pcm16" if provider == "exotel" else "mulaw"
+        self.sid_key = "stream_sid" if provider == "exotel" else "streamSid"
+        # Current language; re-picked from each transcript for callers who switch mid-call
+        self.languages = LanguageRouter.for_agent(agent)
+        self.language = self.languages.current
+        self.stream_sid: Optional[str] = None
+        self.call_sid: Optional[str] = None
+        self.endpointer = EnergyEndpointer()
+        self.history: List[dict] = []
+        self._turn: Optional[asyncio.Task] = None
+        self._pending_marks = set()
+        self._mark_seq = 0
+
+    async def run(self):
+        """Process media stream messages until the call ends"""
+        try:
+            while True:
+                message = await receive_message(self.websocket)
+                event = message.get("event")
+                if event == "start":
+                    start = message.get("start", {})
+                    self.stream_sid = start.get(self.sid_key) or message.get(self.sid_key)
+                    self.call_sid = start.get("callSid") or start.get("call_sid")
+                    logger.info(f"Media stream {self.stream_sid} started for call {self.call_sid}")
+                    self._start_turn(self._play_opening())
+                elif event == "media":
+                    media = message.get("media", {})
+                    if media.get("track", "inbound") == "inbound":
+                        await self._on_audio(base64.b64decode(media["payload"]))
+                elif event == "mark":
+                    self._pending_marks.discard(message.get("mark", {}).get("name"))
+                elif event == "stop":
+                    break
+        finally:
+            if self._turn and not self._turn.done():
+                self._turn.cancel()
+
+    def _encode(self, pcm: np.ndarray) -> str:
+        return base64.b64encode(encode(pcm, self.codec)).decode("ascii")
+
+    def is_speaking(self) -> bool:
+        """Agent audio is being generated or is still queued for playback on the provider side"""
+        return bool(self._pending_marks) or (self._turn is not None and not self._turn.done())
+
+    async def _on_audio(self, payload: bytes):
+        for kind, audio in self.endpointer.process(decode(payload, self.codec)):
+            if kind == "speech_start" and self.is_speaking():
+                await self._barge_in()
+            elif kind == "utterance":
+                self._start_turn(self._respond(audio))
+
+    async def _barge_in(self):
+        """Caller talked over the agent: stop generating and drop audio buffered at the provider"""
+        if self._turn and not self._turn.done():
+            self._turn.cancel()
+        self._pending_marks.clear()
+        await send_message(self.websocket, {"event": "clear", self.sid_key: self.stream_sid})
+
+    def _start_turn(self, coro):
+        if self._turn and not self._turn.done():
+            self._turn.cancel()
+        self._turn = asyncio.create_task(coro)
+
+    async def _play_opening(self):
+        audio = await self.prompt_bank_service.get_prompt(self.agent["id"], "opening", self.language)
+        if audio:
+            async def single():
+                yield audio
+            await self._speak(single())
+
+    async def _respond(self, pcm: np.ndarray):
+        """One conversational turn: transcribe the utterance, generate a reply and speak it"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        latency = {}
+        text, reply, outcome = None, "", "interrupted"
+        llm_model = self.agent.get("llm_provider", "groq")
+        try:
+            text = await self._transcribe(pcm)
+            latency["stt"] = (loop.time() - started) * 1000
+            if not text or not text.strip():
+                return
+            self.language = self.languages.route(text)
+            self.history.append({"role": "user", "content": text})
+            llm_started = loop.time()
+            prompt = self._build_prompt()
+            system_prompt = self.prompt_compiler.compile(self.agent, self.language, channel="phone")
+            prompt_tokens = system_prompt["tokens"] + count_tokens(prompt)
+            # Agents with a latency SLO get a model and output cap picked for this turn
+            route = self.model_router.select(self.agent, prompt_tokens, elapsed_ms=latency["stt"])
+            llm_model = route["key"] or llm_model
+            # A routed model is called without the Groq fallback so its failures are recorded against it
+            with self.model_router.track(route["key"], prompt_tokens) as observation:
+                reply = await self.llm_service.generate(
+                    prompt, model=route["model"] or self.agent.get("llm_provider", "groq"), language=self.language,
+                    system_prompt=system_prompt["text"], max_tokens=route["max_tokens"], fallback=route["key"] is None
+                )
+                observation.update(failed=not reply, output_tokens=count_tokens(reply or ""))
+            if not reply and route["key"]:
+                llm_model = self.agent.get("llm_provider", "groq")
+                reply = await self.llm_service.generate(
+                    prompt, model=llm_model, language=self.language,
+                    system_prompt=system_prompt["text"], max_tokens=route["max_tokens"]
+                )
+            latency["llm"] = (loop.time() - llm_started) * 1000
+            if not reply:
+                outcome = "error"
+                return
+            self.history.append({"role": "assistant", "content": reply})
+            await self._speak(self._synthesize(reply), latency)
+            outcome = "completed"
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            outcome = "error"
+            logger.error(f"Media bridge turn error: {e}")
+        finally:
+            if self.turn_log is not None and text and text.strip():
+                latency["total"] = (loop.time() - started) * 1000
+                self.turn_log.append(turn_record(
+                    agent_id=self.agent.get("id"), session_id=self.session_id, user_text=text, ai_text=reply,
+                    language=self.language, latency_ms=latency, outcome=outcome, channel=self.provider,
+                    providers={"stt": self.agent.get("stt_provider", "google_stt"),
+                               "llm": llm_model,
+                               "tts": "cloned_voice" if self.agent.get("voice_id") else self.agent.get("tts_provider", "replicate_xtts")},
+                    call_sid=self.call_sid
+                ))
+
+    async def _transcribe(self, pcm: np.ndarray) -> Optional[str]:
+        fd, path = tempfile.mkstemp(suffix=".wav")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(encode_wav(pcm16_to_float(pcm), TELEPHONY_SAMPLE_RATE))
+            return await self.stt_service.transcribe(
+                path, self.language, model=self.agent.get("stt_provider", "google_stt")
+            )
+        finally:
+            os.remove(path)
+
+    def _build_prompt(self) -> str:
+        """Recent conversation; the agent's instructions go in the (cached) system prompt"""
+        lines = []
+        for turn in self.history[-HISTORY_TURNS:]:
+            lines.append(f"{'Caller' if turn['role'] == 'user' else 'Agent'}: {turn['content']}")
+        lines.append("Agent:")
+        return "\n".join(lines)
+
+    def _synthesize(self, text: str) -> AsyncIterator[bytes]:
+        if self.agent.get("voice_id"):
+            return self.voice_cloning_service.synthesize_stream_with_cloned_voice(
+                text, self.agent["voice_id"], self.language
+            )
+        return self.tts_service.synthesize_stream(
+            text, self.language, model=self.agent.get("tts_provider", "replicate_xtts")
+        )
+
+    async def _speak(self, chunks: AsyncIterator[bytes], latency: Optional[dict] = None):
+        """Transcode encoded TTS audio to 8 kHz as it streams in and send it as 20 ms frames"""
+        carry = np.zeros(0, dtype=np.int16)
+        tts_started = asyncio.get_running_loop().time()
+        async for pcm in decode_stream(chunks, TELEPHONY_SAMPLE_RATE):
+            if latency is not None and "tts_first_audio" not in latency:
+                latency["tts_first_audio"] = (asyncio.get_running_loop().time() - tts_started) * 1000
+            pcm = np.concatenate([carry, pcm]) if carry.size else pcm
+            usable = pcm.size - pcm.size % FRAME_SAMPLES
+            for start in range(0, usable, FRAME_SAMPLES):
+                await self._send_frame(pcm[start:start + FRAME_SAMPLES])
+            carry = pcm[usable:]
+        if carry.size:
+            await self._send_frame(np.pad(carry, (0, FRAME_SAMPLES - carry.size)))
+
+        # The provider echoes the mark once everything before it has played
+        self._mark_seq += 1
+        name = f"reply-{self._mark_seq}"
+        self._pending_marks.add(name)
+        await send_message(self.websocket, {"event": "mark", self.sid_key: self.stream_sid, "mark": {"name": name}})
+
+    async def _send_frame(self, pcm: np.ndarray):
+        await send_message(self.websocket, {
+            "event": "media",
+            self.sid_key: self.stream_sid,
+            "media": {"payload": self._encode(pcm)}
+        })
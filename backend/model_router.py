@@ -0,0 +1,171 @@
+# Model Router
+# Picks each turn's LLM among the agent's candidate models to meet its time-to-first-token SLO, using live
+# latency statistics, prompt length and in-flight load, and caps output length to the turn's remaining budget
+
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from config import LLM_MODEL_PROFILES
+
+logger = logging.getLogger(__name__)
+
+EWMA_ALPHA = 0.2
+ERROR_WINDOW = 20
+MAX_ERROR_RATE = 0.5
+MIN_OUTPUT_TOKENS = 24
+# Part of the turn budget kept for TTS to produce first audio after the LLM finishes
+TTS_RESERVE_MS = 300
+
+
+class ModelStats:
+    """Live latency estimate for one model, seeded from its profile"""
+
+    def __init__(self, profile: dict):
+        self.profile = profile
+        # TTFT excluding prompt prefill, and its mean absolute deviation
+        self.ttft_ms = float(profile["ttft_ms"])
+        self.ttft_dev_ms = self.ttft_ms / 4
+        self.tokens_per_second = float(profile["tokens_per_second"])
+        self.in_flight = 0
+        self.samples = 0
+        self.errors: deque = deque(maxlen=ERROR_WINDOW)
+
+    def expected_ttft(self, prompt_tokens: int) -> float:
+        """Conservative (roughly p95) time to first token for a prompt, given current load"""
+        ttft = self.ttft_ms + 2 * self.ttft_dev_ms + self.profile["prefill_ms_per_1k"] * prompt_tokens / 1000
+        concurrency = self.profile["concurrency"]
+        overload = max(0, self.in_flight - concurrency) / concurrency
+        return ttft * (1 + overload)
+
+    def error_rate(self) -> float:
+        return sum(self.errors) / len(self.errors) if self.errors else 0.0
+
+    def observe(self, ttft_ms: float, prompt_tokens: int, output_tokens: int, duration_ms: float):
+        base = max(0.0, ttft_ms - self.profile["prefill_ms_per_1k"] * prompt_tokens / 1000)
+        self.ttft_dev_ms += EWMA_ALPHA * (abs(base - self.ttft_ms) - self.ttft_dev_ms)
+        self.ttft_ms += EWMA_ALPHA * (base - self.ttft_ms)
+        generation_ms = duration_ms - ttft_ms
+        if output_tokens > 1 and generation_ms > 0:
+            rate = output_tokens / (generation_ms / 1000)
+            self.tokens_per_second += EWMA_ALPHA * (rate - self.tokens_per_second)
+        self.samples += 1
+        self.errors.append(0)
+
+
+class ModelRouter:
+    """Per-process routing state shared by every session"""
+
+    def __init__(self, profiles: Optional[Dict[str, dict]] = None):
+        self.profiles = profiles or LLM_MODEL_PROFILES
+        self._stats = {key: ModelStats(profile) for key, profile in self.profiles.items()}
+
+    def candidates(self, agent: dict, providers: Optional[Iterable[str]] = None) -> List[str]:
+        """The agent's `llm_models`, else every profiled model of its `llm_provider`"""
+        models = agent.get("llm_models") or [
+            key for key in self.profiles if key.split(":")[0] == (agent.get("llm_provider") or "groq").split("-")[0]
+        ]
+        allowed = set(providers) if providers is not None else None
+        return [
+            key for key in models
+            if key in self.profiles and (allowed is None or key.split(":")[0] in allowed)
+        ]
+
+    def select(
+        self,
+        agent: dict,
+        prompt_tokens: int,
+        elapsed_ms: float = 0.0,
+        providers: Optional[Iterable[str]] = None,
+        default_max_tokens: int = 500
+    ) -> dict:
+        """Model and output cap for one generation
+
+        Returns {"key", "model", "max_tokens", "expected_ttft_ms", "reason"}. "model" is the
+        "provider:api_model" string for LLMService.generate; "key"/"model" are None when the agent
+        does not opt in (no latency_slo_ms or llm_models), in which case callers keep their default.
+        """
+        max_tokens = agent.get("max_tokens") or default_max_tokens
+        route = {"key": None, "model": None, "max_tokens": max_tokens, "expected_ttft_ms": None, "reason": "default"}
+        slo = agent.get("latency_slo_ms")
+        candidates = self.candidates(agent, providers) if slo or agent.get("llm_models") else []
+        if not candidates:
+            return route
+
+        # Skip models that are failing, unless all of them are
+        healthy = [key for key in candidates if self._stats[key].error_rate() < MAX_ERROR_RATE] or candidates
+        expected = {key: self._stats[key].expected_ttft(prompt_tokens) for key in healthy}
+        if slo:
+            meeting = [key for key in healthy if expected[key] <= slo]
+            if meeting:
+                key, reason = max(meeting, key=lambda k: self.profiles[k]["quality"]), "slo"
+            else:
+                # Nothing meets the SLO right now (e.g. peak load): degrade to the fastest model
+                key, reason = min(healthy, key=expected.get), "fastest"
+        else:
+            key, reason = max(healthy, key=lambda k: self.profiles[k]["quality"]), "quality"
+
+        budget = agent.get("turn_budget_ms")
+        if budget:
+            remaining_ms = budget - elapsed_ms - expected[key] - TTS_RESERVE_MS
+            fits = int(remaining_ms / 1000 * self._stats[key].tokens_per_second)
+            max_tokens = max(MIN_OUTPUT_TOKENS, min(max_tokens, fits))
+
+        provider, _, name = key.partition(":")
+        return {
+            "key": key,
+            "model": f"{provider}:{self.profiles[key].get('api_model', name)}",
+            "max_tokens": max_tokens,
+            "expected_ttft_ms": round(expected[key], 1),
+            "reason": reason
+        }
+
+    @contextmanager
+    def track(self, key: Optional[str], prompt_tokens: int):
+        """Count a generation as in flight and record its latency
+
+        The caller fills the yielded dict: "output_tokens", "ttft_ms" when it streams (otherwise it is
+        estimated from the duration), or "failed" when the call returned nothing.
+        """
+        stats = self._stats.get(key) if key else None
+        observation: dict = {}
+        if stats is None:
+            yield observation
+            return
+        stats.in_flight += 1
+        started = time.perf_counter()
+        # Stays "cancelled" on barge-in, which says nothing about the model's latency
+        outcome = "cancelled"
+        try:
+            yield observation
+            outcome = "failed" if observation.get("failed") else "completed"
+        except Exception:
+            outcome = "failed"
+            raise
+        finally:
+            stats.in_flight -= 1
+            if outcome == "failed":
+                stats.errors.append(1)
+            elif outcome == "completed":
+                duration_ms = (time.perf_counter() - started) * 1000
+                output_tokens = observation.get("output_tokens", 0)
+                ttft_ms = observation.get("ttft_ms")
+                if ttft_ms is None:
+                    generation_ms = output_tokens / stats.tokens_per_second * 1000
+                    ttft_ms = max(duration_ms - generation_ms, duration_ms * 0.3)
+                stats.observe(ttft_ms, prompt_tokens, output_tokens, duration_ms)
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            key: {
+                "ttft_ms": round(stats.ttft_ms, 1),
+                "ttft_dev_ms": round(stats.ttft_dev_ms, 1),
+                "tokens_per_second": round(stats.tokens_per_second, 1),
+                "in_flight": stats.in_flight,
+                "samples": stats.samples,
+                "error_rate": round(stats.error_rate(), 2)
+            }
+            for key, stats in self._stats.items()
+        }
@@ -0,0 +1,271 @@
+# Outbound Audio
+# Per-session playback scheduler: slices agent audio into fixed-duration frames, paces them at real time plus
+# a small lead, and lets control messages (transcripts, interruptions, errors) overtake queued audio.
+# Frames are views into the downloaded chunks and are only base64-encoded (or sent raw) at send time.
+
+import asyncio
+import logging
+import os
+import struct
+from collections import deque
+from typing import Callable, List, Optional, Tuple, Union
+
+from serialization import dumps_with_base64, send_message
+
+logger = logging.getLogger(__name__)
+
+FRAME_MS = int(os.getenv("OUTBOUND_FRAME_MS", "100"))
+# Audio the client holds beyond what it is playing - enough to ride out network jitter
+LEAD_MS = int(os.getenv("OUTBOUND_LEAD_MS", "300"))
+# Queued-but-unsent audio per session; producers wait once it is full
+BUFFER_MS = int(os.getenv("OUTBOUND_BUFFER_MS", "20000"))
+# Pacing rate for audio whose duration cannot be read from a header (~128 kbps MP3)
+DEFAULT_BYTE_RATE = 16000
+MAX_WAV_HEADER = 4096
+
+# Outbound message types that carry (or end) agent audio
+AUDIO_MESSAGE_TYPES = ("audio", "audio_chunk", "audio_end")
+# How audio frames reach the client: base64 inside JSON text frames, or raw binary frames
+AUDIO_FORMATS = ("json", "binary")
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+
+class AudioFramer:
+    """Cuts a stream of encoded audio into frames of FRAME_MS without copying it
+
+    Frames are memoryview slices of the incoming chunks; only a frame straddling two chunks is
+    copied (into a buffer smaller than one frame). WAV streams are cut on sample boundaries using
+    the byte rate from the header, which is sent with the first frame so clients can still
+    concatenate frames into a playable file. Other formats are cut by DEFAULT_BYTE_RATE, which
+    only sets the pacing.
+    """
+
+    def __init__(self, frame_ms: int = FRAME_MS):
+        self.frame_ms = frame_ms
+        self._carry = bytearray()
+        # Header bytes still to go out with the first frame; None until the header is parsed
+        self._header: Optional[int] = None
+        self.byte_rate = DEFAULT_BYTE_RATE
+        self.frame_bytes = 0
+
+    def _parse_header(self) -> bool:
+        """Find the byte rate and where sample data starts; False while more bytes are needed"""
+        data = self._carry
+        block_align = 1
+        if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+            offset = 12
+            while True:
+                if offset + 24 > len(data) and len(data) < MAX_WAV_HEADER:
+                    return False
+                if offset + 8 > len(data):
+                    # No data chunk in a sane header size: pace it like any other format
+                    offset = 0
+                    break
+                chunk_id, size = data[offset:offset + 4], struct.unpack_from("<I", data, offset + 4)[0]
+                if chunk_id == b"fmt " and offset + 24 <= len(data):
+                    self.byte_rate, block_align = struct.unpack_from("<IH", data, offset + 16)
+                elif chunk_id == b"data":
+                    offset += 8
+                    break
+                offset += 8 + size + size % 2
+        elif len(data) < 12:
+            return False
+        else:
+            offset = 0
+        self._header = offset
+        frame_bytes = self.byte_rate * self.frame_ms // 1000
+        self.frame_bytes = max(block_align, frame_bytes - frame_bytes % block_align)
+        return True
+
+    def _frame(self, data: BytesLike) -> Tuple[BytesLike, float]:
+        duration_ms = (len(data) - self._header) * 1000 / self.byte_rate
+        self._header = 0
+        return data, duration_ms
+
+    def feed(self, chunk: BytesLike) -> List[Tuple[BytesLike, float]]:
+        """(frame, duration_ms) for every complete frame now available"""
+        frames = []
+        if self._header is None:
+            # Header sniffing needs contiguous bytes; this copies only until the header is found
+            self._carry += chunk
+            if not self._parse_header():
+                return frames
+            view, self._carry = memoryview(self._carry), bytearray()
+        else:
+            view = memoryview(chunk)
+            if self._carry:
+                need = self._header + self.frame_bytes - len(self._carry)
+                self._carry += view[:need]
+                view = view[need:]
+                if len(self._carry) < self._header + self.frame_bytes:
+                    return frames
+                frames.append(self._frame(self._carry))
+                self._carry = bytearray()
+        while len(view) >= self._header + self.frame_bytes:
+            size = self._header + self.frame_bytes
+            frames.append(self._frame(view[:size]))
+            view = view[size:]
+        if len(view):
+            self._carry = bytearray(view)
+        return frames
+
+    def flush(self) -> List[Tuple[BytesLike, float]]:
+        """The final, shorter frame (if any)"""
+        if not self._carry:
+            return []
+        if self._header is None:
+            self._header = 0
+        frame = self._frame(self._carry)
+        self._carry = bytearray()
+        return [frame]
+
+
+class OutboundScheduler:
+    """Two-lane sender for one WebSocket: control messages first, audio paced to playback
+
+    Audio is sent no faster than the client plays it, plus `lead_ms` of headroom, so each frame
+    is small, playback starts with the first frame, and a control message never waits behind
+    more than one frame. `flush_audio` (barge-in) drops everything not yet sent. Queued frames
+    stay raw, so a session holds at most `buffer_ms` of provider audio, not its base64 text.
+    """
+
+    def __init__(
+        self,
+        websocket,
+        frame_ms: int = FRAME_MS,
+        lead_ms: int = LEAD_MS,
+        buffer_ms: int = BUFFER_MS,
+        audio_format: str = "json",
+        on_audio_sent: Optional[Callable[[dict], None]] = None
+    ):
+        self.websocket = websocket
+        self.frame_ms = frame_ms
+        self.lead_ms = lead_ms
+        self.buffer_ms = buffer_ms
+        self.binary_audio = audio_format == "binary"
+        self.on_audio_sent = on_audio_sent
+        self._control: deque = deque()
+        self._audio: deque = deque()
+        self._queued_ms = 0.0
+        self._queued_bytes = 0
+        # Loop time at which the client will have played everything sent so far
+        self._played_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._space = asyncio.Event()
+        self._space.set()
+        self.closed = False
+        self.control_sent = 0
+        self.audio_sent = 0
+        self.audio_bytes_sent = 0
+        self.audio_dropped = 0
+        self.max_queued_ms = 0.0
+        self.peak_queued_bytes = 0
+
+    def put_control(self, message: dict):
+        """Queue a message that overtakes any queued audio"""
+        if self.closed:
+            return
+        self._control.append(message)
+        self._wakeup.set()
+
+    async def put_audio(self, message: dict, duration_ms: float = 0.0, frame: Optional[BytesLike] = None):
+        """Queue an audio message in order, waiting while the buffer is full
+
+        `frame` is attached as the message's base64 "audio" field when sent (or sent as a
+        binary frame); it must not be modified while queued.
+        """
+        while not self.closed and self._queued_ms >= self.buffer_ms:
+            self._space.clear()
+            await self._space.wait()
+        if self.closed:
+            return
+        size = len(frame) if frame is not None else 0
+        self._audio.append((message, frame, duration_ms))
+        self._queued_ms += duration_ms
+        self._queued_bytes += size
+        self.max_queued_ms = max(self.max_queued_ms, self._queued_ms)
+        self.peak_queued_bytes = max(self.peak_queued_bytes, self._queued_bytes)
+        self._wakeup.set()
+
+    def flush_audio(self) -> int:
+        """Drop queued audio; returns how many messages were dropped"""
+        dropped = len(self._audio)
+        self._audio.clear()
+        self._queued_ms = 0.0
+        self._queued_bytes = 0
+        # The client stops playback on "interrupted", so the next reply starts a fresh clock
+        self._played_until = 0.0
+        self.audio_dropped += dropped
+        self._space.set()
+        return dropped
+
+    def playback_remaining_ms(self) -> float:
+        """Queued audio plus audio sent but not yet played by the client"""
+        loop_time = asyncio.get_running_loop().time()
+        return self._queued_ms + max(0.0, self._played_until - loop_time) * 1000
+
+    async def _send_audio(self, message: dict, frame: Optional[BytesLike]):
+        if frame is None:
+            await send_message(self.websocket, message)
+        elif self.binary_audio:
+            await self.websocket.send_bytes(frame)
+        else:
+            await self.websocket.send_text(dumps_with_base64(message, "audio", frame))
+        self.audio_bytes_sent += len(frame) if frame is not None else 0
+
+    async def run(self):
+        """Send loop; returns when the socket fails"""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                if self._control:
+                    await send_message(self.websocket, self._control.popleft())
+                    self.control_sent += 1
+                    continue
+                delay = None
+                if self._audio:
+                    now = loop.time()
+                    delay = self._played_until - now - self.lead_ms / 1000
+                    if delay <= 0:
+                        message, frame, duration_ms = self._audio.popleft()
+                        self._queued_ms -= duration_ms
+                        self._queued_bytes -= len(frame) if frame is not None else 0
+                        self._space.set()
+                        await self._send_audio(message, frame)
+                        self._played_until = max(self._played_until, now) + duration_ms / 1000
+                        self.audio_sent += 1
+                        if self.on_audio_sent is not None:
+                            self.on_audio_sent(message)
+                        continue
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+        except Exception as e:
+            logger.error(f"Outbound send error: {e}")
+        finally:
+            self.close()
+
+    def stats(self) -> dict:
+        return {
+            "audio_format": "binary" if self.binary_audio else "json",
+            "control_sent": self.control_sent,
+            "audio_sent": self.audio_sent,
+            "audio_bytes_sent": self.audio_bytes_sent,
+            "audio_dropped": self.audio_dropped,
+            "queued_ms": round(self._queued_ms, 1),
+            "queued_bytes": self._queued_bytes,
+            "max_queued_ms": round(self.max_queued_ms, 1),
+            "peak_queued_bytes": self.peak_queued_bytes
+        }
+
+    def close(self):
+        """Stop accepting messages and release producers waiting for buffer space"""
+        self.closed = True
+        self._control.clear()
+        self._audio.clear()
+        self._queued_ms = 0.0
+        self._queued_bytes = 0
+        self._space.set()
@@ -5,31 +5,64 @@ import asyncio
 import logging
 import os
 from typing import Optional, Dict
+from urllib.parse import urlencode
 import httpx
 
+from call_events_service import call_event
+
 logger = logging.getLogger(__name__)
 
 class PhoneIntegrationService:
     """Phone calling service supporting Vapi, Twilio, and Exotel"""
     
-    def __init__(self):
+    def __init__(self, call_events=None):
+        self.call_events = call_events
+        # Public URL of this API, used for provider status callbacks (e.g. https://api.example.com)
+        self.webhook_base_url = (os.getenv("PUBLIC_BASE_URL") or "").rstrip("/")
+        self._client: Optional[httpx.AsyncClient] = None
         self.vapi_key = os.getenv("VAPI_API_KEY")
         self.twilio_account_sid = os.getenv("TWILIO_ACCOUNT_SID")
         self.twilio_auth_token = os.getenv("TWILIO_AUTH_TOKEN")
         self.twilio_phone = os.getenv("TWILIO_PHONE_NUMBER")
         self.exotel_api_key = os.getenv("EXOTEL_API_KEY")
         self.exotel_api_token = os.getenv("EXOTEL_API_TOKEN")
+        # Exotel does not sign callbacks; this token rides in the StatusCallback URL instead
+        self.exotel_webhook_token = os.getenv("EXOTEL_WEBHOOK_TOKEN")
+
+    def _http(self) -> httpx.AsyncClient:
+        """Shared client so status checks reuse pooled connections"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=10)
+        return self._client
+
+    def media_stream_twiml(self, agent_id: str) -> str:
+        """TwiML that streams the call's audio to /ws/twilio/media/{agent_id}"""
+        stream_url = self.webhook_base_url.replace("https://", "wss://").replace("http://", "ws://")
+        return (
+            "<Response><Connect>"
+            f'<Stream url="{stream_url}/ws/twilio/media/{agent_id}" />'
+            "</Connect></Response>"
+        )
+
+    def _webhook_url(self, provider: str) -> Optional[str]:
+        if not self.webhook_base_url:
+            return None
+        url = f"{self.webhook_base_url}/phone/webhooks/{provider}"
+        if provider == "exotel" and self.exotel_webhook_token:
+            url += "?" + urlencode({"token": self.exotel_webhook_token})
+        return url
 
     async def make_call(
         self,
         phone_number: str,
         agent_id: str,
         provider: str = "vapi",
-        message: Optional[str] = None
+        message: Optional[str] = None,
+        fallback: bool = True
     ) -> dict:
-        """Make outbound call using specified provider"""
+        """Make outbound call using specified provider (falling back to the others unless fallback=False)"""
         try:
-            providers_to_try = [provider, "vapi", "twilio", "exotel"]
+            providers_to_try = [provider, "vapi", "twilio", "exotel"] if fallback else [provider]
             
             for prov in providers_to_try:
                 if prov == "vapi":
@@ -57,20 +90,23 @@ class PhoneIntegrationService:
     ) -> Optional[dict]:
         """Make call using Vapi (AI-native calling platform)"""
         try:
+            payload = {
+                "phoneNumber": phone_number,
+                "assistantId": agent_id,
+                "messages": [
+                    {
+                        "role": "system",
+                        "content": message or "You are a helpful voice agent"
+                    }
+                ]
+            }
+            if self._webhook_url("vapi"):
+                payload["assistantOverrides"] = {"serverUrl": self._webhook_url("vapi")}
             async with httpx.AsyncClient() as client:
                 response = await client.post(
                     "https://api.vapi.ai/call/phone",
                     headers={"Authorization": f"Bearer {self.vapi_key}"},
-                    json={
-                        "phoneNumber": phone_number,
-                        "assistantId": agent_id,
-                        "messages": [
-                            {
-                                "role": "system",
-                                "content": message or "You are a helpful voice agent"
-                            }
-                        ]
-                    }
+                    json=payload
                 )
                 
                 if response.status_code == 200:
@@ -94,16 +130,25 @@ class PhoneIntegrationService:
     ) -> Optional[dict]:
         """Make call using Twilio (widely supported, requires payment)"""
         try:
+            data = {
+                "From": self.twilio_phone,
+                "To": phone_number
+            }
+            if self.webhook_base_url:
+                # Connect the call's audio straight to our media bridge
+                data["Twiml"] = self.media_stream_twiml(agent_id)
+            else:
+                data["Url"] = "https://handler.twilio.com/twiml/callback"
+            if self._webhook_url("twilio"):
+                data["StatusCallback"] = self._webhook_url("twilio")
+                data["StatusCallbackMethod"] = "POST"
+                data["StatusCallbackEvent"] = ["initiated", "ringing", "answered", "completed"]
             async with httpx.AsyncClient() as client:
                 auth = (self.twilio_account_sid, self.twilio_auth_token)
                 response = await client.post(
                     f"https://api.twilio.com/2010-04-01/Accounts/{self.twilio_account_sid}/Calls.json",
                     auth=auth,
-                    data={
-                        "From": self.twilio_phone,
-                        "To": phone_number,
-                        "Url": "https://handler.twilio.com/twiml/callback"
-                    }
+                    data=data
                 )
                 
                 if response.status_code in [200, 201]:
@@ -127,15 +172,19 @@ class PhoneIntegrationService:
     ) -> Optional[dict]:
         """Make call using Exotel (India-focused communication platform)"""
         try:
+            data = {
+                "From": os.getenv("EXOTEL_CALLER_ID"),
+                "To": phone_number,
+                "CallerId": os.getenv("EXOTEL_CALLER_ID")
+            }
+            if self._webhook_url("exotel"):
+                data["StatusCallback"] = self._webhook_url("exotel")
+                data["StatusCallbackEvents[0]"] = "terminal"
             async with httpx.AsyncClient() as client:
                 response = await client.post(
                     "https://api.exotel.com/v1/Accounts/{account_sid}/Calls/connect.json",
                     auth=(self.exotel_api_key, self.exotel_api_token),
-                    data={
-                        "From": os.getenv("EXOTEL_CALLER_ID"),
-                        "To": phone_number,
-                        "CallerId": os.getenv("EXOTEL_CALLER_ID")
-                    }
+                    data=data
                 )
                 
                 if response.status_code in [200, 201]:
@@ -151,38 +200,60 @@ class PhoneIntegrationService:
             logger.error(f"Exotel call error: {e}")
         return None
 
-    async def get_call_status(self, call_id: str, provider: str) -> dict:
-        """Get status of ongoing call"""
+    async def get_call_status(self, call_id: str, provider: str, refresh: bool = False) -> dict:
+        """Get status of a call from the webhook-fed state table, asking the provider only when unknown"""
+        if self.call_events and not refresh:
+            state = self.call_events.get_call(call_id)
+            if state:
+                return {
+                    "call_id": call_id,
+                    "status": state["status"],
+                    "ended_reason": state.get("ended_reason"),
+                    "duration": state.get("duration"),
+                    "provider": state["provider"],
+                    "source": "events"
+                }
+
+        result = await self._fetch_call_status(call_id, provider)
+        if self.call_events and "error" not in result:
+            await self.call_events.ingest(call_event(
+                call_id, provider, result.get("status"), result.get("ended_reason"),
+                result.get("duration"), event_type="poll"
+            ))
+        return result
+
+    async def _fetch_call_status(self, call_id: str, provider: str) -> dict:
+        """Ask the provider's REST API for a call's status"""
         try:
+            client = self._http()
             if provider == "vapi":
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(
-                        f"https://api.vapi.ai/call/{call_id}",
-                        headers={"Authorization": f"Bearer {self.vapi_key}"}
-                    )
-                    if response.status_code == 200:
-                        data = response.json()
-                        return {
-                            "call_id": call_id,
-                            "status": data.get("status"),
-                            "duration": data.get("duration"),
-                            "provider": "vapi"
-                        }
+                response = await client.get(
+                    f"https://api.vapi.ai/call/{call_id}",
+                    headers={"Authorization": f"Bearer {self.vapi_key}"}
+                )
+                if response.status_code == 200:
+                    data = response.json()
+                    return {
+                        "call_id": call_id,
+                        "status": data.get("status"),
+                        "ended_reason": data.get("endedReason"),
+                        "duration": data.get("duration"),
+                        "provider": "vapi"
+                    }
             elif provider == "twilio":
-                async with httpx.AsyncClient() as client:
-                    auth = (self.twilio_account_sid, self.twilio_auth_token)
-                    response = await client.get(
-                        f"https://api.twilio.com/2010-04-01/Accounts/{self.twilio_account_sid}/Calls/{call_id}.json",
-                        auth=auth
-                    )
-                    if response.status_code == 200:
-                        data = response.json()
-                        return {
-                            "call_id": call_id,
-                            "status": data.get("status"),
-                            "duration": data.get("duration"),
-                            "provider": "twilio"
-                        }
+                auth = (self.twilio_account_sid, self.twilio_auth_token)
+                response = await client.get(
+                    f"https://api.twilio.com/2010-04-01/Accounts/{self.twilio_account_sid}/Calls/{call_id}.json",
+                    auth=auth
+                )
+                if response.status_code == 200:
+                    data = response.json()
+                    return {
+                        "call_id": call_id,
+                        "status": data.get("status"),
+                        "duration": data.get("duration"),
+                        "provider": "twilio"
+                    }
         except Exception as e:
             logger.error(f"Get call status error: {e}")
         
@@ -0,0 +1,171 @@
+# Prompt Bank Service
+# Pre-synthesized fixed phrases (openings, hold messages, closings) per agent, stored as Opus
+
+import asyncio
+import hashlib
+import logging
+from typing import Optional, Dict
+
+from state_backend import StateBackend, SQLiteStateBackend
+
+logger = logging.getLogger(__name__)
+
+# Agent fields that change how a prompt sounds
+RENDER_FIELDS = ["voice_id", "tts_provider", "language", "supported_languages", "prompts"]
+
+
+class PromptBankService:
+    """Renders declared agent phrases ahead of time so playback is a lookup"""
+
+    def __init__(self, tts_service, voice_cloning_service, state: Optional[StateBackend] = None):
+        self.tts_service = tts_service
+        self.voice_cloning_service = voice_cloning_service
+        # Rendered audio and indexes live in the shared state backend so any worker can play them
+        self.state = state or SQLiteStateBackend()
+        # Process-local copies of rendered audio: {(agent_id, key, language): (fingerprint, bytes)}
+        self._cache: Dict[tuple, tuple] = {}
+        self._jobs: Dict[str, asyncio.Task] = {}
+
+    # State-backend calls block (SQLite, Redis), so they run in a worker thread
+    async def _load_index(self, agent_id: str) -> dict:
+        return await asyncio.to_thread(self.state.get_json, "prompt_index", agent_id) or {}
+
+    async def _save_index(self, agent_id: str, index: dict):
+        await asyncio.to_thread(self.state.set_json, "prompt_index", agent_id, index)
+
+    @staticmethod
+    def _phrases(agent: dict) -> Dict[tuple, str]:
+        """Expand agent prompts into {(key, language): text}"""
+        languages = agent.get("supported_languages") or [agent.get("language", "hi")]
+        phrases = {}
+        for key, text in (agent.get("prompts") or {}).items():
+            for language in languages:
+                # A prompt is either one text for all languages or a per-language mapping
+                phrase = text.get(language) if isinstance(text, dict) else text
+                if phrase:
+                    phrases[(key, language)] = phrase
+        return phrases
+
+    @staticmethod
+    def _fingerprint(agent: dict, language: str, text: str) -> str:
+        source = "|".join([text, language, str(agent.get("voice_id")), str(agent.get("tts_provider"))])
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def needs_rerender(previous: dict, updated: dict) -> bool:
+        """Whether an agent update changed anything that affects rendered prompts"""
+        return any(previous.get(field) != updated.get(field) for field in RENDER_FIELDS)
+
+    def schedule_render(self, agent: dict) -> asyncio.Task:
+        """Render prompts in the background, replacing any render already running for the agent"""
+        agent_id = agent["id"]
+        running = self._jobs.get(agent_id)
+        if running and not running.done():
+            running.cancel()
+        task = asyncio.create_task(self.render_agent(agent))
+        self._jobs[agent_id] = task
+        return task
+
+    async def render_agent(self, agent: dict) -> dict:
+        """Render every declared phrase for each supported language, skipping unchanged ones"""
+        agent_id = agent["id"]
+        index = await self._load_index(agent_id)
+        phrases = self._phrases(agent)
+        rendered, failed = 0, 0
+
+        for (key, language), text in phrases.items():
+            fingerprint = self._fingerprint(agent, language, text)
+            entry = index.get(key, {}).get(language)
+            if entry and entry["fingerprint"] == fingerprint:
+                continue
+            try:
+                audio = await self._synthesize(agent, text, language)
+                opus = await encode_opus(audio)
+                filename = f"{key}.{language}.opus"
+                await asyncio.to_thread(self.state.set, "prompts", f"{agent_id}/{filename}", opus)
+                index.setdefault(key, {})[language] = {
+                    "file": filename,
+                    "fingerprint": fingerprint,
+                    "text": text,
+                    "bytes": len(opus)
+                }
+                self._cache[(agent_id, key, language)] = (fingerprint, opus)
+                rendered += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error rendering prompt {key}/{language} for agent {agent_id}: {e}")
+                failed += 1
+
+        # Drop phrases the agent no longer declares
+        for key in list(index):
+            for language in list(index[key]):
+                if (key, language) not in phrases:
+                    await self._remove_file(agent_id, index[key].pop(language)["file"])
+                    self._cache.pop((agent_id, key, language), None)
+            if not index[key]:
+                del index[key]
+
+        await self._save_index(agent_id, index)
+        logger.info(f"Prompt bank for agent {agent_id}: {rendered} rendered, {failed} failed")
+        return {"success": failed == 0, "rendered": rendered, "failed": failed}
+
+    async def _synthesize(self, agent: dict, text: str, language: str) -> bytes:
+        if agent.get("voice_id"):
+            chunks = self.voice_cloning_service.synthesize_stream_with_cloned_voice(
+                text, agent["voice_id"], language
+            )
+        else:
+            chunks = self.tts_service.synthesize_stream(
+                text, language, model=agent.get("tts_provider", "replicate_xtts")
+            )
+        audio = b"".join([chunk async for chunk in chunks])
+        if not audio:
+            raise Exception("TTS returned no audio")
+        return audio
+
+    async def _remove_file(self, agent_id: str, filename: str):
+        await asyncio.to_thread(self.state.delete, "prompts", f"{agent_id}/{filename}")
+
+    async def get_prompt(self, agent_id: str, key: str, language: str) -> Optional[bytes]:
+        """Look up a pre-rendered phrase (Ogg/Opus bytes), or None if it is not rendered"""
+        entry = (await self._load_index(agent_id)).get(key, {}).get(language)
+        if not entry:
+            return None
+        # The index fingerprint tells us whether another worker re-rendered the phrase
+        cache_key = (agent_id, key, language)
+        cached = self._cache.get(cache_key)
+        if cached is None or cached[0] != entry["fingerprint"]:
+            audio = await asyncio.to_thread(self.state.get, "prompts", f"{agent_id}/{entry['file']}")
+            if audio is None:
+                return None
+            cached = self._cache[cache_key] = (entry["fingerprint"], audio)
+        return cached[1]
+
+    async def list_prompts(self, agent_id: str) -> dict:
+        """List rendered phrases for an agent"""
+        return await self._load_index(agent_id)
+
+    async def delete_agent_prompts(self, agent_id: str):
+        """Remove all rendered phrases for an agent"""
+        for key, languages in (await self._load_index(agent_id)).items():
+            for language, entry in languages.items():
+                await self._remove_file(agent_id, entry["file"])
+                self._cache.pop((agent_id, key, language), None)
+        await asyncio.to_thread(self.state.delete, "prompt_index", agent_id)
+
+
+async def encode_opus(audio: bytes, bitrate: str = "24k") -> bytes:
+    """Transcode any ffmpeg-readable audio to compact mono Ogg/Opus"""
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-i", "pipe:0", "-ac", "1", "-c:a", "libopus", "-b:a", bitrate,
+        "-application", "voip", "-f", "ogg", "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate(audio)
+    if process.returncode != 0:
+        raise Exception(f"Opus encoding failed: {stderr.decode(errors='ignore')}")
+    return stdout
@@ -0,0 +1,135 @@
+# Prompt Compiler
+# Builds each agent's final system prompt once per (agent version, language, channel) and caches it with a
+# token count and stable hash, so per-turn calls reuse a byte-identical prefix that provider prompt caches hit
+
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    _ENCODING = None
+
+LANGUAGE_CONTEXT = {
+    "hi": "You are speaking in Hindi. Use appropriate Hindi grammar and phrases.",
+    "ta": "You are speaking in Tamil. Use appropriate Tamil grammar and phrases.",
+    "te": "You are speaking in Telugu. Use appropriate Telugu grammar and phrases.",
+    "kn": "You are speaking in Kannada. Use appropriate Kannada grammar and phrases.",
+    "ml": "You are speaking in Malayalam. Use appropriate Malayalam grammar and phrases.",
+    "bn": "You are speaking in Bengali. Use appropriate Bengali grammar and phrases.",
+    "gu": "You are speaking in Gujarati. Use appropriate Gujarati grammar and phrases.",
+    "mr": "You are speaking in Marathi. Use appropriate Marathi grammar and phrases.",
+    "en": "You are speaking in Indian English. Use Indian English vocabulary and expressions.",
+}
+CLOSING = "Always be respectful, helpful, and culturally sensitive."
+CHANNEL_INSTRUCTIONS = {
+    "web": "Keep every response under 50 words.",
+    "phone": "You are on a phone call. Keep every response under 50 words.",
+}
+MAX_FEW_SHOT_EXAMPLES = 8
+CACHE_SIZE = 2048
+
+
+def count_tokens(text: str) -> int:
+    """Token count with tiktoken when installed, otherwise a bytes-based estimate"""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    # UTF-8 bytes track tokenizer cost of Indic scripts better than characters do
+    return max(1, len(text.encode()) // 4)
+
+
+def _base_language(language: str) -> str:
+    return language.split("-")[0].lower()
+
+
+def build_system_prompt(
+    system_instruction: str,
+    language: str,
+    few_shot_examples: Optional[List[dict]] = None,
+    channel: Optional[str] = None
+) -> str:
+    """The system prompt text: instruction, language context, style, then few-shot examples"""
+    base = _base_language(language)
+    sections = [system_instruction.strip()]
+    if base in LANGUAGE_CONTEXT:
+        sections.append(LANGUAGE_CONTEXT[base])
+    sections.append(CLOSING)
+    if channel in CHANNEL_INSTRUCTIONS:
+        sections.append(CHANNEL_INSTRUCTIONS[channel])
+
+    # Examples tagged with another language are left out; untagged ones apply to every language
+    examples = [
+        example for example in few_shot_examples or []
+        if not example.get("language") or _base_language(example["language"]) == base
+    ][:MAX_FEW_SHOT_EXAMPLES]
+    if examples:
+        lines = ["Example exchanges:"]
+        for example in examples:
+            lines.append(f"Caller: {example['user'].strip()}")
+            lines.append(f"Agent: {example['assistant'].strip()}")
+        sections.append("\n".join(lines))
+    return "\n\n".join(sections)
+
+
+def agent_version(agent: dict) -> str:
+    """Identifies an agent revision; agents without a version counter fall back to a content hash"""
+    version = agent.get("version") or agent.get("updated_at")
+    if version:
+        return str(version)
+    content = repr((agent.get("system_instruction"), agent.get("few_shot_examples")))
+    return hashlib.sha1(content.encode()).hexdigest()[:12]
+
+
+class PromptCompiler:
+    """Compiled system prompts keyed by (agent id, version, language, channel), LRU-bounded
+
+    An agent update bumps its version, so stale prompts are never served even by workers that
+    missed the invalidation; `invalidate` just frees their memory early.
+    """
+
+    def __init__(self, max_entries: int = CACHE_SIZE):
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[tuple, dict]" = OrderedDict()
+        self.hits = 0
+        self.compiles = 0
+
+    def compile(self, agent: dict, language: str, channel: Optional[str] = "web") -> dict:
+        """{"text", "hash", "tokens", "version", "language"} for the agent's system prompt"""
+        key = (agent.get("id"), agent_version(agent), _base_language(language), channel)
+        compiled = self._cache.get(key)
+        if compiled is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return compiled
+
+        text = build_system_prompt(
+            agent.get("system_instruction", ""), language, agent.get("few_shot_examples"), channel
+        )
+        compiled = {
+            "text": text,
+            # Stable across processes and restarts (unlike hash()), e.g. for provider cache keys
+            "hash": hashlib.sha256(text.encode()).hexdigest()[:16],
+            "tokens": count_tokens(text),
+            "version": key[1],
+            "language": key[2],
+        }
+        self._cache[key] = compiled
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        self.compiles += 1
+        return compiled
+
+    def invalidate(self, agent_id: str) -> int:
+        """Drop every compiled prompt of an agent; returns how many were dropped"""
+        keys = [key for key in self._cache if key[0] == agent_id]
+        for key in keys:
+            del self._cache[key]
+        return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._cache), "hits": self.hits, "compiles": self.compiles}
@@ -0,0 +1,86 @@
+# Serialization
+# Fast JSON for REST responses and WebSocket frames: orjson when installed, stdlib json otherwise
+
+import binascii
+import json
+import logging
+from typing import Any, Union
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    logger.warning("orjson not installed, falling back to stdlib json")
+
+BACKEND = "orjson" if orjson else "json"
+
+
+def _default(obj: Any):
+    """Serialize values plain JSON has no type for (numpy scalars, sets)"""
+    if hasattr(obj, "item"):
+        return obj.item()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+if orjson:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize to UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        """Parse JSON from str or bytes"""
+        return orjson.loads(data)
+
+    def dumps_str(obj: Any) -> str:
+        """Serialize to a JSON str (for WebSocket text frames and SSE)"""
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode("utf-8")
+else:
+    def dumps(obj: Any) -> bytes:
+        """Serialize to UTF-8 JSON bytes"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+        """Parse JSON from str or bytes"""
+        return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+    def dumps_str(obj: Any) -> str:
+        """Serialize to a JSON str (for WebSocket text frames and SSE)"""
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_with_base64(message: dict, field: str, data: Union[bytes, bytearray, memoryview]) -> str:
+    """`message` plus `field` holding `data` as base64, as a JSON str
+
+    Encodes straight from any buffer (e.g. a memoryview frame) and splices the result in, instead of
+    b64encode + decode + a serializer pass over the whole base64 string.
+    """
+    encoded = binascii.b2a_base64(data, newline=False).decode("ascii")
+    head = dumps_str(message)
+    return f'{head[:-1]},"{field}":"{encoded}"}}' if len(head) > 2 else f'{{"{field}":"{encoded}"}}'
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with the fast serializer; used as the apps' default response class"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+async def send_message(websocket, message: dict):
+    """Send a JSON text frame"""
+    await websocket.send_text(dumps_str(message))
+
+
+async def receive_message(websocket) -> Any:
+    """Receive and parse a JSON text frame"""
+    return loads(await websocket.receive_text())
@@ -0,0 +1,66 @@
+# Single Flight
+# Request coalescing: concurrent calls with the same key share one in-flight execution and its result
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Deduplicates identical concurrent async calls (e.g. the same greeting synthesized by 200 calls at once)
+
+    The shared call runs in its own task, so one waiter being cancelled (a caller hanging up, a
+    barge-in) does not cancel it for the others; it is cancelled only when its last waiter leaves.
+    Waiters receive the same result object and must treat it as read-only.
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._flights: Dict[Hashable, _Flight] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Run `fn()` unless a call with `key` is already in flight, then wait for that call's result"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(fn()))
+            flight.task.add_done_callback(lambda task: self._forget(key, flight))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                # Nobody else wants the result: stop the work and let the next caller start afresh
+                self._forget(key, flight)
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def forget(self, key: Hashable):
+        """Make later calls with `key` start afresh (e.g. after a write); current waiters are unaffected"""
+        self._flights.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._flights), "calls": self.calls, "coalesced": self.coalesced}
@@ -0,0 +1,139 @@
+# Speaker Verification Service
+# CPU speaker verification: MFCC-statistics embeddings, normalized against the enrolled population and
+# scored with vectorized cosine similarity
+
+import asyncio
+import logging
+import os
+import re
+from typing import Optional, List, Dict
+
+import numpy as np
+
+from audio_processing import load_audio, speaker_embedding, DEFAULT_SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# Raw MFCC statistics share most of their shape across all voices (different speakers score ~0.9
+# cosine), so each dimension is mean/variance-normalized against every enrolled utterance first.
+# Threshold chosen by scoring synthetic source-filter voices through this service (20 speakers,
+# 3 enrollments and 2 test utterances of 3 s each, two seeds): the equal-error point is ~0.5 (~10%),
+# 0.6 accepts ~5% of impostors and rejects ~30% of genuine utterances, and the old raw-cosine 0.80
+# accepted most impostors. Agents trading convenience for security raise it per agent.
+DEFAULT_THRESHOLD = 0.60
+MAX_ENROLLMENTS = 20
+# Population statistics from fewer speakers than this are too noisy to normalize with
+MIN_BACKGROUND_SPEAKERS = 3
+
+
+class SpeakerVerificationService:
+    """Enroll speakers and verify utterances against their enrolled embeddings"""
+
+    def __init__(self):
+        self.enrollment_dir = "/tmp/speaker_enrollments"
+        os.makedirs(self.enrollment_dir, exist_ok=True)
+        self._enrollments: Dict[str, np.ndarray] = {}
+        # (mean, std) per embedding dimension over all enrollments; None until computed
+        self._background: Optional[tuple] = None
+
+    def _path(self, speaker_id: str) -> str:
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", speaker_id)
+        return os.path.join(self.enrollment_dir, f"{safe_id}.npy")
+
+    def _enrolled(self, speaker_id: str) -> Optional[np.ndarray]:
+        """Enrolled embeddings (n, dim) for a speaker, cached in memory"""
+        if speaker_id not in self._enrollments:
+            path = self._path(speaker_id)
+            if not os.path.exists(path):
+                return None
+            self._enrollments[speaker_id] = np.load(path)
+        return self._enrollments[speaker_id]
+
+    @staticmethod
+    def embed(audio_path: str) -> np.ndarray:
+        """Speaker embedding for one audio file"""
+        return speaker_embedding(load_audio(audio_path, DEFAULT_SAMPLE_RATE), DEFAULT_SAMPLE_RATE)
+
+    def embed_batch(self, audio_paths: List[str]) -> np.ndarray:
+        """Embeddings for several files as an (n, dim) matrix"""
+        return np.stack([self.embed(path) for path in audio_paths])
+
+    async def enroll(self, speaker_id: str, audio_paths: List[str]) -> dict:
+        """Enroll one or more utterances for a speaker (keeps the most recent MAX_ENROLLMENTS)"""
+        try:
+            embeddings = await asyncio.to_thread(self.embed_batch, audio_paths)
+            existing = self._enrolled(speaker_id)
+            if existing is not None:
+                embeddings = np.vstack([existing, embeddings])
+            embeddings = embeddings[-MAX_ENROLLMENTS:]
+            np.save(self._path(speaker_id), embeddings)
+            self._enrollments[speaker_id] = embeddings
+            self._background = None
+            return {"success": True, "speaker_id": speaker_id, "enrollments": int(embeddings.shape[0])}
+        except Exception as e:
+            logger.error(f"Speaker enrollment error: {e}")
+            return {"success": False, "error": str(e)}
+
+    def _population(self) -> Optional[tuple]:
+        """(mean, std) per dimension over every enrolled utterance, or None with too few speakers"""
+        if self._background is None:
+            files = [name for name in os.listdir(self.enrollment_dir) if name.endswith(".npy")]
+            if len(files) < MIN_BACKGROUND_SPEAKERS:
+                return None
+            embeddings = np.vstack([np.load(os.path.join(self.enrollment_dir, name)) for name in files])
+            self._background = (embeddings.mean(axis=0), embeddings.std(axis=0) + 1e-6)
+        return self._background
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray, population: tuple) -> np.ndarray:
+        mean, std = population
+        normalized = (embeddings - mean) / std
+        return normalized / (np.linalg.norm(normalized, axis=-1, keepdims=True) + 1e-8)
+
+    def _score(self, embeddings: np.ndarray, enrolled: np.ndarray) -> np.ndarray:
+        """Per-utterance score: mean of best-matching and centroid cosine similarity"""
+        similarities = embeddings @ enrolled.T
+        centroid = enrolled.mean(axis=0)
+        centroid /= np.linalg.norm(centroid) + 1e-8
+        return 0.5 * (similarities.max(axis=1) + embeddings @ centroid)
+
+    async def verify(self, audio_path: str, speaker_id: str, threshold: Optional[float] = None) -> dict:
+        """Verify one utterance against a speaker's enrollments"""
+        results = await self.verify_batch([audio_path], speaker_id, threshold)
+        return results[0]
+
+    async def verify_batch(self, audio_paths: List[str], speaker_id: str, threshold: Optional[float] = None) -> List[dict]:
+        """Verify several utterances against a speaker in one matrix product"""
+        threshold = DEFAULT_THRESHOLD if threshold is None else threshold
+        enrolled = self._enrolled(speaker_id)
+        if enrolled is None:
+            return [{"speaker_verified": False, "confidence": 0.0, "error": "Speaker not enrolled"} for _ in audio_paths]
+        population = await asyncio.to_thread(self._population)
+        if population is None:
+            error = f"At least {MIN_BACKGROUND_SPEAKERS} enrolled speakers are needed to score verification"
+            return [{"speaker_verified": False, "confidence": 0.0, "error": error} for _ in audio_paths]
+        try:
+            embeddings = await asyncio.to_thread(self.embed_batch, audio_paths)
+            scores = self._score(self._normalize(embeddings, population), self._normalize(enrolled, population))
+            return [
+                {
+                    "speaker_verified": bool(score >= threshold),
+                    "confidence": round(float(score), 4),
+                    "threshold": threshold,
+                    "speaker_id": speaker_id
+                }
+                for score in scores
+            ]
+        except Exception as e:
+            logger.error(f"Speaker verification error: {e}")
+            return [{"speaker_verified": False, "confidence": 0.0, "error": str(e)} for _ in audio_paths]
+
+    def delete_speaker(self, speaker_id: str) -> bool:
+        """Remove a speaker's enrollments"""
+        self._enrollments.pop(speaker_id, None)
+        self._background = None
+        path = self._path(speaker_id)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
@@ -0,0 +1,131 @@
+# Speculative LLM Prefetch
+# Start generating a response on a stable partial transcript and commit it only if the final transcript matches
+
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIDENCE_THRESHOLD = 0.85
+DEFAULT_COST_CAP_TOKENS = 2000
+MAX_SPECULATIONS_PER_TURN = 3
+
+
+def normalize_transcript(text: str) -> str:
+    """Normalize a transcript for comparison (case, punctuation, whitespace)"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate used for the speculation cost cap"""
+    return max(1, len(text) // 4)
+
+
+class SpeculativeResponder:
+    """Per-session speculative generation with a confidence threshold and a cap on wasted tokens
+
+    `generate(text, elapsed_ms=..., route=...)` takes the same routing arguments as a direct call;
+    `route` is a dict it fills with the model choice.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[..., Awaitable[str]],
+        confidence_threshold: float = DEFAULT_CONFIDENCE_THRESHOLD,
+        cost_cap_tokens: int = DEFAULT_COST_CAP_TOKENS
+    ):
+        self.generate = generate
+        self.confidence_threshold = confidence_threshold
+        self.cost_cap_tokens = cost_cap_tokens
+        self.wasted_tokens = 0
+        self.stats = {"launched": 0, "committed": 0, "discarded": 0}
+        self._task: Optional[asyncio.Task] = None
+        self._text: Optional[str] = None
+        self._route: dict = {}
+        self._last_partial: Optional[str] = None
+        self._launches = 0
+
+    @classmethod
+    def for_agent(cls, agent: dict, generate: Callable[..., Awaitable[str]]) -> Optional["SpeculativeResponder"]:
+        """Build a responder from agent settings, or None if speculation is disabled"""
+        if not agent.get("speculative_mode"):
+            return None
+        return cls(
+            generate,
+            confidence_threshold=agent.get("speculative_confidence_threshold", DEFAULT_CONFIDENCE_THRESHOLD),
+            cost_cap_tokens=agent.get("speculative_cost_cap", DEFAULT_COST_CAP_TOKENS)
+        )
+
+    def on_partial(self, text: str, confidence: float = 1.0, stable: bool = False):
+        """Feed an interim transcript; launches a speculation once it is stable and confident"""
+        normalized = normalize_transcript(text)
+        if not normalized:
+            return
+        # A partial is stable when the provider says so or it repeats unchanged
+        is_stable = stable or normalized == self._last_partial
+        self._last_partial = normalized
+
+        if not is_stable or confidence < self.confidence_threshold:
+            return
+        if normalized == self._text:
+            return
+        if self._launches >= MAX_SPECULATIONS_PER_TURN or self.wasted_tokens >= self.cost_cap_tokens:
+            return
+
+        self._discard()
+        self._text = normalized
+        self._launches += 1
+        self.stats["launched"] += 1
+        # Launched before the turn ends, so no turn time has been spent yet
+        self._route = {}
+        self._task = asyncio.create_task(self.generate(text, elapsed_ms=0.0, route=self._route))
+
+    async def resolve(self, final_text: str, elapsed_ms: float = 0.0, route: Optional[dict] = None) -> str:
+        """Return the response for the final transcript, reusing the speculation when it matches
+
+        `route` receives the model choice of whichever generation produced the response.
+        """
+        task, text, speculative_route = self._task, self._text, self._route
+        self._task, self._text, self._route = None, None, {}
+        self._last_partial = None
+        self._launches = 0
+
+        if task is not None and text == normalize_transcript(final_text):
+            try:
+                response = await task
+                if response:
+                    self.stats["committed"] += 1
+                    if route is not None:
+                        route.update(speculative_route)
+                    return response
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Speculative generation failed: {e}")
+        elif task is not None:
+            self._cancel(task, text)
+
+        return await self.generate(final_text, elapsed_ms=elapsed_ms, route=route)
+
+    def _discard(self):
+        if self._task is not None:
+            self._cancel(self._task, self._text)
+        self._task, self._text = None, None
+
+    def _cancel(self, task: asyncio.Task, text: Optional[str]):
+        """Cancel a mismatched speculation and charge its cost against the cap"""
+        spent = estimate_tokens(text or "")
+        if task.done() and not task.cancelled() and task.exception() is None:
+            spent += estimate_tokens(task.result() or "")
+        else:
+            task.cancel()
+        self.wasted_tokens += spent
+        self.stats["discarded"] += 1
+
+    def cancel(self):
+        """Drop any pending speculation (e.g. when the session closes)"""
+        self._discard()
+        self._last_partial = None
+        self._launches = 0
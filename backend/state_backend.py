@@ -0,0 +1,254 @@
+# State Backend
+# Pluggable shared state (agents, voices, prompt caches, live sessions) for multi-worker / multi-node deployments
+
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Identifies this worker process in session routes and leases
+NODE_ID = os.getenv("NODE_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Identifies the machine (or container) whose local disk this process shares with its siblings
+HOST_ID = os.getenv("HOST_ID") or socket.gethostname()
+
+
+class StateBackend:
+    """Namespaced key -> bytes store shared by every worker of a deployment
+
+    Values may carry a TTL. JSON helpers and leases are built on the primitives below.
+    """
+
+    name = "base"
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str) -> bool:
+        raise NotImplementedError
+
+    def items(self, namespace: str) -> Dict[str, bytes]:
+        """Every live key in a namespace"""
+        raise NotImplementedError
+
+    def incr(self, namespace: str, key: str) -> int:
+        """Atomically increment a counter and return the new value"""
+        raise NotImplementedError
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Take or renew an exclusive lease; False while another owner holds it"""
+        raise NotImplementedError
+
+    def get_json(self, namespace: str, key: str) -> Optional[Any]:
+        value = self.get(namespace, key)
+        return loads(value) if value is not None else None
+
+    def set_json(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        self.set(namespace, key, dumps(value), ttl)
+
+    def list_json(self, namespace: str) -> List[Any]:
+        return [loads(value) for value in self.items(namespace).values()]
+
+
+class SQLiteStateBackend(StateBackend):
+    """Single-node backend: one SQLite file shared by all worker processes on the host (WAL mode)"""
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str = "/tmp/state.db"):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS state (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value BLOB NOT NULL,
+                    expires_at REAL,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (namespace, key, time.time())
+            ).fetchone()
+        return bytes(row["value"]) if row else None
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (namespace, key, value, expires_at)
+            )
+
+    def delete(self, namespace: str, key: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute(
+                "DELETE FROM state WHERE namespace = ? AND key = ?", (namespace, key)
+            ).rowcount > 0
+
+    def items(self, namespace: str) -> Dict[str, bytes]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM state WHERE namespace = ? AND expires_at <= ?", (namespace, now))
+            rows = conn.execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,)).fetchall()
+        return {row["key"]: bytes(row["value"]) for row in rows}
+
+    def incr(self, namespace: str, key: str) -> int:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT value FROM state WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+            value = int(bytes(row["value"])) + 1 if row else 1
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES (?, ?, ?, NULL)",
+                (namespace, key, str(value).encode())
+            )
+        return value
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT value, expires_at FROM state WHERE namespace = 'leases' AND key = ?", (name,)
+            ).fetchone()
+            if row and row["expires_at"] > now and bytes(row["value"]).decode() != owner:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO state (namespace, key, value, expires_at) VALUES ('leases', ?, ?, ?)",
+                (name, owner.encode(), now + ttl)
+            )
+        return True
+
+
+class RedisStateBackend(StateBackend):
+    """Multi-node backend on any Redis-compatible server (Redis, Valkey, Memorystore, KeyDB)"""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "voiceagent"):
+        import redis
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+        # Take the lease if free, or extend it if we already hold it, as one atomic step
+        self._lease_script = self.redis.register_script(
+            "if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then return 1 end "
+            "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end "
+            "return 0"
+        )
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _members(self, namespace: str) -> str:
+        return f"{self.prefix}:{namespace}"
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        return self.redis.get(self._key(namespace, key))
+
+    def set(self, namespace: str, key: str, value: bytes, ttl: Optional[float] = None):
+        pipe = self.redis.pipeline()
+        pipe.set(self._key(namespace, key), value, px=int(ttl * 1000) if ttl else None)
+        pipe.sadd(self._members(namespace), key)
+        pipe.execute()
+
+    def delete(self, namespace: str, key: str) -> bool:
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key(namespace, key))
+        pipe.srem(self._members(namespace), key)
+        return bool(pipe.execute()[0])
+
+    def items(self, namespace: str) -> Dict[str, bytes]:
+        keys = [key.decode() for key in self.redis.smembers(self._members(namespace))]
+        if not keys:
+            return {}
+        values = self.redis.mget([self._key(namespace, key) for key in keys])
+        expired = [key for key, value in zip(keys, values) if value is None]
+        if expired:
+            # Members whose value expired via TTL
+            self.redis.srem(self._members(namespace), *expired)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def incr(self, namespace: str, key: str) -> int:
+        return self.redis.incr(self._key(namespace, key))
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        return bool(self._lease_script(keys=[self._key("leases", name)], args=[owner, int(ttl * 1000)]))
+
+
+def create_state_backend() -> StateBackend:
+    """Backend selected by STATE_BACKEND (sqlite | redis); Redis uses REDIS_URL"""
+    kind = os.getenv("STATE_BACKEND", "sqlite").lower()
+    if kind == "redis":
+        url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+        logger.info(f"Using Redis state backend at {url}")
+        return RedisStateBackend(url, prefix=os.getenv("STATE_PREFIX", "voiceagent"))
+    if kind != "sqlite":
+        raise ValueError(f"Unknown STATE_BACKEND: {kind}")
+    return SQLiteStateBackend(os.getenv("STATE_DB_PATH", "/tmp/state.db"))
+
+
+class SessionRegistry:
+    """Which node/worker owns each live WebSocket session, so requests can be routed back to it"""
+
+    def __init__(self, state: StateBackend, ttl: float = 120):
+        self.state = state
+        self.ttl = ttl
+
+    def register(self, session_id: str, **info) -> dict:
+        """Claim (or refresh) a session for this worker"""
+        record = {"session_id": session_id, "node": NODE_ID, "updated_at": time.time(), **info}
+        self.state.set_json("sessions", session_id, record, ttl=self.ttl)
+        return record
+
+    def unregister(self, session_id: str):
+        self.state.delete("sessions", session_id)
+
+    def get(self, session_id: str) -> Optional[dict]:
+        return self.state.get_json("sessions", session_id)
+
+    def list(self, node: Optional[str] = None) -> List[dict]:
+        sessions = self.state.list_json("sessions")
+        return [s for s in sessions if node is None or s["node"] == node]
+
+    @asynccontextmanager
+    async def hold(self, session_id: str, **info):
+        """Keep a session registered to this worker (refreshing its TTL) for the duration of the block"""
+        await asyncio.to_thread(self.register, session_id, **info)
+
+        async def refresh():
+            while True:
+                await asyncio.sleep(self.ttl / 3)
+                try:
+                    await asyncio.to_thread(self.register, session_id, **info)
+                except Exception as e:
+                    logger.error(f"Session {session_id} refresh error: {e}")
+
+        refresher = asyncio.create_task(refresh())
+        try:
+            yield
+        finally:
+            refresher.cancel()
+            try:
+                await asyncio.to_thread(self.unregister, session_id)
+            except Exception as e:
+                logger.error(f"Session {session_id} unregister error: {e}")
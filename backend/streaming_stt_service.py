@@ -0,0 +1,269 @@
+# Streaming STT Service
+# Real-time speech recognition over persistent provider WebSockets (Deepgram, AssemblyAI)
+
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from typing import AsyncIterator, Optional
+from urllib.parse import urlencode
+
+import websockets
+
+try:
+    # websockets >= 13: the asyncio client takes additional_headers
+    from websockets.asyncio.client import connect as ws_connect
+    HEADERS_ARGUMENT = "additional_headers"
+except ImportError:
+    from websockets import connect as ws_connect
+    HEADERS_ARGUMENT = "extra_headers"
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingSTTSession:
+    """Persistent recognition socket for one voice session with keepalive and reconnect"""
+
+    provider = "base"
+
+    def __init__(
+        self,
+        api_key: str,
+        language: str = "hi",
+        sample_rate: int = 16000,
+        base_url: Optional[str] = None,
+        keepalive_interval: float = 8.0,
+        max_reconnects: int = 5,
+        max_buffered_frames: int = 250
+    ):
+        self.api_key = api_key
+        self.language = language.split("-")[0]
+        self.sample_rate = sample_rate
+        self.base_url = base_url
+        self.keepalive_interval = keepalive_interval
+        self.max_reconnects = max_reconnects
+        self.transcripts: asyncio.Queue = asyncio.Queue()
+        # Frames sent while reconnecting are replayed once the socket is back
+        self._pending = deque(maxlen=max_buffered_frames)
+        self._ws = None
+        self._connected = asyncio.Event()
+        self._closing = False
+        self._receiver_task: Optional[asyncio.Task] = None
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    # Provider hooks
+    def _url(self) -> str:
+        raise NotImplementedError
+
+    def _headers(self) -> dict:
+        raise NotImplementedError
+
+    def _encode_audio(self, frame: bytes):
+        return frame
+
+    def _keepalive_message(self):
+        raise NotImplementedError
+
+    def _close_message(self):
+        raise NotImplementedError
+
+    def _parse(self, message) -> Optional[dict]:
+        raise NotImplementedError
+
+    async def connect(self):
+        """Open the provider socket and start background tasks"""
+        await self._open()
+        self._receiver_task = asyncio.create_task(self._receive_loop())
+        self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def _open(self):
+        self._ws = await ws_connect(self._url(), **{HEADERS_ARGUMENT: self._headers()})
+        self._connected.set()
+        while self._pending:
+            await self._ws.send(self._encode_audio(self._pending.popleft()))
+        logger.info(f"{self.provider} streaming STT connected")
+
+    async def send_audio(self, frame: bytes):
+        """Push one PCM16 audio frame to the recognizer"""
+        if not self._connected.is_set():
+            self._pending.append(frame)
+            return
+        try:
+            await self._ws.send(self._encode_audio(frame))
+        except websockets.ConnectionClosed:
+            self._pending.append(frame)
+
+    async def _receive_loop(self):
+        attempt = 0
+        while not self._closing:
+            try:
+                async for message in self._ws:
+                    attempt = 0
+                    event = self._parse(message)
+                    if event:
+                        event["provider"] = self.provider
+                        await self.transcripts.put(event)
+                if self._closing:
+                    break
+                raise ConnectionError("socket closed by provider")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self._closing:
+                    break
+                self._connected.clear()
+                attempt += 1
+                if attempt > self.max_reconnects:
+                    logger.error(f"{self.provider} streaming STT giving up after {self.max_reconnects} reconnects: {e}")
+                    break
+                delay = min(0.25 * 2 ** (attempt - 1), 5.0)
+                logger.warning(f"{self.provider} streaming STT disconnected ({e}), reconnecting in {delay}s")
+                await asyncio.sleep(delay)
+                try:
+                    await self._open()
+                except Exception as connect_error:
+                    logger.error(f"{self.provider} reconnect failed: {connect_error}")
+        await self.transcripts.put(None)
+
+    async def _keepalive_loop(self):
+        while not self._closing:
+            await asyncio.sleep(self.keepalive_interval)
+            if self._connected.is_set():
+                try:
+                    await self._ws.send(self._keepalive_message())
+                except Exception as e:
+                    logger.debug(f"{self.provider} keepalive failed: {e}")
+
+    async def __aiter__(self) -> AsyncIterator[dict]:
+        """Yield {"text", "is_final", "stable", "confidence", "language", "provider"} events until closed
+
+        "language" is the provider-detected language, or None when it does not report one.
+        """
+        while True:
+            event = await self.transcripts.get()
+            if event is None:
+                return
+            yield event
+
+    async def close(self):
+        """Flush the provider, close the socket and stop background tasks"""
+        self._closing = True
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+        if self._ws is not None:
+            try:
+                await self._ws.send(self._close_message())
+                await asyncio.wait_for(self._receiver_task, timeout=2.0)
+            except Exception:
+                pass
+            await self._ws.close()
+        if self._receiver_task and not self._receiver_task.done():
+            self._receiver_task.cancel()
+        await self.transcripts.put(None)
+
+
+class DeepgramStreamingSession(StreamingSTTSession):
+    """Deepgram Nova-2 live transcription"""
+
+    provider = "deepgram"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._segments = []
+
+    def _url(self) -> str:
+        # "auto" (several possible languages) uses Nova-3 code-switching, which reports each result's languages
+        multilingual = self.language == "auto"
+        params = urlencode({
+            "model": "nova-3" if multilingual else "nova-2",
+            "language": "multi" if multilingual else self.language,
+            "encoding": "linear16",
+            "sample_rate": self.sample_rate,
+            "interim_results": "true",
+            "punctuate": "true",
+            "endpointing": 300
+        })
+        return f"{self.base_url or 'wss://api.deepgram.com'}/v1/listen?{params}"
+
+    def _headers(self) -> dict:
+        return {"Authorization": f"Token {self.api_key}"}
+
+    def _keepalive_message(self):
+        return json.dumps({"type": "KeepAlive"})
+
+    def _close_message(self):
+        return json.dumps({"type": "CloseStream"})
+
+    def _parse(self, message) -> Optional[dict]:
+        data = json.loads(message)
+        if data.get("type") != "Results":
+            return None
+        alternative = data.get("channel", {}).get("alternatives", [{}])[0]
+        text = alternative.get("transcript", "")
+        confidence = alternative.get("confidence", 0.0)
+        # Only reported in multilingual mode; without it the router falls back to its own language ID
+        language = (alternative.get("languages") or [None])[0]
+
+        # is_final finalizes a segment; speech_final ends the utterance
+        if data.get("is_final") and text:
+            self._segments.append(text)
+        utterance = " ".join(self._segments if data.get("is_final") else self._segments + [text]).strip()
+        if data.get("speech_final"):
+            self._segments = []
+            if not utterance:
+                return None
+            return {"text": utterance, "is_final": True, "stable": True, "confidence": confidence, "language": language}
+        if not utterance:
+            return None
+        return {"text": utterance, "is_final": False, "stable": bool(data.get("is_final")),
+                "confidence": confidence, "language": language}
+
+
+class AssemblyAIStreamingSession(StreamingSTTSession):
+    """AssemblyAI Universal-Streaming (v3) transcription"""
+
+    provider = "assemblyai"
+
+    def _url(self) -> str:
+        params = urlencode({"sample_rate": self.sample_rate, "encoding": "pcm_s16le"})
+        return f"{self.base_url or 'wss://streaming.assemblyai.com'}/v3/ws?{params}"
+
+    def _headers(self) -> dict:
+        return {"Authorization": self.api_key}
+
+    def _keepalive_message(self):
+        # No keepalive message in the protocol - 50 ms of silence keeps the session open
+        return b"\x00\x00" * (self.sample_rate // 20)
+
+    def _close_message(self):
+        return json.dumps({"type": "Terminate"})
+
+    def _parse(self, message) -> Optional[dict]:
+        data = json.loads(message)
+        if data.get("type") != "Turn":
+            return None
+        text = data.get("transcript", "")
+        if not text:
+            return None
+        words = data.get("words", [])
+        confidence = sum(w.get("confidence", 0.0) for w in words) / len(words) if words else 0.0
+        is_final = bool(data.get("end_of_turn"))
+        return {"text": text, "is_final": is_final, "stable": is_final, "confidence": confidence,
+                "language": data.get("language_code")}
+
+
+STREAMING_PROVIDERS = {
+    "deepgram": (DeepgramStreamingSession, "DEEPGRAM_API_KEY"),
+    "assemblyai": (AssemblyAIStreamingSession, "ASSEMBLYAI_API_KEY"),
+}
+
+
+async def open_streaming_session(provider: str, language: str = "hi", **kwargs) -> StreamingSTTSession:
+    """Open a connected streaming session for a provider ("deepgram" or "assemblyai")"""
+    for name, (session_cls, env_key) in STREAMING_PROVIDERS.items():
+        if provider.startswith(name):
+            session = session_cls(os.getenv(env_key), language=language, **kwargs)
+            await session.connect()
+            return session
+    raise ValueError(f"Streaming STT not supported for provider: {provider}")
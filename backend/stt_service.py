@@ -1,8 +1,12 @@
 import os
+import asyncio
 import logging
 import httpx
 from typing import Optional
 
+from client_registry import get_client
+from streaming_stt_service import StreamingSTTSession, open_streaming_session
+
 logger = logging.getLogger(__name__)
 
 class STTService:
@@ -38,8 +42,8 @@ class STTService:
     async def _call_google_stt(self, audio_path: str, language: str) -> Optional[str]:
         """Call Google Cloud STT"""
         try:
+            client = get_client("google_speech")
             from google.cloud import speech_v1
-            client = speech_v1.SpeechClient()
             with open(audio_path, "rb") as audio_file:
                 content = audio_file.read()
             audio = speech_v1.RecognitionAudio(content=content)
@@ -57,8 +61,7 @@ class STTService:
     async def _call_openai_whisper(self, audio_path: str, language: str) -> Optional[str]:
         """Call OpenAI Whisper API"""
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=self.openai_key)
+            client = get_client("openai")
             with open(audio_path, "rb") as audio_file:
                 transcript = client.audio.transcriptions.create(
                     model="whisper-1",
@@ -73,7 +76,7 @@ class STTService:
     async def _call_azure_stt(self, audio_path: str, language: str) -> Optional[str]:
         """Call Microsoft Azure Speech-to-Text"""
         try:
-            import azure.cognitiveservices.speech as speechsdk
+            speechsdk = get_client("azure_speech")
             speech_config = speechsdk.SpeechConfig(
                 subscription=self.azure_key,
                 region=os.getenv("AZURE_REGION")
@@ -93,8 +96,7 @@ class STTService:
     async def _call_groq_whisper(self, audio_path: str, language: str) -> Optional[str]:
         """Call Groq Whisper API"""
         try:
-            from groq import Groq
-            client = Groq(api_key=self.groq_key)
+            client = get_client("groq")
             with open(audio_path, "rb") as audio_file:
                 transcript = client.audio.transcriptions.create(
                     file=audio_file,
@@ -137,6 +139,7 @@ class STTService:
                         return result_data["text"]
                     elif result_data["status"] == "error":
                         raise Exception("Transcription failed")
+                    await asyncio.sleep(0.5)
         except Exception as e:
             logger.error(f"AssemblyAI error: {e}")
             return await self._call_google_stt(audio_path, language)
@@ -160,6 +163,10 @@ class STTService:
             logger.error(f"Deepgram error: {e}")
             return await self._call_google_stt(audio_path, language)
     
+    async def open_stream(self, language: str = "hi", model: str = "deepgram-stt", sample_rate: int = 16000) -> StreamingSTTSession:
+        """Open a real-time streaming session (Deepgram or AssemblyAI) for one voice session"""
+        return await open_streaming_session(model, language=language, sample_rate=sample_rate)
+    
     def get_available_models(self) -> list:
         return [
             "google-stt",
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+from agent_management_service import AgentManagementService
+from prompt_bank_service import PromptBankService
+from state_backend import SQLiteStateBackend
+
+
+class RecordingPromptBank:
+    """Records which thread schedule_render runs on, like the real one it needs the event loop"""
+
+    needs_rerender = staticmethod(PromptBankService.needs_rerender)
+
+    def __init__(self):
+        self.rendered = []
+
+    def schedule_render(self, agent):
+        asyncio.get_running_loop()
+        self.rendered.append((agent["id"], agent["voice_id"], threading.current_thread() is threading.main_thread()))
+
+
+def service_in(tmp_path, prompt_bank=None):
+    service = AgentManagementService(SQLiteStateBackend(str(tmp_path / "state.db")), prompt_bank)
+    service.agents_dir = str(tmp_path / "agents")
+    return service
+
+
+def test_async_variants_store_off_the_loop_and_render_on_it(tmp_path):
+    bank = RecordingPromptBank()
+    service = service_in(tmp_path, bank)
+    threads = []
+    save = service._save
+
+    def recording_save(agent_config):
+        threads.append(threading.current_thread() is threading.main_thread())
+        save(agent_config)
+
+    service._save = recording_save
+
+    async def scenario():
+        created = await service.create_agent_async(
+            name="Asha", job_role="support", system_instruction="Help.", language="hi",
+            voice_id="v1", prompts={"greeting": "Namaste"}
+        )
+        agent_id = created["agent_id"]
+        updated = await service.update_agent_async(agent_id, {"voice_id": "v2"})
+        await service.update_agent_async(agent_id, {"temperature": 0.2})
+        cloned = await service.clone_agent_async(agent_id, "Asha 2")
+        await asyncio.sleep(0)
+        return agent_id, updated, cloned, await service.list_agents_async("hi")
+
+    agent_id, updated, cloned, listed = asyncio.run(scenario())
+    assert updated["agent"]["version"] == 2
+    assert cloned["agent"]["name"] == "Asha 2"
+    assert listed["count"] == 2
+    assert threads == [False, False, False, False]
+    # The voice change re-renders; the temperature change does not
+    assert bank.rendered == [(agent_id, "v1", True), (agent_id, "v2", True)]
+
+
+def test_async_variants_report_errors_like_the_sync_ones(tmp_path):
+    service = service_in(tmp_path)
+
+    async def scenario():
+        return (
+            await service.update_agent_async("missing", {"name": "x"}),
+            await service.clone_agent_async("missing", "x"),
+        )
+
+    missing_update, missing_clone = asyncio.run(scenario())
+    assert missing_update == {"success": False, "error": "Agent not found"}
+    assert missing_clone == {"success": False, "error": "Source agent not found"}
@@ -0,0 +1,145 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from analytics_service import AnalyticsService, LatencySketch, RollupCell
+
+# Recent enough that flushes do not prune its minute buckets
+DAY = (datetime.utcnow() - timedelta(days=1)).date().isoformat()
+NEXT_DAY = datetime.utcnow().date().isoformat()
+
+
+def exact_quantile(values, q):
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+@pytest.mark.parametrize("q", [0.5, 0.9, 0.95, 0.99])
+def test_sketch_quantiles_are_within_relative_accuracy(q):
+    rng = random.Random(7)
+    values = [rng.lognormvariate(6, 0.8) for _ in range(20000)]
+    sketch = LatencySketch(accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    assert sketch.quantile(q) == pytest.approx(exact_quantile(values, q), rel=0.01)
+
+
+def test_merged_sketches_equal_one_sketch_of_everything():
+    rng = random.Random(8)
+    parts = [[rng.uniform(50, 3000) for _ in range(500)] for _ in range(4)] + [[0.0, 0.0]]
+    whole, merged = LatencySketch(), LatencySketch()
+    for part in parts:
+        sketch = LatencySketch()
+        for value in part:
+            sketch.add(value)
+            whole.add(value)
+        merged.merge(LatencySketch.from_dict(sketch.to_dict()))
+    assert merged.bins == whole.bins
+    assert merged.summary() == whole.summary()
+    assert merged.quantile(0) == 0.0
+    assert LatencySketch().summary() == {"count": 0}
+
+
+def turn(ts, agent_id="agent-1", language="hi", llm=100.0, outcome="completed"):
+    return {"ts": ts, "agent_id": agent_id, "language": language, "channel": "web", "outcome": outcome,
+            "providers": {"llm": "groq", "tts": "elevenlabs"}, "latency_ms": {"llm": llm, "total": llm * 3}}
+
+
+def test_rollups_flush_and_merge_with_pending_deltas(tmp_path):
+    analytics = AnalyticsService(str(tmp_path / "analytics.db"))
+
+    async def scenario():
+        for minute in range(3):
+            analytics.record(turn(f"{DAY}T10:0{minute}:30", llm=100.0 * (minute + 1)))
+        analytics.record(turn(f"{DAY}T11:15:00", agent_id="agent-2", language="ta", outcome="interrupted"))
+        await analytics.flush()
+        # Recorded after the flush: still pending, but queries include it
+        analytics.record(turn(f"{DAY}T11:20:00"))
+        return (
+            await analytics.timeseries("hour", date_from=f"{DAY}T10", date_to=f"{DAY}T11"),
+            await analytics.breakdown("agent", "day", date_from=DAY, date_to=DAY),
+            await analytics.summary("minute", f"{DAY}T10:00", f"{DAY}T10:59", agent_id="agent-1"),
+        )
+
+    series, breakdown, summary = asyncio.run(scenario())
+    assert [(point["bucket"], point["turns"]) for point in series["series"]] == [(f"{DAY}T10", 3), (f"{DAY}T11", 2)]
+    assert series["series"][1]["outcomes"] == {"interrupted": 1, "completed": 1}
+    assert [(row["value"], row["turns"]) for row in breakdown["rows"]] == [("agent-1", 4), ("agent-2", 1)]
+    assert summary["turns"] == 3
+    assert summary["latency_ms"]["llm"]["max"] == 300.0
+    assert summary["latency_ms"]["total"]["p50"] == pytest.approx(600.0, rel=0.01)
+
+
+def test_two_services_flush_into_one_database(tmp_path):
+    first, second = AnalyticsService(str(tmp_path / "a.db")), AnalyticsService(str(tmp_path / "a.db"))
+
+    async def scenario():
+        first.record(turn(f"{DAY}T10:00:00", llm=100.0))
+        second.record(turn(f"{DAY}T10:00:10", llm=200.0))
+        await first.flush()
+        await second.flush()
+        return await AnalyticsService(str(tmp_path / "a.db")).summary("day", DAY, DAY)
+
+    summary = asyncio.run(scenario())
+    assert summary["turns"] == 2
+    assert (summary["latency_ms"]["llm"]["min"], summary["latency_ms"]["llm"]["max"]) == (100.0, 200.0)
+
+
+@pytest.mark.parametrize("resolution, expected_end", [("minute", f"{DAY}T23:59"), ("hour", f"{DAY}T23")])
+def test_bare_end_date_includes_the_whole_day(tmp_path, resolution, expected_end):
+    analytics = AnalyticsService(str(tmp_path / "analytics.db"))
+
+    async def scenario():
+        analytics.record(turn(f"{DAY}T00:00:00"))
+        analytics.record(turn(f"{DAY}T23:59:59"))
+        analytics.record(turn(f"{NEXT_DAY}T00:00:00"))
+        stored = await analytics.summary(resolution, DAY, DAY)
+        await analytics.flush()
+        return stored, await analytics.summary(resolution, DAY, DAY)
+
+    pending, flushed = asyncio.run(scenario())
+    assert pending["to"] == flushed["to"] == expected_end
+    assert pending["turns"] == flushed["turns"] == 2
+
+
+def test_default_range_ends_at_the_last_bucket_of_the_end_date():
+    start, end = AnalyticsService._range("hour", None, "2026-10-05", 24)
+    assert (start, end) == ("2026-10-05T00", "2026-10-05T23")
+    with pytest.raises(ValueError):
+        AnalyticsService._range("week", None, None, 1)
+
+
+def test_queries_snapshot_pending_cells(tmp_path):
+    analytics = AnalyticsService(str(tmp_path / "analytics.db"))
+    analytics.record(turn(f"{DAY}T10:00:00"))
+
+    async def scenario():
+        cells = await analytics._cells("day", "all", "all", DAY, DAY)
+        analytics.record(turn(f"{DAY}T10:05:00"))
+        return cells
+
+    [(bucket, value, cell)] = asyncio.run(scenario())
+    assert (bucket, value, cell.turns) == (DAY, "all", 1)
+    assert analytics._pending[("day", DAY, "all", "all")].turns == 2
+
+
+def test_fine_buckets_are_pruned_past_retention(tmp_path):
+    analytics = AnalyticsService(str(tmp_path / "analytics.db"))
+    old = (datetime.utcnow() - timedelta(days=100)).isoformat()
+    recent = (datetime.utcnow() - timedelta(hours=1)).isoformat()
+
+    async def scenario():
+        analytics.record(turn(old))
+        analytics.record(turn(recent))
+        await analytics.flush()
+
+    asyncio.run(scenario())
+    with analytics._connect() as conn:
+        rows = conn.execute(
+            "SELECT resolution, bucket, data FROM rollups WHERE dimension = 'all' ORDER BY resolution, bucket"
+        ).fetchall()
+    # Minute and hour buckets past retention are gone; day buckets are kept forever
+    assert [(row["resolution"], row["bucket"]) for row in rows] == \
+        [("day", old[:10]), ("day", recent[:10]), ("hour", recent[:13]), ("minute", recent[:16])]
+    assert RollupCell.from_bytes(rows[0]["data"]).turns == 1
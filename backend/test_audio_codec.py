@@ -0,0 +1,69 @@
+import warnings
+
+import numpy as np
+import pytest
+
+from audio_codec import (
+    StreamTranscoder, StreamingResampler, alaw_decode, alaw_encode, decode, encode, mulaw_decode, mulaw_encode,
+    resample
+)
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    audioop = pytest.importorskip("audioop")
+
+ALL_PCM16 = np.arange(-32768, 32768, dtype=np.int16)
+ALL_CODES = bytes(range(256))
+
+
+def test_mulaw_matches_audioop():
+    assert bytes(mulaw_encode(ALL_PCM16)) == audioop.lin2ulaw(ALL_PCM16.tobytes(), 2)
+    np.testing.assert_array_equal(mulaw_decode(ALL_CODES), np.frombuffer(audioop.ulaw2lin(ALL_CODES, 2), dtype="<i2"))
+
+
+def test_alaw_matches_audioop():
+    assert bytes(alaw_encode(ALL_PCM16)) == audioop.lin2alaw(ALL_PCM16.tobytes(), 2)
+    np.testing.assert_array_equal(alaw_decode(ALL_CODES), np.frombuffer(audioop.alaw2lin(ALL_CODES, 2), dtype="<i2"))
+
+
+def test_pcm16_round_trips():
+    assert bytes(encode(decode(ALL_PCM16.tobytes(), "pcm16"), "pcm16")) == ALL_PCM16.tobytes()
+    with pytest.raises(ValueError):
+        decode(b"\x00", "opus")
+
+
+@pytest.mark.parametrize("from_sr,to_sr", [(8000, 16000), (16000, 8000), (44100, 8000), (8000, 24000)])
+def test_resampler_output_does_not_depend_on_frame_sizes(from_sr, to_sr):
+    rng = np.random.default_rng(0)
+    signal = rng.uniform(-0.5, 0.5, from_sr // 2).astype(np.float32)
+
+    whole = StreamingResampler(from_sr, to_sr)
+    expected = np.concatenate([whole.process(signal), whole.flush()])
+
+    pieces = StreamingResampler(from_sr, to_sr)
+    out, start = [], 0
+    for size in [1, 7, 160, 3, 0, 441, 2] * 200:
+        out.append(pieces.process(signal[start:start + size]))
+        start += size
+        if start >= signal.size:
+            break
+    out.append(pieces.process(signal[start:]))
+    out.append(pieces.flush())
+    np.testing.assert_allclose(np.concatenate(out), expected, atol=1e-6)
+
+
+def test_resample_keeps_a_tone_and_its_timing():
+    t = np.arange(8000) / 8000
+    tone = (0.5 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    upsampled = resample(tone, 8000, 16000)
+    assert upsampled.size == 16000
+    expected = 0.5 * np.sin(2 * np.pi * 440 * np.arange(16000) / 16000)
+    # Edges see the filter's zero padding
+    np.testing.assert_allclose(upsampled[200:-200], expected[200:-200], atol=0.01)
+
+
+def test_transcoder_holds_odd_pcm16_bytes():
+    pcm = (np.arange(320) * 50 - 8000).astype("<i2").tobytes()
+    transcoder = StreamTranscoder("pcm16", 8000, "mulaw", 8000)
+    out = b"".join(bytes(transcoder.process(pcm[i:i + 33])) for i in range(0, len(pcm), 33))
+    assert out == audioop.lin2ulaw(pcm, 2)
@@ -0,0 +1,129 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+
+import pytest
+
+from call_events_service import (
+    CallEventService,
+    normalize_exotel,
+    normalize_status,
+    normalize_twilio,
+    normalize_vapi,
+    validate_twilio_signature,
+)
+
+
+@pytest.mark.parametrize("status, ended_reason, expected", [
+    ("queued", None, "queued"),
+    ("initiated", None, "queued"),
+    ("ringing", None, "ringing"),
+    ("in-progress", None, "in_progress"),
+    ("in_progress", None, "in_progress"),
+    ("answered", None, "in_progress"),
+    ("completed", None, "completed"),
+    ("busy", None, "busy"),
+    ("no-answer", None, "no_answer"),
+    ("canceled", None, "failed"),
+    ("ended", "customer-busy", "busy"),
+    ("ended", "customer-did-not-answer", "no_answer"),
+    ("ended", "assistant-ended-call", "completed"),
+    (None, None, "queued"),
+])
+def test_provider_statuses_map_onto_the_call_lifecycle(status, ended_reason, expected):
+    assert normalize_status(status, ended_reason) == expected
+
+
+def test_normalize_twilio():
+    event = normalize_twilio({"CallSid": "CA1", "CallStatus": "completed", "CallDuration": "42"})
+    assert (event["call_id"], event["provider"], event["status"], event["duration"], event["final"]) == \
+        ("CA1", "twilio", "completed", 42.0, True)
+    assert normalize_twilio({"CallStatus": "ringing"}) is None
+
+
+def test_normalize_vapi():
+    update = normalize_vapi({"message": {"type": "status-update", "status": "in-progress", "call": {"id": "v1"}}})
+    assert (update["call_id"], update["status"], update["type"], update["final"]) == ("v1", "in_progress", "status", False)
+    report = normalize_vapi({"message": {"type": "end-of-call-report", "endedReason": "customer-busy",
+                                         "durationSeconds": 3, "call": {"id": "v1"}}})
+    assert (report["status"], report["type"], report["duration"], report["ended_reason"]) == \
+        ("busy", "end-of-call-report", 3.0, "customer-busy")
+    assert normalize_vapi({"message": {"type": "transcript", "call": {"id": "v1"}}}) is None
+    assert normalize_vapi({"message": {"type": "status-update"}}) is None
+
+
+def test_normalize_exotel():
+    event = normalize_exotel({"CallSid": "ex1", "Status": "no-answer", "ConversationDuration": ""})
+    assert (event["provider"], event["status"], event["duration"]) == ("exotel", "no_answer", None)
+    assert normalize_exotel({"CallSid": "ex2", "CallStatus": "completed", "Duration": "9"})["duration"] == 9.0
+    assert normalize_exotel({}) is None
+
+
+def ingest_all(service, events):
+    async def scenario():
+        return [await service.ingest(event) for event in events]
+
+    return asyncio.run(scenario())
+
+
+def test_late_webhooks_never_move_a_call_backwards(tmp_path):
+    service = CallEventService(str(tmp_path / "calls.db"))
+    states = ingest_all(service, [
+        normalize_twilio({"CallSid": "CA1", "CallStatus": "in-progress"}),
+        normalize_twilio({"CallSid": "CA1", "CallStatus": "ringing"}),
+        normalize_twilio({"CallSid": "CA1", "CallStatus": "completed", "CallDuration": "30"}),
+        normalize_twilio({"CallSid": "CA1", "CallStatus": "in-progress"}),
+        normalize_twilio({"CallSid": "CA1", "CallStatus": "failed"}),
+    ])
+    assert [state["status"] for state in states] == ["in_progress", "in_progress", "completed", "completed", "completed"]
+    # Every event is still recorded, and the state survives a restart
+    assert len(service.get_events("CA1")) == 5
+    assert CallEventService(str(tmp_path / "calls.db")).get_call("CA1")["status"] == "completed"
+
+
+def test_final_status_wakes_waiters(tmp_path):
+    service = CallEventService(str(tmp_path / "calls.db"))
+
+    async def scenario():
+        waiter = asyncio.create_task(service.wait_for_final("ex1", timeout=2))
+        await asyncio.sleep(0)
+        await service.ingest(normalize_exotel({"CallSid": "ex1", "Status": "ringing"}))
+        await service.ingest(normalize_exotel({"CallSid": "ex1", "Status": "busy"}))
+        return await waiter
+
+    assert asyncio.run(scenario()) == "busy"
+
+
+def twilio_signature(token, url, params):
+    payload = url + "".join(key + params[key] for key in sorted(params))
+    return base64.b64encode(hmac.new(token.encode(), payload.encode(), hashlib.sha1).digest()).decode()
+
+
+def test_validate_twilio_signature():
+    url = "https://api.example.com/phone/webhooks/twilio?agent=1"
+    params = {"CallSid": "CA1", "CallStatus": "completed", "To": "+15550100", "From": "+15550111"}
+    signature = twilio_signature("secret", url, params)
+    assert validate_twilio_signature("secret", url, params, signature)
+    assert not validate_twilio_signature("other-secret", url, params, signature)
+    assert not validate_twilio_signature("secret", url.replace("agent=1", "agent=2"), params, signature)
+    assert not validate_twilio_signature("secret", url, {**params, "CallStatus": "failed"}, signature)
+    assert not validate_twilio_signature("secret", url, params, None)
+
+
+def test_verify_exotel_accepts_the_token_as_query_or_basic_auth(tmp_path, monkeypatch):
+    monkeypatch.setenv("EXOTEL_WEBHOOK_TOKEN", "shh")
+    service = CallEventService(str(tmp_path / "calls.db"))
+    basic = "Basic " + base64.b64encode(b"exotel:shh").decode()
+    assert service.verify_exotel("shh", None)
+    assert service.verify_exotel(None, basic)
+    assert not service.verify_exotel(None, None)
+    assert not service.verify_exotel("wrong", None)
+    assert not service.verify_exotel(None, "Basic " + base64.b64encode(b"exotel:wrong").decode())
+    assert not service.verify_exotel(None, "Basic not-base64!")
+    assert not service.verify_exotel(None, "Bearer shh")
+
+
+def test_verify_exotel_is_skipped_without_a_token(tmp_path, monkeypatch):
+    monkeypatch.delenv("EXOTEL_WEBHOOK_TOKEN", raising=False)
+    assert CallEventService(str(tmp_path / "calls.db")).verify_exotel(None, None)
@@ -0,0 +1,67 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from campaign_service import CampaignService
+
+
+class FakePhoneService:
+    """Answers each number with a scripted sequence of final call statuses"""
+
+    def __init__(self, outcomes: dict):
+        self.outcomes = {number: list(statuses) for number, statuses in outcomes.items()}
+        self.calls = []
+        self._numbers = {}
+
+    async def make_call(self, phone_number, agent_id, provider, message=None, fallback=True):
+        call_id = f"call_{len(self.calls)}"
+        self.calls.append(phone_number)
+        self._numbers[call_id] = phone_number
+        return {"success": True, "call_id": call_id}
+
+    async def get_call_status(self, call_id, provider, refresh=False):
+        return {"status": self.outcomes[self._numbers[call_id]].pop(0)}
+
+
+def create(service, numbers, **kwargs):
+    campaign_id = service.create_campaign("agent", numbers, provider="twilio", **kwargs)["campaign_id"]
+    return campaign_id, service._campaign(campaign_id)
+
+
+def number_row(service, campaign_id, number):
+    return next(row for row in service.list_numbers(campaign_id) if row["phone_number"] == number)
+
+
+def test_busy_number_is_retried_with_exponential_backoff(tmp_path):
+    service = CampaignService(FakePhoneService({}), db_path=str(tmp_path / "campaigns.db"))
+    campaign_id, campaign = create(service, ["+911"], max_attempts=3, retry_base_seconds=60)
+
+    before = datetime.utcnow()
+    asyncio.run(service._record_outcome(campaign, "+911", 2, "busy"))
+    row = number_row(service, campaign_id, "+911")
+    assert (row["status"], row["attempts"], row["last_error"]) == ("pending", 2, "busy")
+    delay = datetime.fromisoformat(row["next_attempt_at"]) - before
+    assert timedelta(seconds=119) < delay < timedelta(seconds=125)
+
+
+def test_retries_stop_at_max_attempts(tmp_path):
+    service = CampaignService(FakePhoneService({}), db_path=str(tmp_path / "campaigns.db"))
+    campaign_id, campaign = create(service, ["+911", "+912"], max_attempts=3)
+
+    asyncio.run(service._record_outcome(campaign, "+911", 3, "no_answer"))
+    asyncio.run(service._record_outcome(campaign, "+912", 1, "failed", "Call initiation failed"))
+    assert number_row(service, campaign_id, "+911")["status"] == "no_answer"
+    failed = number_row(service, campaign_id, "+912")
+    assert (failed["status"], failed["last_error"]) == ("failed", "Call initiation failed")
+
+
+def test_campaign_redials_until_answered(tmp_path):
+    phone = FakePhoneService({"+911": ["busy", "no-answer", "completed"], "+912": ["completed"]})
+    service = CampaignService(phone, db_path=str(tmp_path / "campaigns.db"))
+    campaign_id, _ = create(service, ["+911", "+912"], max_attempts=3, retry_base_seconds=0)
+
+    asyncio.run(asyncio.wait_for(service._run(campaign_id), 15))
+    result = service.get_campaign(campaign_id)
+    assert result["campaign"]["status"] == "completed"
+    assert result["stats"]["by_status"] == {"completed": 2}
+    assert result["stats"]["call_attempts"] == 4
+    assert phone.calls.count("+911") == 3
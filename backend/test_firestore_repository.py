@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from firestore_repository import MAX_BATCH_WRITES, MAX_PAGE_SIZE, FirestoreRepository, InMemoryRepository
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeDocument:
+    def __init__(self, store, doc_id):
+        self.store = store
+        self.id = doc_id
+
+    async def get(self, field_paths=None):
+        data = self.store.get(self.id)
+        if data is not None and field_paths:
+            data = {k: v for k, v in data.items() if k in field_paths}
+        return FakeSnapshot(self.id, data)
+
+    async def set(self, data):
+        self.store[self.id] = dict(data)
+
+
+class FakeQuery:
+    """Enough of the async Firestore query API to run FirestoreRepository.query against a dict"""
+
+    def __init__(self, store, steps=()):
+        self.store = store
+        self.steps = list(steps)
+
+    def _then(self, *step):
+        return FakeQuery(self.store, self.steps + [step])
+
+    def document(self, doc_id):
+        return FakeDocument(self.store, doc_id)
+
+    def where(self, field, op, value):
+        assert op == "=="
+        return self._then("where", field, value)
+
+    def select(self, fields):
+        return self._then("select", fields)
+
+    def order_by(self, field):
+        assert field == "__name__"
+        return self._then("order_by")
+
+    def start_after(self, cursor):
+        return self._then("start_after", cursor["__name__"].id)
+
+    def limit(self, count):
+        return self._then("limit", count)
+
+    async def stream(self):
+        docs = sorted(self.store.items())
+        fields = None
+        for step in self.steps:
+            if step[0] == "where":
+                docs = [(i, d) for i, d in docs if d.get(step[1]) == step[2]]
+            elif step[0] == "select":
+                fields = step[1]
+            elif step[0] == "start_after":
+                docs = [(i, d) for i, d in docs if i > step[1]]
+            elif step[0] == "limit":
+                docs = docs[:step[1]]
+        for doc_id, data in docs:
+            yield FakeSnapshot(doc_id, {k: v for k, v in data.items() if not fields or k in fields})
+
+
+class FakeBatch:
+    def __init__(self, client):
+        self.client = client
+        self.writes = []
+
+    def set(self, document, data):
+        self.writes.append((document, data))
+
+    async def commit(self):
+        assert len(self.writes) <= MAX_BATCH_WRITES
+        self.client.commits.append(len(self.writes))
+        for document, data in self.writes:
+            await document.set(data)
+
+
+class FakeFirestoreClient:
+    def __init__(self):
+        self.collections = {}
+        self.commits = []
+
+    def collection(self, name):
+        return FakeQuery(self.collections.setdefault(name, {}))
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def repositories():
+    return [InMemoryRepository(), FirestoreRepository(FakeFirestoreClient())]
+
+
+def agents(count, user_id="u1", prefix="agent"):
+    return [{"id": f"{prefix}-{i:04d}", "user_id": user_id, "name": f"Agent {i}", "language": "hi"} for i in range(count)]
+
+
+def read_all_pages(repository, user_id, limit, fields=None):
+    async def scenario():
+        pages, token = [], None
+        while True:
+            page, token = await repository.list_agents(user_id, fields, limit=limit, page_token=token)
+            pages.append(page)
+            if token is None:
+                return pages
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("repository", repositories(), ids=["memory", "firestore"])
+def test_pages_follow_cursors_without_gaps_or_repeats(repository):
+    asyncio.run(repository.create_agents(agents(23) + agents(5, user_id="u2", prefix="other")))
+    pages = read_all_pages(repository, "u1", limit=10)
+    assert [len(page) for page in pages] == [10, 10, 3]
+    ids = [agent["id"] for page in pages for agent in page]
+    assert ids == [f"agent-{i:04d}" for i in range(23)]
+
+
+@pytest.mark.parametrize("repository", repositories(), ids=["memory", "firestore"])
+def test_exact_multiple_of_the_page_size_ends_without_an_empty_page(repository):
+    asyncio.run(repository.create_agents(agents(20)))
+    assert [len(page) for page in read_all_pages(repository, "u1", limit=10)] == [10, 10]
+    assert read_all_pages(repository, "nobody", limit=10) == [[]]
+
+
+@pytest.mark.parametrize("repository", repositories(), ids=["memory", "firestore"])
+def test_projection_and_page_size_cap(repository):
+    asyncio.run(repository.create_agents(agents(MAX_PAGE_SIZE + 1)))
+    first = read_all_pages(repository, "u1", limit=10 ** 6, fields=["id", "name"])[0]
+    assert len(first) == MAX_PAGE_SIZE
+    assert set(first[0]) == {"id", "name"}
+    assert asyncio.run(repository.get_agent("agent-0001", ["language"])) == {"language": "hi"}
+
+
+def test_batched_writes_are_chunked_to_the_firestore_limit():
+    client = FakeFirestoreClient()
+    repository = FirestoreRepository(client)
+    written = asyncio.run(repository.create_agents(agents(2 * MAX_BATCH_WRITES + 1)))
+    assert written == 2 * MAX_BATCH_WRITES + 1
+    assert client.commits == [MAX_BATCH_WRITES, MAX_BATCH_WRITES, 1]
+    assert len(client.collections["agents"]) == written
+
+
+@pytest.mark.parametrize("repository", repositories(), ids=["memory", "firestore"])
+def test_batched_writes_overwrite_and_copy(repository):
+    original = agents(3)
+    asyncio.run(repository.create_agents(original))
+    original[0]["name"] = "mutated after the write"
+    asyncio.run(repository.set_many("agents", {"agent-0001": {"id": "agent-0001", "user_id": "u1", "name": "Renamed"}}))
+    assert asyncio.run(repository.get_agent("agent-0000", ["name"])) == {"name": "Agent 0"}
+    assert asyncio.run(repository.get_agent("agent-0001"))["name"] == "Renamed"
+    assert asyncio.run(repository.set_many("agents", {})) == 0
@@ -0,0 +1,101 @@
+import asyncio
+import socket
+
+import pytest
+
+import job_queue_service
+from job_queue_service import JobQueue, validate_webhook_url
+
+
+def resolves_to(monkeypatch, *addresses):
+    def getaddrinfo(host, port, *args, **kwargs):
+        return [(socket.AF_INET6 if ":" in a else socket.AF_INET, socket.SOCK_STREAM, 6, "", (a, port)) for a in addresses]
+
+    monkeypatch.setattr(job_queue_service.socket, "getaddrinfo", getaddrinfo)
+
+
+@pytest.mark.parametrize("url", ["ftp://hooks.example.com/x", "file:///etc/passwd", "https://", "hooks.example.com"])
+def test_non_http_webhooks_are_rejected(url):
+    with pytest.raises(ValueError):
+        validate_webhook_url(url)
+
+
+@pytest.mark.parametrize("address", [
+    "127.0.0.1", "10.1.2.3", "172.16.0.5", "192.168.1.1", "169.254.169.254", "0.0.0.0", "::1", "fe80::1",
+    "fd00::1", "::ffff:127.0.0.1", "224.0.0.1",
+])
+def test_webhooks_resolving_to_internal_addresses_are_rejected(monkeypatch, address):
+    resolves_to(monkeypatch, address)
+    with pytest.raises(ValueError, match="public"):
+        validate_webhook_url("https://hooks.example.com/done")
+
+
+def test_one_internal_address_among_public_ones_is_rejected(monkeypatch):
+    resolves_to(monkeypatch, "93.184.216.34", "10.0.0.1")
+    with pytest.raises(ValueError):
+        validate_webhook_url("http://hooks.example.com/done")
+
+
+def test_public_webhooks_are_accepted(monkeypatch):
+    resolves_to(monkeypatch, "93.184.216.34", "2606:2800:220:1:248:1893:25c8:1946")
+    validate_webhook_url("https://hooks.example.com:8443/done?token=1")
+
+
+def test_submit_rejects_internal_webhooks_without_queueing(tmp_path, monkeypatch):
+    queue = JobQueue(db_path=str(tmp_path / "jobs.db"))
+
+    async def handler(payload, progress):
+        return {"success": True}
+
+    queue.register("clone", handler)
+    resolves_to(monkeypatch, "169.254.169.254")
+    with pytest.raises(ValueError):
+        queue.submit("clone", {}, webhook_url="http://metadata.example/")
+    resolves_to(monkeypatch, "93.184.216.34")
+    job = queue.submit("clone", {"name": "x"}, webhook_url="https://hooks.example.com/")
+    assert job["status"] == "queued"
+    with queue._connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0] == 1
+
+
+def test_webhook_is_rechecked_when_the_job_finishes(tmp_path, monkeypatch):
+    queue = JobQueue(db_path=str(tmp_path / "jobs.db"), workers=1)
+    posted = []
+
+    async def handler(payload, progress):
+        await progress(0.5, "halfway")
+        # The host now resolves to an internal address
+        resolves_to(monkeypatch, "127.0.0.1")
+        return {"success": True}
+
+    class Client:
+        def __init__(self, **kwargs):
+            pass
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):
+            return False
+
+        async def post(self, url, json):
+            posted.append(url)
+
+    queue.register("clone", handler)
+    monkeypatch.setattr(job_queue_service.httpx, "AsyncClient", Client)
+    resolves_to(monkeypatch, "93.184.216.34")
+    job = queue.submit("clone", {}, webhook_url="https://hooks.example.com/")
+
+    async def scenario():
+        await queue.start()
+        for _ in range(100):
+            await asyncio.sleep(0.02)
+            finished = await asyncio.to_thread(queue.get, job["id"])
+            if finished["status"] == "succeeded":
+                break
+        await asyncio.sleep(0.05)
+        await queue.stop()
+        return finished
+
+    assert asyncio.run(scenario())["progress"] == 1.0
+    assert posted == []
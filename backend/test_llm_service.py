@@ -0,0 +1,40 @@
+import asyncio
+
+from llm_service import LLMService
+
+
+def service(openai_reply):
+    llm = LLMService()
+    calls = []
+
+    async def openai(prompt, language, system_prompt=None, model_name=None, max_tokens=None):
+        calls.append(("openai", model_name))
+        if isinstance(openai_reply, Exception):
+            raise openai_reply
+        return openai_reply
+
+    async def groq(prompt, language, system_prompt=None, model_name=None, max_tokens=None):
+        calls.append(("groq", model_name))
+        return "from groq"
+
+    llm._call_openai, llm._call_groq = openai, groq
+    return llm, calls
+
+
+def test_failed_provider_falls_back_to_groq_by_default():
+    llm, calls = service(None)
+    assert asyncio.run(llm.generate("hi", model="openai:gpt-4o")) == "from groq"
+    assert calls == [("openai", "gpt-4o"), ("groq", None)]
+
+
+def test_fallback_can_be_turned_off():
+    for failure in (None, RuntimeError("rate limited")):
+        llm, calls = service(failure)
+        assert asyncio.run(llm.generate("hi", model="openai:gpt-4o", fallback=False)) is None
+        assert calls == [("openai", "gpt-4o")]
+
+
+def test_working_provider_answers_itself():
+    llm, calls = service("from openai")
+    assert asyncio.run(llm.generate("hi", model="openai", fallback=False)) == "from openai"
+    assert calls == [("openai", None)]
@@ -0,0 +1,121 @@
+import asyncio
+import base64
+import json
+
+import numpy as np
+
+import media_bridge
+from audio_codec import decode
+from media_bridge import FRAME_SAMPLES, MediaStreamBridge
+from model_router import ModelRouter
+
+
+class FakeTwilioSocket:
+    """Plays a scripted Twilio media stream; sends "stop" once the agent has marked its reply"""
+
+    def __init__(self, messages):
+        self.incoming = [json.dumps(message) for message in messages]
+        self.sent = []
+        self.marked = asyncio.Event()
+
+    async def receive_text(self):
+        if self.incoming:
+            return self.incoming.pop(0)
+        await asyncio.wait_for(self.marked.wait(), 3)
+        return json.dumps({"event": "stop"})
+
+    async def send_text(self, text):
+        message = json.loads(text)
+        self.sent.append(message)
+        if message["event"] == "mark":
+            self.marked.set()
+
+
+class FakePromptBank:
+    def __init__(self, audio: bytes):
+        self.audio = audio
+        self.requests = []
+
+    async def get_prompt(self, agent_id, key, language):
+        self.requests.append((agent_id, key, language))
+        return self.audio if agent_id == "agent-1" else None
+
+
+async def raw_pcm(chunks, sample_rate):
+    """Stands in for ffmpeg: the prompt audio is already 8 kHz int16"""
+    async for chunk in chunks:
+        yield np.frombuffer(chunk, dtype="<i2")
+
+
+def test_start_event_plays_the_opening_prompt(monkeypatch):
+    monkeypatch.setattr(media_bridge, "decode_stream", raw_pcm)
+    tone = (np.sin(np.arange(FRAME_SAMPLES * 3) / 5) * 8000).astype("<i2")
+    prompt_bank = FakePromptBank(tone.tobytes())
+    websocket = FakeTwilioSocket([
+        {"event": "connected"},
+        {"event": "start", "start": {"streamSid": "MZ1", "callSid": "CA1"}},
+    ])
+    agent = {"id": "agent-1", "language": "hi"}
+
+    async def scenario():
+        bridge = MediaStreamBridge(websocket, agent, None, None, None, None, prompt_bank)
+        await asyncio.wait_for(bridge.run(), 5)
+
+    asyncio.run(scenario())
+    assert prompt_bank.requests == [("agent-1", "opening", "hi")]
+    media = [message for message in websocket.sent if message["event"] == "media"]
+    assert len(media) == 3
+    assert all(message["streamSid"] == "MZ1" for message in websocket.sent)
+    played = np.concatenate([decode(base64.b64decode(m["media"]["payload"]), "mulaw") for m in media])
+    # mu-law is lossy; the opening must come back as the same waveform
+    assert np.max(np.abs(played.astype(np.int32) - tone)) < 300
+    assert websocket.sent[-1]["event"] == "mark"
+
+
+class FakeSTT:
+    async def transcribe(self, path, language, model=None):
+        return "table for two"
+
+
+class FailingRoutedLLM:
+    """The routed OpenAI model is down; only the agent's default provider answers"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def generate(self, prompt, model, language, system_prompt=None, max_tokens=None, fallback=True):
+        self.calls.append((model, fallback))
+        return None if model.startswith("openai") else "Booked."
+
+
+def test_failed_routed_model_is_recorded_against_it_not_the_fallback():
+    profiles = {"openai:best": {"ttft_ms": 300, "tokens_per_second": 100, "prefill_ms_per_1k": 50,
+                                "concurrency": 4, "quality": 5, "api_model": "best-2024"}}
+    router = ModelRouter(profiles)
+    llm = FailingRoutedLLM()
+    turns = []
+
+    class TurnLog:
+        def append(self, record):
+            turns.append(record)
+
+    agent = {"id": "agent-1", "language": "en", "llm_provider": "groq", "latency_slo_ms": 2000,
+             "llm_models": ["openai:best"]}
+    spoken = []
+
+    async def scenario():
+        bridge = MediaStreamBridge(None, agent, FakeSTT(), llm, None, None, None, turn_log=TurnLog(),
+                                   model_router=router)
+
+        async def speak(chunks, latency=None):
+            spoken.append(chunks)
+
+        bridge._speak = speak
+        bridge._synthesize = lambda text: text
+        await bridge._respond(np.zeros(FRAME_SAMPLES * 10, dtype=np.int16))
+
+    asyncio.run(scenario())
+    assert llm.calls == [("openai:best-2024", False), ("groq", True)]
+    assert router.stats()["openai:best"]["error_rate"] == 1.0
+    assert spoken == ["Booked."]
+    assert (turns[0]["providers"]["llm"], turns[0]["outcome"], turns[0]["ai_text"]) == ("groq", "completed", "Booked.")
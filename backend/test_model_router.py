@@ -0,0 +1,79 @@
+import pytest
+
+from model_router import MIN_OUTPUT_TOKENS, ModelRouter
+
+PROFILES = {
+    "groq:fast": {"ttft_ms": 100, "tokens_per_second": 500, "prefill_ms_per_1k": 10, "concurrency": 2, "quality": 1},
+    "groq:smart": {"ttft_ms": 400, "tokens_per_second": 100, "prefill_ms_per_1k": 100, "concurrency": 2, "quality": 3},
+    "openai:best": {"ttft_ms": 900, "tokens_per_second": 50, "prefill_ms_per_1k": 150, "concurrency": 2,
+                    "quality": 5, "api_model": "best-2024"},
+}
+
+
+def agent(**fields):
+    return {"llm_provider": "groq", "llm_models": list(PROFILES), **fields}
+
+
+def test_agents_without_slo_or_models_keep_their_default():
+    route = ModelRouter(PROFILES).select({"llm_provider": "groq", "max_tokens": 80}, 100)
+    assert (route["key"], route["model"], route["max_tokens"], route["reason"]) == (None, None, 80, "default")
+
+
+def test_best_model_meeting_the_slo_wins():
+    router = ModelRouter(PROFILES)
+    assert router.select(agent(latency_slo_ms=2000), 100)["key"] == "openai:best"
+    assert router.select(agent(latency_slo_ms=700), 100)["key"] == "groq:smart"
+    # A long prompt pushes the smart model's prefill past the SLO
+    assert router.select(agent(latency_slo_ms=700), 3000)["key"] == "groq:fast"
+
+
+def test_fastest_model_when_nothing_meets_the_slo():
+    route = ModelRouter(PROFILES).select(agent(latency_slo_ms=50), 100)
+    assert (route["key"], route["reason"]) == ("groq:fast", "fastest")
+
+
+def test_providers_limit_candidates_and_api_model_is_used():
+    router = ModelRouter(PROFILES)
+    assert router.select(agent(latency_slo_ms=2000), 100, providers=["groq"])["key"] == "groq:smart"
+    assert router.select(agent(latency_slo_ms=2000), 100)["model"] == "openai:best-2024"
+
+
+def test_turn_budget_caps_output_tokens():
+    router = ModelRouter(PROFILES)
+    roomy = router.select(agent(latency_slo_ms=200, turn_budget_ms=10000, max_tokens=200), 100)
+    assert roomy["max_tokens"] == 200
+    tight = router.select(agent(latency_slo_ms=200, turn_budget_ms=1000, max_tokens=200), 100, elapsed_ms=400)
+    assert MIN_OUTPUT_TOKENS <= tight["max_tokens"] < 200
+    spent = router.select(agent(latency_slo_ms=200, turn_budget_ms=1000, max_tokens=200), 100, elapsed_ms=5000)
+    assert spent["max_tokens"] == MIN_OUTPUT_TOKENS
+
+
+def test_in_flight_load_and_errors_steer_away():
+    router = ModelRouter(PROFILES)
+    slo_agent = agent(latency_slo_ms=1500, llm_models=["groq:fast", "groq:smart"])
+    assert router.select(slo_agent, 100)["key"] == "groq:smart"
+
+    with router.track("groq:smart", 100), router.track("groq:smart", 100):
+        with router.track("groq:smart", 100), router.track("groq:smart", 100), router.track("groq:smart", 100):
+            # Five in flight on a model that handles two
+            assert router.select(slo_agent, 100)["key"] == "groq:fast"
+
+    for _ in range(10):
+        with router.track("groq:smart", 100) as observation:
+            observation["failed"] = True
+    assert router.stats()["groq:smart"]["error_rate"] > 0.5
+    assert router.select(slo_agent, 100)["key"] == "groq:fast"
+
+
+def test_track_updates_latency_estimate():
+    router = ModelRouter(PROFILES)
+    with router.track("groq:fast", 1000) as observation:
+        observation["ttft_ms"] = 1010
+        observation["output_tokens"] = 10
+    stats = router.stats()["groq:fast"]
+    assert stats["samples"] == 1
+    assert stats["ttft_ms"] > 100
+    with pytest.raises(RuntimeError):
+        with router.track("groq:fast", 100):
+            raise RuntimeError("provider error")
+    assert router.stats()["groq:fast"]["error_rate"] == 0.5
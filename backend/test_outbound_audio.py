@@ -0,0 +1,143 @@
+import asyncio
+import base64
+import io
+import json
+import wave
+
+import pytest
+
+from outbound_audio import AudioFramer, DEFAULT_BYTE_RATE, OutboundScheduler
+
+
+def wav_bytes(duration_ms: int, sample_rate: int = 16000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        size = sample_rate * 2 * duration_ms // 1000
+        wav.writeframes((bytes(range(256)) * (size // 256 + 1))[:size])
+    return buffer.getvalue()
+
+
+def frame_all(data: bytes, chunk_size: int, frame_ms: int = 100):
+    framer = AudioFramer(frame_ms)
+    frames = []
+    for start in range(0, len(data), chunk_size):
+        frames += [(bytes(frame), ms) for frame, ms in framer.feed(data[start:start + chunk_size])]
+    frames += [(bytes(frame), ms) for frame, ms in framer.flush()]
+    return frames
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 44, 1000, 3200, 4096, 100000])
+def test_wav_frames_reassemble_exactly(chunk_size):
+    data = wav_bytes(1050)
+    frames = frame_all(data, chunk_size)
+    assert b"".join(frame for frame, _ in frames) == data
+    # 16 kHz mono 16-bit: 3200 bytes per 100 ms frame, the header riding with the first
+    assert [ms for _, ms in frames] == [100.0] * 10 + [50.0]
+    assert frames[0][0][:4] == b"RIFF"
+    assert all(len(frame) == 3200 for frame, _ in frames[1:-1])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1600, 5000])
+def test_other_formats_are_paced_by_default_byte_rate(chunk_size):
+    data = bytes(range(256)) * 40
+    frames = frame_all(data, chunk_size)
+    assert b"".join(frame for frame, _ in frames) == data
+    step = DEFAULT_BYTE_RATE // 10
+    assert [len(frame) for frame, _ in frames] == [step] * (len(data) // step) + [len(data) % step]
+    assert sum(ms for _, ms in frames) == pytest.approx(len(data) * 1000 / DEFAULT_BYTE_RATE)
+
+
+def test_frames_are_views_of_the_input():
+    framer = AudioFramer(100)
+    framer.feed(wav_bytes(100)[:44])
+    frames = framer.feed(bytes(6400))
+    assert len(frames) == 2
+    assert isinstance(frames[1][0], memoryview)
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.sent.append(bytes(data))
+
+
+async def run_scheduler(scheduler, produce, wait_s=0.2):
+    sender = asyncio.create_task(scheduler.run())
+    await produce()
+    await asyncio.sleep(wait_s)
+    scheduler.close()
+    sender.cancel()
+
+
+def test_control_messages_overtake_queued_audio():
+    websocket = RecordingSocket()
+    scheduler = OutboundScheduler(websocket, lead_ms=100)
+
+    async def produce():
+        for seq in range(5):
+            await scheduler.put_audio({"type": "audio_chunk", "seq": seq}, 100.0, frame=b"abc")
+        await asyncio.sleep(0.05)
+        scheduler.put_control({"type": "transcription", "text": "hi"})
+
+    asyncio.run(run_scheduler(scheduler, produce))
+    kinds = [message.get("seq", message["type"]) for message in websocket.sent]
+    # Lead of 100 ms lets one 100 ms frame out ahead of playback before the control message
+    assert kinds[:3] == [0, 1, "transcription"]
+    assert websocket.sent[0]["audio"] == base64.b64encode(b"abc").decode()
+
+
+def test_binary_format_sends_raw_frames():
+    websocket = RecordingSocket()
+    scheduler = OutboundScheduler(websocket, audio_format="binary")
+
+    async def produce():
+        await scheduler.put_audio({"type": "audio_chunk", "seq": 0}, 10.0, frame=memoryview(b"raw-frame"))
+        await scheduler.put_audio({"type": "audio_end"})
+
+    asyncio.run(run_scheduler(scheduler, produce, 0.05))
+    assert websocket.sent == [b"raw-frame", {"type": "audio_end"}]
+    assert scheduler.stats()["audio_bytes_sent"] == len(b"raw-frame")
+
+
+def test_flush_drops_unsent_audio():
+    websocket = RecordingSocket()
+    scheduler = OutboundScheduler(websocket, lead_ms=0)
+
+    async def produce():
+        for seq in range(10):
+            await scheduler.put_audio({"type": "audio_chunk", "seq": seq}, 500.0, frame=b"x")
+        await asyncio.sleep(0.01)
+        assert scheduler.flush_audio() == 9
+        assert scheduler.playback_remaining_ms() == 0.0
+
+    asyncio.run(run_scheduler(scheduler, produce, 0.05))
+    assert [message["seq"] for message in websocket.sent] == [0]
+    assert scheduler.audio_dropped == 9
+
+
+def test_full_buffer_makes_producers_wait():
+    websocket = RecordingSocket()
+    scheduler = OutboundScheduler(websocket, lead_ms=0, buffer_ms=300)
+
+    async def scenario():
+        for seq in range(3):
+            await scheduler.put_audio({"type": "audio_chunk", "seq": seq}, 100.0, frame=b"x")
+        blocked = asyncio.create_task(scheduler.put_audio({"type": "audio_chunk", "seq": 3}, 100.0, frame=b"x"))
+        await asyncio.sleep(0.01)
+        waiting = not blocked.done()
+        sender = asyncio.create_task(scheduler.run())
+        await asyncio.wait_for(blocked, 1)
+        scheduler.close()
+        sender.cancel()
+        return waiting
+
+    assert asyncio.run(scenario())
+    assert scheduler.max_queued_ms == 300.0
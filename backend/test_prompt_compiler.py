@@ -0,0 +1,66 @@
+from prompt_compiler import LANGUAGE_CONTEXT, MAX_FEW_SHOT_EXAMPLES, PromptCompiler, build_system_prompt
+
+
+def agent(**fields):
+    return {"id": "agent-1", "version": 1, "system_instruction": "You book tables.", **fields}
+
+
+def test_prompt_sections_are_in_a_fixed_order():
+    text = build_system_prompt("  You book tables. ", "hi-IN", channel="phone")
+    sections = text.split("\n\n")
+    assert sections[0] == "You book tables."
+    assert sections[1] == LANGUAGE_CONTEXT["hi"]
+    assert sections[-1].startswith("You are on a phone call")
+
+
+def test_few_shot_examples_are_filtered_by_language_and_capped():
+    examples = [
+        {"user": "Hi", "assistant": "Namaste", "language": "hi"},
+        {"user": "Vanakkam", "assistant": "Vanakkam", "language": "ta"},
+        {"user": "Table for two?", "assistant": "Sure"},
+    ] + [{"user": f"q{i}", "assistant": f"a{i}"} for i in range(MAX_FEW_SHOT_EXAMPLES)]
+    text = build_system_prompt("Instruction", "hi", examples)
+    assert "Agent: Namaste" in text
+    assert "Vanakkam" not in text
+    assert text.count("Caller: ") == MAX_FEW_SHOT_EXAMPLES
+
+
+def test_compiled_prompt_is_cached_per_version_language_and_channel():
+    compiler = PromptCompiler()
+    first = compiler.compile(agent(), "hi")
+    assert compiler.compile(agent(), "hi-IN") is first
+    assert compiler.stats() == {"entries": 1, "hits": 1, "compiles": 1}
+
+    assert compiler.compile(agent(), "ta")["text"] != first["text"]
+    assert compiler.compile(agent(), "hi", channel="phone")["text"] != first["text"]
+    updated = compiler.compile(agent(version=2, system_instruction="You take orders."), "hi")
+    assert updated["text"].startswith("You take orders.")
+    assert updated["hash"] != first["hash"]
+    assert compiler.stats()["compiles"] == 4
+
+
+def test_hash_is_stable_for_identical_text():
+    a = PromptCompiler().compile(agent(), "en")
+    b = PromptCompiler().compile(agent(id="agent-2"), "en")
+    assert a["hash"] == b["hash"]
+    assert a["tokens"] > 0
+
+
+def test_invalidate_drops_only_that_agent():
+    compiler = PromptCompiler()
+    compiler.compile(agent(), "hi")
+    compiler.compile(agent(), "en")
+    compiler.compile(agent(id="agent-2"), "hi")
+    assert compiler.invalidate("agent-1") == 2
+    assert compiler.stats()["entries"] == 1
+
+
+def test_cache_is_lru_bounded():
+    compiler = PromptCompiler(max_entries=2)
+    compiler.compile(agent(), "hi")
+    compiler.compile(agent(), "en")
+    compiler.compile(agent(), "hi")
+    compiler.compile(agent(), "ta")
+    assert compiler.stats()["entries"] == 2
+    compiler.compile(agent(), "hi")
+    assert compiler.hits == 2
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+class SlowCall:
+    def __init__(self, result="audio"):
+        self.result = result
+        self.started = 0
+        self.cancelled = 0
+        self.release = None
+
+    async def __call__(self):
+        self.started += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def test_concurrent_calls_share_one_execution():
+    call = SlowCall()
+    flight = SingleFlight("tts")
+
+    async def scenario():
+        call.release = asyncio.Event()
+        waiters = [asyncio.create_task(flight.do("hello", call)) for _ in range(50)]
+        await asyncio.sleep(0)
+        call.release.set()
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(scenario())
+    assert results == ["audio"] * 50
+    assert call.started == 1
+    assert flight.stats() == {"in_flight": 0, "calls": 1, "coalesced": 49}
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    call = SlowCall(ValueError("provider down"))
+    flight = SingleFlight()
+
+    async def scenario():
+        call.release = asyncio.Event()
+        waiters = [asyncio.create_task(flight.do("k", call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        call.release.set()
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        call.result = "ok"
+        return results, await flight.do("k", call)
+
+    results, retry = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert retry == "ok"
+    assert call.started == 2
+
+
+def test_one_waiter_cancelling_does_not_cancel_the_others():
+    call = SlowCall()
+    flight = SingleFlight()
+
+    async def scenario():
+        call.release = asyncio.Event()
+        leaving = asyncio.create_task(flight.do("k", call))
+        staying = asyncio.create_task(flight.do("k", call))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        call.release.set()
+        return leaving, await staying
+
+    leaving, result = asyncio.run(scenario())
+    assert leaving.cancelled()
+    assert result == "audio"
+    assert call.cancelled == 0
+
+
+def test_last_waiter_cancelling_stops_the_work():
+    call = SlowCall()
+    flight = SingleFlight()
+
+    async def scenario():
+        call.release = asyncio.Event()
+        waiter = asyncio.create_task(flight.do("k", call))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+        return flight.stats()
+
+    stats = asyncio.run(scenario())
+    assert call.cancelled == 1
+    assert stats["in_flight"] == 0
+
+
+def test_forget_starts_a_fresh_call_for_new_callers():
+    call = SlowCall()
+    flight = SingleFlight()
+
+    async def scenario():
+        call.release = asyncio.Event()
+        before = asyncio.create_task(flight.do("agent", call))
+        await asyncio.sleep(0)
+        flight.forget("agent")
+        after = asyncio.create_task(flight.do("agent", call))
+        await asyncio.sleep(0)
+        call.release.set()
+        return await asyncio.gather(before, after)
+
+    assert asyncio.run(scenario()) == ["audio", "audio"]
+    assert call.started == 2
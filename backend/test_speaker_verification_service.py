@@ -0,0 +1,106 @@
+import asyncio
+
+import numpy as np
+from scipy.signal import lfilter
+
+from audio_processing import encode_wav
+from speaker_verification_service import DEFAULT_THRESHOLD, MIN_BACKGROUND_SPEAKERS, SpeakerVerificationService
+
+SAMPLE_RATE = 16000
+VOWEL_FORMANTS = [(730, 1090, 2440), (270, 2290, 3010), (300, 870, 2240), (530, 1840, 2480), (640, 1190, 2390)]
+# Pitch, vocal-tract length scale and spectral tilt of a few clearly different voices
+VOICES = {
+    "low": (95.0, 1.18, 0.96),
+    "high": (230.0, 0.86, 0.88),
+    "mid": (150.0, 1.0, 0.92),
+    "bright": (120.0, 0.9, 0.86),
+}
+
+
+def utterance(voice, rng, seconds=3.0):
+    """Source-filter vowel sequence: a glottal pulse train through three formant resonators"""
+    f0, scale, tilt = voice
+    segment = int(0.2 * SAMPLE_RATE)
+    parts = []
+    for _ in range(int(seconds / 0.25)):
+        source = np.zeros(segment)
+        source[::int(SAMPLE_RATE / (f0 * rng.uniform(0.95, 1.05)))] = 1.0
+        signal = lfilter([1], [1, -tilt], source) + 0.02 * rng.standard_normal(segment)
+        for formant in VOWEL_FORMANTS[rng.integers(len(VOWEL_FORMANTS))]:
+            r = np.exp(-np.pi * 80 / SAMPLE_RATE)
+            signal = lfilter([1 - r], [1, -2 * r * np.cos(2 * np.pi * formant * scale / SAMPLE_RATE), r * r], signal)
+        parts += [signal * np.hanning(segment), np.zeros(int(0.05 * SAMPLE_RATE))]
+    samples = np.concatenate(parts)
+    return (samples / np.abs(samples).max() * 0.5 + 0.003 * rng.standard_normal(samples.size)).astype(np.float32)
+
+
+def write_utterances(tmp_path, name, voice, count, rng):
+    paths = []
+    for index in range(count):
+        path = tmp_path / f"{name}-{index}.wav"
+        path.write_bytes(encode_wav(utterance(voice, rng)))
+        paths.append(str(path))
+    return paths
+
+
+def service_in(tmp_path):
+    service = SpeakerVerificationService()
+    service.enrollment_dir = str(tmp_path / "enrollments")
+    (tmp_path / "enrollments").mkdir()
+    return service
+
+
+def test_same_speaker_is_accepted_and_others_rejected(tmp_path):
+    rng = np.random.default_rng(4)
+    service = service_in(tmp_path)
+
+    async def scenario():
+        for name, voice in VOICES.items():
+            enrolled = await service.enroll(name, write_utterances(tmp_path, f"enroll-{name}", voice, 3, rng))
+            assert enrolled["success"]
+        return {
+            name: await service.verify_batch(write_utterances(tmp_path, f"probe-{name}", voice, 3, rng), "low")
+            for name, voice in VOICES.items()
+        }
+
+    results = asyncio.run(scenario())
+    genuine = results.pop("low")
+    impostors = [result for probes in results.values() for result in probes]
+    assert all(result["speaker_verified"] for result in genuine)
+    assert genuine[0]["threshold"] == DEFAULT_THRESHOLD
+    assert not any(result["speaker_verified"] for result in impostors)
+    assert max(result["confidence"] for result in impostors) < min(result["confidence"] for result in genuine)
+
+
+def test_verification_fails_closed_until_enough_speakers_are_enrolled(tmp_path):
+    rng = np.random.default_rng(4)
+    service = service_in(tmp_path)
+    names = list(VOICES)[:MIN_BACKGROUND_SPEAKERS]
+
+    async def scenario():
+        for name in names[:-1]:
+            await service.enroll(name, write_utterances(tmp_path, name, VOICES[name], 2, rng))
+        probe = write_utterances(tmp_path, "probe", VOICES[names[0]], 1, rng)[0]
+        too_few = await service.verify(probe, names[0])
+        await service.enroll(names[-1], write_utterances(tmp_path, names[-1], VOICES[names[-1]], 2, rng))
+        return too_few, await service.verify(probe, names[0])
+
+    too_few, enough = asyncio.run(scenario())
+    assert not too_few["speaker_verified"]
+    assert "enrolled speakers" in too_few["error"]
+    assert "error" not in enough
+
+
+def test_unknown_and_deleted_speakers_are_not_verified(tmp_path):
+    rng = np.random.default_rng(5)
+    service = service_in(tmp_path)
+
+    async def scenario():
+        for name, voice in VOICES.items():
+            await service.enroll(name, write_utterances(tmp_path, name, voice, 1, rng))
+        assert service.delete_speaker("mid")
+        probe = write_utterances(tmp_path, "probe", VOICES["mid"], 1, rng)[0]
+        return await service.verify(probe, "mid"), await service.verify(probe, "nobody")
+
+    deleted, unknown = asyncio.run(scenario())
+    assert deleted == unknown == {"speaker_verified": False, "confidence": 0.0, "error": "Speaker not enrolled"}
@@ -0,0 +1,134 @@
+import asyncio
+
+from speculative_llm import SpeculativeResponder, normalize_transcript
+
+
+class FakeGenerator:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+        self.cancelled = []
+        self.elapsed = []
+
+    async def __call__(self, text: str, elapsed_ms: float = 0.0, route=None) -> str:
+        self.calls.append(text)
+        self.elapsed.append(elapsed_ms)
+        if route is not None:
+            route["key"] = f"model for {normalize_transcript(text)}"
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(text)
+            raise
+        return f"reply to {normalize_transcript(text)}"
+
+
+def test_normalize_transcript_ignores_case_and_punctuation():
+    assert normalize_transcript("  What are your HOURS? ") == "what are your hours"
+
+
+def test_matching_final_transcript_reuses_speculation():
+    generate = FakeGenerator()
+
+    async def scenario():
+        responder = SpeculativeResponder(generate)
+        responder.on_partial("what are your hours", confidence=0.95, stable=True)
+        await asyncio.sleep(0)
+        return responder, await responder.resolve("What are your hours?")
+
+    responder, response = asyncio.run(scenario())
+    assert response == "reply to what are your hours"
+    assert generate.calls == ["what are your hours"]
+    assert responder.stats == {"launched": 1, "committed": 1, "discarded": 0}
+
+
+def test_mismatched_final_transcript_cancels_speculation_and_regenerates():
+    generate = FakeGenerator(delay=1.0)
+
+    async def scenario():
+        responder = SpeculativeResponder(generate)
+        responder.on_partial("what are your", confidence=0.95, stable=True)
+        await asyncio.sleep(0)
+        generate.delay = 0.0
+        return responder, await responder.resolve("what are your prices")
+
+    responder, response = asyncio.run(scenario())
+    assert response == "reply to what are your prices"
+    assert generate.cancelled == ["what are your"]
+    assert responder.stats["discarded"] == 1
+    assert responder.wasted_tokens > 0
+
+
+def test_unstable_or_low_confidence_partials_do_not_launch():
+    generate = FakeGenerator()
+
+    async def scenario():
+        responder = SpeculativeResponder(generate, confidence_threshold=0.9)
+        responder.on_partial("hello", confidence=0.95, stable=False)
+        responder.on_partial("hello there", confidence=0.5, stable=True)
+        await asyncio.sleep(0)
+        return responder
+
+    responder = asyncio.run(scenario())
+    assert generate.calls == []
+    assert responder.stats["launched"] == 0
+
+
+def test_repeated_partial_counts_as_stable():
+    generate = FakeGenerator()
+
+    async def scenario():
+        responder = SpeculativeResponder(generate)
+        responder.on_partial("book a table", confidence=0.95)
+        responder.on_partial("book a table", confidence=0.95)
+        await asyncio.sleep(0)
+        responder.cancel()
+
+    asyncio.run(scenario())
+    assert generate.calls == ["book a table"]
+
+
+def test_cost_cap_stops_new_speculations():
+    generate = FakeGenerator(delay=1.0)
+
+    async def scenario():
+        responder = SpeculativeResponder(generate, cost_cap_tokens=1)
+        responder.on_partial("first guess", confidence=0.95, stable=True)
+        await asyncio.sleep(0)
+        responder.on_partial("second guess", confidence=0.95, stable=True)
+        await asyncio.sleep(0)
+        # The cap is now spent on the discarded first guess
+        responder.on_partial("third guess", confidence=0.95, stable=True)
+        await asyncio.sleep(0)
+        responder.cancel()
+
+    asyncio.run(scenario())
+    assert generate.calls == ["first guess", "second guess"]
+
+
+def test_disabled_agents_get_no_responder():
+    assert SpeculativeResponder.for_agent({}, FakeGenerator()) is None
+    responder = SpeculativeResponder.for_agent(
+        {"speculative_mode": True, "speculative_confidence_threshold": 0.7}, FakeGenerator()
+    )
+    assert responder.confidence_threshold == 0.7
+
+
+def test_resolve_reports_the_route_of_the_response_it_returns():
+    generate = FakeGenerator()
+
+    async def scenario():
+        responder = SpeculativeResponder(generate)
+        responder.on_partial("what are your hours", confidence=0.95, stable=True)
+        await asyncio.sleep(0)
+        committed = {}
+        await responder.resolve("what are your hours", elapsed_ms=420.0, route=committed)
+        regenerated = {}
+        await responder.resolve("book a table", elapsed_ms=380.0, route=regenerated)
+        return committed, regenerated
+
+    committed, regenerated = asyncio.run(scenario())
+    assert committed == {"key": "model for what are your hours"}
+    assert regenerated == {"key": "model for book a table"}
+    # The speculation ran before the turn ended; the regeneration carries the turn's elapsed time
+    assert generate.elapsed == [0.0, 380.0]
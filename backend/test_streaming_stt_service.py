@@ -0,0 +1,175 @@
+import asyncio
+import json
+
+try:
+    from websockets.asyncio.server import serve
+except ImportError:
+    from websockets import serve
+
+from streaming_stt_service import AssemblyAIStreamingSession, DeepgramStreamingSession, open_streaming_session
+
+
+def deepgram_result(text: str, is_final: bool = False, speech_final: bool = False, confidence: float = 0.9) -> str:
+    return json.dumps({
+        "type": "Results",
+        "is_final": is_final,
+        "speech_final": speech_final,
+        "channel": {"alternatives": [{"transcript": text, "confidence": confidence}]},
+    })
+
+
+class FakeProvider:
+    """Local stand-in for a provider socket: records what each connection received, replies with a script"""
+
+    def __init__(self, script=(), drop_first_after: int = 0):
+        self.script = list(script)
+        self.drop_first_after = drop_first_after
+        self.connections = []
+        self.received = []
+        self.server = None
+
+    async def handler(self, websocket, *args):
+        index = len(self.connections)
+        received = []
+        self.connections.append(websocket)
+        self.received.append(received)
+        if index == 0:
+            for message in self.script:
+                await websocket.send(message)
+        async for message in websocket:
+            received.append(message)
+            if index == 0 and self.drop_first_after and len(received) >= self.drop_first_after:
+                await websocket.close()
+                return
+            if isinstance(message, str) and json.loads(message).get("type") == "CloseStream":
+                await websocket.close()
+                return
+
+    async def __aenter__(self):
+        self.server = await serve(self.handler, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.url = f"ws://127.0.0.1:{port}"
+        return self
+
+    async def __aexit__(self, *exc):
+        self.server.close()
+        await self.server.wait_closed()
+
+    def audio(self, connection: int) -> list:
+        return [m for m in self.received[connection] if isinstance(m, bytes)]
+
+
+async def wait_for(condition, timeout: float = 3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+
+async def next_events(session, count: int) -> list:
+    events = []
+    iterator = session.__aiter__()
+    for _ in range(count):
+        events.append(await asyncio.wait_for(iterator.__anext__(), 3.0))
+    return events
+
+
+def test_deepgram_interim_and_final_transcripts():
+    script = [
+        json.dumps({"type": "Metadata"}),
+        deepgram_result("what are"),
+        deepgram_result("what are your", is_final=True),
+        deepgram_result("opening"),
+        deepgram_result("opening hours", is_final=True, speech_final=True, confidence=0.97),
+    ]
+
+    async def scenario():
+        async with FakeProvider(script) as provider:
+            session = DeepgramStreamingSession("key", base_url=provider.url, keepalive_interval=60)
+            await session.connect()
+            events = await next_events(session, 4)
+            await session.close()
+            return events
+
+    events = asyncio.run(scenario())
+    assert [(e["text"], e["is_final"], e["stable"]) for e in events] == [
+        ("what are", False, False),
+        ("what are your", False, True),
+        ("what are your opening", False, False),
+        ("what are your opening hours", True, True),
+    ]
+    assert events[-1]["confidence"] == 0.97
+    assert all(e["provider"] == "deepgram" for e in events)
+
+
+def test_deepgram_multilingual_mode_reports_languages():
+    single = DeepgramStreamingSession("key", language="hi")
+    assert "language=hi" in single._url() and "model=nova-2" in single._url()
+
+    session = DeepgramStreamingSession("key", language="auto")
+    assert "language=multi" in session._url() and "model=nova-3" in session._url()
+    event = session._parse(json.dumps({
+        "type": "Results", "is_final": True, "speech_final": True,
+        "channel": {"alternatives": [{"transcript": "kal milte hain", "confidence": 0.9, "languages": ["hi"]}]},
+    }))
+    assert event["language"] == "hi"
+
+
+def test_assemblyai_turns():
+    session = AssemblyAIStreamingSession("key")
+    assert session._parse(json.dumps({"type": "Begin"})) is None
+    partial = session._parse(json.dumps({
+        "type": "Turn", "transcript": "namaste", "end_of_turn": False, "words": [{"confidence": 0.8}]
+    }))
+    final = session._parse(json.dumps({
+        "type": "Turn", "transcript": "namaste ji", "end_of_turn": True, "language_code": "hi",
+        "words": [{"confidence": 0.9}, {"confidence": 0.7}]
+    }))
+    assert (partial["is_final"], partial["confidence"]) == (False, 0.8)
+    assert (final["is_final"], final["stable"], final["language"]) == (True, True, "hi")
+    assert abs(final["confidence"] - 0.8) < 1e-9
+
+
+def test_keepalive_is_sent_while_idle():
+    async def scenario():
+        async with FakeProvider() as provider:
+            session = DeepgramStreamingSession("key", base_url=provider.url, keepalive_interval=0.05)
+            await session.connect()
+            await wait_for(lambda: provider.received and len(provider.received[0]) >= 2)
+            await session.close()
+            return provider.received[0]
+
+    received = asyncio.run(scenario())
+    assert json.loads(received[0]) == {"type": "KeepAlive"}
+
+
+def test_reconnect_replays_buffered_audio():
+    async def scenario():
+        async with FakeProvider(drop_first_after=1) as provider:
+            session = DeepgramStreamingSession("key", base_url=provider.url, keepalive_interval=60)
+            await session.connect()
+            await session.send_audio(b"frame-1")
+            # The provider drops the socket after the first frame
+            await wait_for(lambda: not session._connected.is_set())
+            await session.send_audio(b"frame-2")
+            await session.send_audio(b"frame-3")
+            await wait_for(lambda: len(provider.connections) == 2 and len(provider.audio(1)) == 2)
+            await session.send_audio(b"frame-4")
+            await wait_for(lambda: len(provider.audio(1)) == 3)
+            await session.close()
+            return provider
+
+    provider = asyncio.run(scenario())
+    assert provider.audio(0) == [b"frame-1"]
+    assert provider.audio(1) == [b"frame-2", b"frame-3", b"frame-4"]
+
+
+def test_unsupported_provider_is_rejected():
+    async def scenario():
+        try:
+            await open_streaming_session("replicate_whisper")
+        except ValueError as e:
+            return str(e)
+
+    assert "replicate_whisper" in asyncio.run(scenario())
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import tts_service
+from tts_service import TTSService
+
+
+async def provider_stream(chunks, fail_after=None):
+    for index, chunk in enumerate(chunks):
+        if fail_after is not None and index == fail_after:
+            raise ConnectionError("provider dropped the stream")
+        yield chunk
+    if fail_after is not None and fail_after >= len(chunks):
+        raise ConnectionError("provider dropped the stream")
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_streaming_provider_chunks_are_forwarded_as_they_arrive():
+    service = TTSService()
+    service._stream_elevenlabs = lambda text, language: provider_stream([b"a", b"b", b"c"])
+    assert asyncio.run(collect(service.synthesize_stream("hi", "hi", model="elevenlabs"))) == [b"a", b"b", b"c"]
+
+
+def test_stream_failure_before_audio_falls_back_to_replicate(monkeypatch):
+    service = TTSService()
+    service._stream_elevenlabs = lambda text, language: provider_stream([b"a"], fail_after=0)
+
+    async def replicate(text, language):
+        return "https://replicate.example/out.wav"
+
+    downloads = []
+
+    async def download(url, chunk_size=None):
+        downloads.append(url)
+        yield b"wav-1"
+        yield b"wav-2"
+
+    service._call_replicate = replicate
+    monkeypatch.setattr(tts_service, "stream_audio_url", download)
+    chunks = asyncio.run(collect(service.synthesize_stream("hi", "hi", model="elevenlabs")))
+    assert chunks == [b"wav-1", b"wav-2"]
+    assert downloads == ["https://replicate.example/out.wav"]
+
+
+def test_stream_failure_after_audio_is_not_replayed():
+    service = TTSService()
+    service._stream_elevenlabs = lambda text, language: provider_stream([b"a", b"b"], fail_after=1)
+
+    async def replicate(text, language):
+        raise AssertionError("a fallback would replay the clip from the start")
+
+    service._call_replicate = replicate
+    received = []
+
+    async def consume():
+        async for chunk in service.synthesize_stream("hi", "hi", model="elevenlabs"):
+            received.append(chunk)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(consume())
+    assert received == [b"a"]
+
+
+def test_non_streaming_provider_is_sent_as_one_chunk():
+    service = TTSService()
+
+    async def google(text, language):
+        return b"mp3-bytes"
+
+    service._call_google_tts = google
+    assert asyncio.run(collect(service.synthesize_stream("hi", "hi", model="google-tts"))) == [b"mp3-bytes"]
+
+
+def test_collect_audio_returns_the_whole_clip():
+    clip = asyncio.run(tts_service.collect_audio(provider_stream([b"ab", b"", b"cd"])))
+    assert clip.readonly
+    assert bytes(clip) == b"abcd"
+
+
+def test_synthesize_returns_urls_or_audio_bytes():
+    service = TTSService()
+
+    async def replicate(text, language):
+        return "https://replicate.example/out.wav"
+
+    async def google(text, language):
+        return b"mp3-bytes"
+
+    async def elevenlabs(text, language):
+        return memoryview(b"mp3-view")
+
+    service._call_replicate, service._call_google_tts, service._call_elevenlabs = replicate, google, elevenlabs
+    results = [asyncio.run(service.synthesize("hi", "hi", model)) for model in ("replicate-xtts", "google-tts", "elevenlabs")]
+    assert results[0] == "https://replicate.example/out.wav"
+    assert isinstance(results[1], bytes)
+    assert isinstance(results[2], memoryview) and bytes(results[2]) == b"mp3-view"
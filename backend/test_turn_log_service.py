@@ -0,0 +1,88 @@
+import asyncio
+import threading
+
+import pytest
+
+from turn_log_service import TurnLog, turn_record
+
+
+def turn(agent_id="agent-1", session_id="s1", text="hi", ts=None):
+    record = turn_record(agent_id, session_id, text, "hello", "hi", {"llm": "groq"}, {"llm": 120.04})
+    if ts:
+        record["ts"] = ts
+    return record
+
+
+def test_turns_round_trip_through_segments_and_index(tmp_path):
+    log = TurnLog(str(tmp_path))
+
+    async def scenario():
+        for i in range(5):
+            log.append(turn(text=f"turn {i}", ts=f"2026-10-0{i + 1}T10:00:00"))
+        log.append(turn(agent_id="agent-2"))
+        assert await log.flush() == 6
+        return (
+            await log.query(agent_id="agent-1", limit=3),
+            await log.query(agent_id="agent-1", date_from="2026-10-02", date_to="2026-10-04"),
+        )
+
+    latest, ranged = asyncio.run(scenario())
+    assert [record["user_text"] for record in latest] == ["turn 4", "turn 3", "turn 2"]
+    assert latest[0]["latency_ms"] == {"llm": 120.0}
+    # A bare end date includes that whole day
+    assert [record["user_text"] for record in ranged] == ["turn 3", "turn 2", "turn 1"]
+    assert log.stats()["buffered"] == 0
+
+
+def test_batch_being_written_stays_visible_to_queries(tmp_path):
+    log = TurnLog(str(tmp_path))
+    write_batch = log._write_batch
+    started, release = threading.Event(), threading.Event()
+
+    def slow_write(batch):
+        started.set()
+        release.wait(2)
+        write_batch(batch)
+
+    async def scenario():
+        log.append(turn(text="old", ts="2026-10-01T09:00:00"))
+        await log.flush()
+        log._write_batch = slow_write
+        log.append(turn(text="writing"))
+        flushing = asyncio.create_task(log.flush())
+        await asyncio.to_thread(started.wait, 2)
+        log.append(turn(text="buffered"))
+        during = await log.query(agent_id="agent-1")
+        release.set()
+        await flushing
+        return during, await log.query(agent_id="agent-1")
+
+    during, after = asyncio.run(scenario())
+    assert [record["user_text"] for record in during] == ["buffered", "writing", "old"]
+    assert [record["user_text"] for record in after] == ["buffered", "writing", "old"]
+
+
+def test_in_flight_turns_are_not_repeated_once_indexed(tmp_path):
+    log = TurnLog(str(tmp_path))
+    log.append(turn(text="first"))
+    log.append(turn(text="second"))
+    batch = list(log._buffer)
+    asyncio.run(log.flush())
+    # As if the index commit finished while a query still saw the batch as in flight
+    log._in_flight = batch
+    results = asyncio.run(log.query(limit=10))
+    assert [record["user_text"] for record in results] == ["second", "first"]
+
+
+def test_failed_write_puts_the_batch_back(tmp_path):
+    log = TurnLog(str(tmp_path))
+
+    def failing_write(batch):
+        raise OSError("disk full")
+
+    log._write_batch = failing_write
+    log.append(turn(text="kept"))
+    with pytest.raises(OSError):
+        asyncio.run(log.flush())
+    assert log._in_flight == []
+    assert [record["user_text"] for record in log._buffer] == ["kept"]
@@ -0,0 +1,127 @@
+import asyncio
+import io
+import json
+import wave
+
+from voice_session import VoiceSession
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.sent.append(bytes(data))
+
+
+def wav_clip(duration_ms: int, sample_rate: int = 8000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"\x00\x00" * (sample_rate * duration_ms // 1000))
+    return buffer.getvalue()
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_interrupt_is_a_no_op_when_idle():
+    async def scenario():
+        session = VoiceSession(FakeWebSocket(), "agent")
+        session.start()
+        result = await session.interrupt()
+        await session.close()
+        return result, session.transcript
+
+    result, transcript = run(scenario())
+    assert result is None
+    assert transcript == []
+
+
+def test_interrupt_cancels_in_flight_turn():
+    async def scenario():
+        websocket = FakeWebSocket()
+        session = VoiceSession(websocket, "agent")
+        session.start()
+        reached = asyncio.Event()
+        state = {"cancelled": False}
+
+        async def turn():
+            session.set_user_text("hello")
+            session.set_ai_text("a reply that is still generating")
+            reached.set()
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                state["cancelled"] = True
+                raise
+
+        task = session.start_turn(turn())
+        await reached.wait()
+        spoken = await session.interrupt()
+        await asyncio.sleep(0.01)
+        responding = session.is_responding()
+        await session.close()
+        return task, state, spoken, session, websocket, responding
+
+    task, state, spoken, session, websocket, responding = run(scenario())
+    assert task.cancelled()
+    assert state["cancelled"]
+    # Nothing was played yet, so nothing was heard
+    assert spoken == ""
+    assert [entry["role"] for entry in session.transcript] == ["user"]
+    assert {"type": "interrupted", "spoken_text": ""} in websocket.sent
+    assert not responding
+
+
+def test_interrupt_during_playback_trims_recorded_response():
+    async def scenario():
+        websocket = FakeWebSocket()
+        session = VoiceSession(websocket, "agent")
+        session.start()
+
+        async def turn():
+            session.set_user_text("what are your hours")
+            session.set_ai_text("we are open from nine to five on all weekdays")
+            await session.send_audio(wav_clip(1000), 0, 1000.0)
+
+        await session.start_turn(turn())
+        await asyncio.sleep(0.01)
+        assert session.is_responding()
+        spoken = await session.interrupt(played_ms=500)
+        await asyncio.sleep(0.01)
+        await session.close()
+        return spoken, session, websocket
+
+    spoken, session, websocket = run(scenario())
+    assert spoken == "we are open from nine"
+    assistant = [entry for entry in session.transcript if entry["role"] == "assistant"]
+    assert len(assistant) == 1
+    assert assistant[0]["content"] == "we are open from nine"
+    assert assistant[0]["interrupted"] is True
+    assert websocket.sent[-1] == {"type": "interrupted", "spoken_text": "we are open from nine"}
+
+
+def test_completed_turn_is_recorded_in_full():
+    async def scenario():
+        session = VoiceSession(FakeWebSocket(), "agent")
+        session.start()
+
+        async def turn():
+            session.set_user_text("hi")
+            session.set_ai_text("hello there")
+
+        await session.start_turn(turn())
+        await asyncio.sleep(0)
+        await session.close()
+        return session
+
+    session = run(scenario())
+    assert session.transcript[-1]["content"] == "hello there"
+    assert session.transcript[-1]["interrupted"] is False
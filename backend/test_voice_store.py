@@ -0,0 +1,114 @@
+import numpy as np
+
+import voice_store
+from state_backend import SQLiteStateBackend
+from voice_store import VoiceStore
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_nearest_ranks_by_cosine_similarity(tmp_path):
+    store = VoiceStore(str(tmp_path))
+    store.add("a", {"name": "A"}, [1.0, 0.0, 0.0])
+    store.add("b", {"name": "B"}, [0.8, 0.6, 0.0])
+    store.add("c", {"name": "C"}, [0.0, 0.0, 1.0])
+
+    matches = store.nearest([1.0, 0.1, 0.0], k=2)
+    assert [voice_id for voice_id, _ in matches] == ["a", "b"]
+    assert matches[0][1] > matches[1][1]
+    assert [voice_id for voice_id, _ in store.nearest([1.0, 0.0, 0.0], k=3, exclude="a")] == ["b", "c"]
+    assert store.nearest([1.0, 0.0]) == []
+
+
+def test_find_duplicate_uses_threshold(tmp_path):
+    store = VoiceStore(str(tmp_path))
+    store.add("speaker", {}, unit(1.0, 0.2, 0.1))
+    assert store.find_duplicate(unit(1.0, 0.21, 0.1)) == "speaker"
+    assert store.find_duplicate(unit(0.1, 1.0, 0.0)) is None
+    assert store.find_duplicate(unit(1.0, 0.21, 0.1), exclude="speaker") is None
+
+
+def test_deleted_rows_are_recycled(tmp_path):
+    store = VoiceStore(str(tmp_path))
+    store.add("a", {}, [1.0, 0.0])
+    store.add("b", {}, [0.0, 1.0])
+    row = store.get("a")["row"]
+    assert store.delete("a")
+    assert store.get("a") is None
+    assert not store.delete("a")
+    assert store.nearest([1.0, 0.0], k=5) == [("b", 0.0)]
+    store.add("c", {}, [1.0, 1.0])
+    assert store.get("c")["row"] == row
+
+
+def test_matrix_grows_past_initial_capacity(tmp_path):
+    store = VoiceStore(str(tmp_path))
+    count = voice_store.INITIAL_CAPACITY + 3
+    for i in range(count):
+        store.add(f"v{i}", {}, [float(i + 1), 1.0])
+    assert len(store.list()) == count
+    np.testing.assert_array_equal(store.get_embedding(f"v{count - 1}"), [float(count), 1.0])
+
+
+def test_other_dimensions_stay_out_of_the_matrix(tmp_path):
+    store = VoiceStore(str(tmp_path))
+    store.add("a", {}, [1.0, 0.0])
+    meta = store.add("wide", {}, [1.0, 2.0, 3.0])
+    assert meta["row"] is None
+    np.testing.assert_array_equal(store.get_embedding("wide"), [1.0, 2.0, 3.0])
+    assert [voice_id for voice_id, _ in store.nearest([1.0, 0.0], k=5)] == ["a"]
+
+
+def test_store_reloads_from_disk(tmp_path):
+    store = VoiceStore(str(tmp_path))
+    store.add("a", {"name": "A"}, [0.5, 0.5])
+    reopened = VoiceStore(str(tmp_path))
+    assert reopened.get("a")["name"] == "A"
+    np.testing.assert_array_equal(reopened.get_embedding("a"), [0.5, 0.5])
+
+
+def test_replicas_sync_through_the_state_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(voice_store, "SYNC_INTERVAL_SECONDS", 0.0)
+    state = SQLiteStateBackend(str(tmp_path / "state.db"))
+    writer = VoiceStore(str(tmp_path / "writer"), state=state)
+    reader = VoiceStore(str(tmp_path / "reader"), state=state)
+
+    writer.add("a", {"name": "A"}, [1.0, 0.0])
+    assert reader.get("a")["name"] == "A"
+    np.testing.assert_array_equal(reader.get_embedding("a"), [1.0, 0.0])
+    assert reader.find_duplicate([1.0, 0.0]) == "a"
+
+    writer.add("a", {"name": "A2"}, [0.0, 1.0])
+    assert reader.get("a")["name"] == "A2"
+    writer.delete("a")
+    assert reader.list() == []
+
+
+def test_shared_embeddings_are_float32_bytes(tmp_path):
+    state = SQLiteStateBackend(str(tmp_path / "state.db"))
+    store = VoiceStore(str(tmp_path / "replica"), state=state)
+    store.add("a", {"name": "A"}, [0.25, -1.5, 3.0])
+    assert state.get(voice_store.EMBEDDINGS_NAMESPACE, "a") == np.array([0.25, -1.5, 3.0], dtype=np.float32).tobytes()
+    assert "embedding" not in state.get_json("voices", "a")
+    store.delete("a")
+    assert state.get(voice_store.EMBEDDINGS_NAMESPACE, "a") is None
+
+
+def test_legacy_json_embeddings_still_sync(tmp_path):
+    state = SQLiteStateBackend(str(tmp_path / "state.db"))
+    state.set_json("voices", "old", {"voice_id": "old", "name": "Old", "revision": "r1", "embedding": [1.0, 2.0]})
+    state.incr("voices_meta", "version")
+    store = VoiceStore(str(tmp_path / "replica"), state=state)
+    np.testing.assert_array_equal(store.get_embedding("old"), [1.0, 2.0])
+
+
+def test_get_embedding_returns_a_copy(tmp_path):
+    store = VoiceStore(str(tmp_path))
+    store.add("a", {}, [1.0, 0.0])
+    embedding = store.get_embedding("a")
+    store.delete("a")
+    store.add("b", {}, [0.0, 1.0])
+    np.testing.assert_array_equal(embedding, [1.0, 0.0])
@@ -1,10 +1,17 @@
 import os
+import asyncio
 import logging
 import httpx
-from typing import Optional
+from typing import Optional, AsyncIterator, Union
+
+from client_registry import get_client
+from single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# What a provider returns: the URL of the rendered clip (str) or the clip itself
+AudioResult = Union[str, bytes, memoryview]
+
 class TTSService:
     def __init__(self):
         self.replicate_key = os.getenv("REPLICATE_API_KEY")
@@ -12,9 +19,14 @@ class TTSService:
         self.google_key = os.getenv("GOOGLE_CLOUD_KEY")
         self.azure_key = os.getenv("AZURE_TTS_KEY")
         self.cartesia_key = os.getenv("CARTESIA_API_KEY")
+        # Identical phrases requested at once (e.g. a campaign's greeting) share one provider call
+        self.flight = SingleFlight("tts")
+    
+    async def synthesize(self, text: str, language: str = "hi", model: str = "replicate-xtts") -> Optional[AudioResult]:
+        """Synthesize speech from text with fallback: an audio URL (str), the audio bytes, or None"""
+        return await self.flight.do((text, language, model), lambda: self._synthesize(text, language, model))
     
-    async def synthesize(self, text: str, language: str = "hi", model: str = "replicate-xtts") -> Optional[str]:
-        """Synthesize speech from text with fallback"""
+    async def _synthesize(self, text: str, language: str, model: str) -> Optional[AudioResult]:
         try:
             if model.startswith("replicate"):
                 return await self._call_replicate(text, language)
@@ -32,6 +44,36 @@ class TTSService:
             logger.error(f"Error with {model}: {e}, falling back to Replicate")
             return await self._call_replicate(text, language)
     
+    async def synthesize_stream(self, text: str, language: str = "hi", model: str = "elevenlabs") -> AsyncIterator[bytes]:
+        """Yield audio chunks as the provider produces them, falling back to a single chunk"""
+        if model.startswith("elevenlabs"):
+            stream = self._stream_elevenlabs(text, language)
+        elif model.startswith("cartesia"):
+            stream = self._stream_cartesia(text, language)
+        else:
+            stream = None
+        
+        if stream is not None:
+            started = False
+            try:
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                # Once audio has gone out a fallback would replay the clip from the start
+                if started:
+                    raise
+                logger.error(f"Streaming {model} error: {e}, falling back to Replicate")
+                model = "replicate-xtts"
+        
+        audio = await self.synthesize(text, language, model)
+        if isinstance(audio, str) and audio.startswith("http"):
+            async for chunk in stream_audio_url(audio):
+                yield chunk
+        elif audio:
+            yield audio
+    
     async def _call_replicate(self, text: str, language: str) -> Optional[str]:
         """Call Replicate XTTS-v2 for voice cloning"""
         try:
@@ -60,32 +102,42 @@ class TTSService:
                         return result_data["output"]
                     elif result_data["status"] == "failed":
                         raise Exception("Prediction failed")
+                    await asyncio.sleep(0.5)
         except Exception as e:
             logger.error(f"Replicate error: {e}")
             return None
     
-    async def _call_elevenlabs(self, text: str, language: str) -> Optional[str]:
+    async def _call_elevenlabs(self, text: str, language: str) -> Optional[AudioResult]:
         """Call ElevenLabs for premium TTS"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.elevenlabs.io/v1/text-to-speech/21m00Tcm4TlvDq8ikWAM",
-                    headers={"xi-api-key": self.elevenlabs_key},
-                    json={
-                        "text": text,
-                        "voice_settings": {"stability": 0.5, "similarity_boost": 0.75}
-                    }
-                )
-                return response.content.decode("base64")
+            return await collect_audio(self._stream_elevenlabs(text, language))
         except Exception as e:
             logger.error(f"ElevenLabs error: {e}")
             return await self._call_replicate(text, language)
     
-    async def _call_google_tts(self, text: str, language: str) -> Optional[str]:
+    async def _stream_elevenlabs(self, text: str, language: str) -> AsyncIterator[bytes]:
+        """Stream ElevenLabs audio as it is generated"""
+        async with httpx.AsyncClient() as client:
+            async with client.stream(
+                "POST",
+                "https://api.elevenlabs.io/v1/text-to-speech/21m00Tcm4TlvDq8ikWAM/stream",
+                headers={"xi-api-key": self.elevenlabs_key},
+                params={"optimize_streaming_latency": 3},
+                json={
+                    "text": text,
+                    "model_id": "eleven_multilingual_v2",
+                    "voice_settings": {"stability": 0.5, "similarity_boost": 0.75}
+                }
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    yield chunk
+    
+    async def _call_google_tts(self, text: str, language: str) -> Optional[AudioResult]:
         """Call Google Cloud TTS"""
         try:
+            client = get_client("google_tts")
             from google.cloud import texttospeech
-            client = texttospeech.TextToSpeechClient()
             input_text = texttospeech.SynthesisInput(text=text)
             voice = texttospeech.VoiceSelectionParams(
                 language_code=language,
@@ -102,7 +154,7 @@ class TTSService:
             logger.error(f"Google TTS error: {e}")
             return await self._call_replicate(text, language)
     
-    async def _call_azure_tts(self, text: str, language: str) -> Optional[str]:
+    async def _call_azure_tts(self, text: str, language: str) -> Optional[AudioResult]:
         """Call Microsoft Azure TTS"""
         try:
             async with httpx.AsyncClient() as client:
@@ -119,24 +171,36 @@ class TTSService:
             logger.error(f"Azure TTS error: {e}")
             return await self._call_replicate(text, language)
     
-    async def _call_cartesia(self, text: str, language: str) -> Optional[str]:
+    async def _call_cartesia(self, text: str, language: str) -> Optional[AudioResult]:
         """Call Cartesia AI TTS"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    "https://api.cartesia.ai/v1/text-to-speech/transform",
-                    headers={"Authorization": f"Bearer {self.cartesia_key}"},
-                    json={
-                        "text": text,
-                        "language": language,
-                        "voice_id": "presets_speaking"
-                    }
-                )
-                return response.content
+            return await collect_audio(self._stream_cartesia(text, language))
         except Exception as e:
             logger.error(f"Cartesia error: {e}")
             return await self._call_replicate(text, language)
     
+    async def _stream_cartesia(self, text: str, language: str) -> AsyncIterator[bytes]:
+        """Stream Cartesia audio using chunked transfer"""
+        async with httpx.AsyncClient() as client:
+            async with client.stream(
+                "POST",
+                "https://api.cartesia.ai/tts/bytes",
+                headers={
+                    "Authorization": f"Bearer {self.cartesia_key}",
+                    "Cartesia-Version": "2024-06-10"
+                },
+                json={
+                    "model_id": "sonic-multilingual",
+                    "transcript": text,
+                    "language": language.split("-")[0],
+                    "voice": {"mode": "id", "id": "presets_speaking"},
+                    "output_format": {"container": "mp3", "sample_rate": 44100, "bit_rate": 128000}
+                }
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    yield chunk
+    
     def get_available_models(self) -> list:
         return [
             "replicate-xtts",
@@ -145,3 +209,24 @@ class TTSService:
             "azure-tts",
             "cartesia-tts"
         ]
+
+
+async def stream_audio_url(audio_url: str, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Download hosted audio (e.g. Replicate output) chunk by chunk
+
+    Without `chunk_size` chunks are passed on as they come off the network, skipping httpx's re-chunking copy.
+    """
+    async with httpx.AsyncClient(timeout=60) as client:
+        async with client.stream("GET", audio_url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+
+
+async def collect_audio(chunks: AsyncIterator[bytes]) -> memoryview:
+    """A whole clip from a stream, grown in one buffer instead of a chunk list plus a joined copy"""
+    audio = bytearray()
+    async for chunk in chunks:
+        audio += chunk
+    # Read-only: coalesced callers share the same clip
+    return memoryview(audio).toreadonly()
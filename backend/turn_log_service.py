@@ -0,0 +1,250 @@
+# Turn Log Service
+# Call history: each conversation turn goes into a bounded in-memory ring buffer and is written
+# behind, in batches, to date-partitioned JSONL segments with a SQLite index for agent/date queries
+
+import asyncio
+import fcntl
+import logging
+import os
+import sqlite3
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+BUFFER_CAPACITY = int(os.getenv("TURN_LOG_BUFFER", "10000"))
+FLUSH_INTERVAL_SECONDS = 1.0
+FLUSH_BATCH_SIZE = 500
+MAX_QUERY_LIMIT = 1000
+
+
+def turn_record(
+    agent_id: str,
+    session_id: Optional[str],
+    user_text: str,
+    ai_text: str,
+    language: str,
+    providers: dict,
+    latency_ms: dict,
+    outcome: str = "completed",
+    channel: str = "web",
+    **extra
+) -> dict:
+    """One conversation turn in the log's schema; outcome is completed, interrupted or error"""
+    return {
+        "turn_id": uuid.uuid4().hex,
+        "ts": datetime.utcnow().isoformat(),
+        "agent_id": agent_id,
+        "session_id": session_id,
+        "channel": channel,
+        "language": language,
+        "user_text": user_text,
+        "ai_text": ai_text,
+        "outcome": outcome,
+        "providers": providers,
+        "latency_ms": {stage: round(ms, 1) for stage, ms in latency_ms.items() if ms is not None},
+        **extra
+    }
+
+
+class TurnLog:
+    """Append-only turn log; `append` never blocks the call path and memory stays bounded"""
+
+    def __init__(self, log_dir: str = "/tmp/turn_log", capacity: int = BUFFER_CAPACITY):
+        self.log_dir = log_dir
+        os.makedirs(log_dir, exist_ok=True)
+        self.index_path = os.path.join(log_dir, "index.db")
+        # Oldest records are overwritten (and counted) if the writer falls behind
+        self._buffer: deque = deque(maxlen=capacity)
+        # Batch taken off the buffer and being written; queries read it until its index commit finishes
+        self._in_flight: List[dict] = []
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self.appended = 0
+        self.dropped = 0
+        self.written = 0
+        self._listeners: List[Callable[[dict], None]] = []
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS turns (
+                    turn_id TEXT PRIMARY KEY,
+                    agent_id TEXT NOT NULL,
+                    session_id TEXT,
+                    ts TEXT NOT NULL,
+                    segment TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS turns_agent_ts ON turns (agent_id, ts);
+                CREATE INDEX IF NOT EXISTS turns_session ON turns (session_id, ts);
+                CREATE INDEX IF NOT EXISTS turns_ts ON turns (ts);
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def subscribe(self, listener: Callable[[dict], None]):
+        """Call `listener(record)` for every appended turn; it must be cheap and must not block"""
+        self._listeners.append(listener)
+
+    def append(self, record: dict):
+        """Queue a turn for writing (memory only)"""
+        for listener in self._listeners:
+            try:
+                listener(record)
+            except Exception as e:
+                logger.error(f"Turn log listener error: {e}")
+        if len(self._buffer) == self._buffer.maxlen:
+            self.dropped += 1
+        self._buffer.append(record)
+        self.appended += 1
+        if len(self._buffer) >= FLUSH_BATCH_SIZE:
+            self._wakeup.set()
+
+    async def start(self):
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the writer and flush whatever is still buffered"""
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Turn log flush error: {e}")
+
+    async def flush(self) -> int:
+        """Write buffered turns in batches; returns how many were written"""
+        written = 0
+        while self._buffer:
+            batch = [self._buffer.popleft() for _ in range(min(FLUSH_BATCH_SIZE, len(self._buffer)))]
+            self._in_flight = batch
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception:
+                # Put the batch back (oldest first) so a transient disk error does not lose it
+                self._buffer.extendleft(reversed(batch))
+                raise
+            finally:
+                self._in_flight = []
+            written += len(batch)
+        self.written += written
+        return written
+
+    def _write_batch(self, batch: List[dict]):
+        """Append records to their day's segment, then index their byte ranges"""
+        by_segment = {}
+        for record in batch:
+            by_segment.setdefault(f"{record['ts'][:10]}.jsonl", []).append(record)
+
+        rows = []
+        for segment, records in by_segment.items():
+            lines = [dumps(record) + b"\n" for record in records]
+            with open(os.path.join(self.log_dir, segment), "ab") as f:
+                # Workers share segments; the lock keeps offsets and appends consistent
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(b"".join(lines))
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            for record, line in zip(records, lines):
+                rows.append((record["turn_id"], record["agent_id"], record.get("session_id"),
+                             record["ts"], segment, offset, len(line)))
+                offset += len(line)
+
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO turns VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _read(self, rows: List[sqlite3.Row]) -> List[dict]:
+        records, handles = [], {}
+        try:
+            for row in rows:
+                f = handles.get(row["segment"])
+                if f is None:
+                    f = handles[row["segment"]] = open(os.path.join(self.log_dir, row["segment"]), "rb")
+                f.seek(row["offset"])
+                records.append(loads(f.read(row["length"])))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    def _query_index(self, agent_id, session_id, date_from, date_to, limit) -> List[dict]:
+        clauses, params = [], []
+        if agent_id:
+            clauses.append("agent_id = ?")
+            params.append(agent_id)
+        if session_id:
+            clauses.append("session_id = ?")
+            params.append(session_id)
+        if date_from:
+            clauses.append("ts >= ?")
+            params.append(date_from)
+        if date_to:
+            # Compared at the bound's precision, so a bare date includes the whole day
+            clauses.append("substr(ts, 1, ?) <= ?")
+            params.extend([len(date_to), date_to])
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT segment, offset, length FROM turns {where} ORDER BY ts DESC LIMIT ?", (*params, limit)
+            ).fetchall()
+        return self._read(rows)
+
+    async def query(
+        self,
+        agent_id: Optional[str] = None,
+        session_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        limit: int = 100
+    ) -> List[dict]:
+        """Most recent turns first, filtered by agent, session and ISO date/time range"""
+        limit = max(1, min(limit, MAX_QUERY_LIMIT))
+
+        def matches(record: dict) -> bool:
+            return (not agent_id or record["agent_id"] == agent_id) \
+                and (not session_id or record.get("session_id") == session_id) \
+                and (not date_from or record["ts"] >= date_from) \
+                and (not date_to or record["ts"][:len(date_to)] <= date_to)
+
+        # Turns not flushed yet are newer than anything on disk: the buffer, then the batch being written
+        buffered = [record for record in reversed(self._buffer) if matches(record)][:limit]
+        in_flight = [record for record in reversed(self._in_flight) if matches(record)][:limit - len(buffered)]
+        pending = buffered + in_flight
+        if len(pending) >= limit:
+            return pending
+        # The in-flight batch may be indexed by the time the index is read; over-fetch and drop repeats
+        seen = {record["turn_id"] for record in in_flight}
+        stored = await asyncio.to_thread(
+            self._query_index, agent_id, session_id, date_from, date_to, limit - len(buffered)
+        )
+        return pending + [record for record in stored if record["turn_id"] not in seen][:limit - len(pending)]
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "capacity": self._buffer.maxlen,
+            "appended": self.appended,
+            "written": self.written,
+            "dropped": self.dropped
+        }
@@ -2,31 +2,119 @@
 # Advanced voice cloning for personalized TTS using user voice samples
 
 import asyncio
+import base64
+import fcntl
 import logging
 import os
-from typing import Optional, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, List, AsyncIterator, Awaitable, Callable
 import httpx
-import json
+
+from audio_processing import analyze_voice_sample, merge_voice_segments, encode_wav
+from tts_service import collect_audio, stream_audio_url
+from voice_store import VoiceStore
+from state_backend import StateBackend, SQLiteStateBackend
+from single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
+# Seconds of clean reference speech each provider clones best from
+OPTIMAL_SAMPLE_SECONDS = {
+    "replicate_xtts": 20,
+    "elevenlabs": 90,
+    "coqui_tts": 20,
+    "bark_tts": 15
+}
+CLONING_SAMPLE_RATE = 22050
+# Give up on a cloning prediction instead of polling forever
+MAX_POLL_SECONDS = 600
+# Per-process voice replicas; kept across restarts so a worker only syncs what changed meanwhile
+VOICE_REPLICA_DIR = os.getenv("VOICE_REPLICA_DIR", "/tmp/voice_replicas")
+
 class VoiceCloningService:
     """Voice cloning service with support for multiple cloning models"""
     
-    def __init__(self):
+    def __init__(self, state: Optional[StateBackend] = None):
         self.replicate_token = os.getenv("REPLICATE_API_TOKEN")
         self.elevenlabs_key = os.getenv("ELEVENLABS_API_KEY")
         self.voice_dir = "/tmp/voice_library"
-        os.makedirs(self.voice_dir, exist_ok=True)
+        self.state = state or SQLiteStateBackend()
+        self._migrate_local_library()
+        # Voices are shared through the state backend; each process searches its own replica
+        self._replica_lock = None
+        self.voice_store = VoiceStore(self._claim_replica_dir(VOICE_REPLICA_DIR), state=self.state)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        # Concurrent loads of one voice and identical syntheses share a single in-flight call
+        self.voice_flight = SingleFlight("voice_load")
+        self.synthesis_flight = SingleFlight("cloned_tts")
+
+    def _claim_replica_dir(self, root: str) -> str:
+        """A replica directory no other live process on this host is using (locked until exit)"""
+        os.makedirs(root, exist_ok=True)
+        slot = 0
+        while True:
+            path = os.path.join(root, f"replica-{slot}")
+            lock = open(f"{path}.lock", "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock.close()
+                slot += 1
+                continue
+            self._replica_lock = lock
+            return path
+
+    def _migrate_local_library(self):
+        """Publish voices from a pre-shared-state local library once"""
+        if self.state.get("voices_meta", "migrated") is not None:
+            return
+        if os.path.isdir(self.voice_dir):
+            published = VoiceStore(self.voice_dir, state=self.state).publish_all()
+            logger.info(f"Published {published} voices from {self.voice_dir} to the shared state backend")
+        self.state.set("voices_meta", "migrated", b"1")
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(max_workers=min(4, os.cpu_count() or 1))
+        return self._process_pool
+
+    async def analyze_samples(self, voice_samples: List[str]) -> List[dict]:
+        """Decode and quality-score every sample in parallel worker processes"""
+        loop = asyncio.get_running_loop()
+        reports = await asyncio.gather(
+            *(loop.run_in_executor(self._pool(), analyze_voice_sample, path, CLONING_SAMPLE_RATE)
+              for path in voice_samples),
+            return_exceptions=True
+        )
+        valid = []
+        for path, report in zip(voice_samples, reports):
+            if isinstance(report, Exception):
+                logger.error(f"Could not decode voice sample {path}: {report}")
+            else:
+                valid.append(report)
+        return valid
+
+    @staticmethod
+    def build_reference(reports: List[dict], provider: str) -> bytes:
+        """Merge the best speech from all samples into one WAV of the provider's optimal length"""
+        merged = merge_voice_segments(reports, OPTIMAL_SAMPLE_SECONDS.get(provider, 20), CLONING_SAMPLE_RATE)
+        if merged.size == 0:
+            raise ValueError("No usable speech in voice samples")
+        return encode_wav(merged, CLONING_SAMPLE_RATE)
 
     async def clone_voice(
         self,
         voice_samples: List[str],
         voice_name: str,
         provider: str = "replicate_xtts",
-        language: str = "en"
+        language: str = "en",
+        on_progress: Optional[Callable[[float, str], Awaitable[None]]] = None
     ) -> dict:
-        """Clone voice from audio samples"""
+        """Clone voice from audio samples, optionally reporting progress"""
+        async def report(fraction: float, message: str):
+            if on_progress is not None:
+                await on_progress(fraction, message)
+        
         try:
             providers_to_try = [
                 provider,
@@ -36,19 +124,28 @@ class VoiceCloningService:
                 "bark_tts"
             ]
             
-            for prov in providers_to_try:
+            await report(0.05, "Analyzing voice samples")
+            reports = await self.analyze_samples(voice_samples)
+            if not reports:
+                return {"success": False, "error": "No decodable voice samples"}
+            sample_quality = [{k: v for k, v in r.items() if k != "segments"} for r in reports]
+            
+            for attempt, prov in enumerate(providers_to_try):
+                if prov not in OPTIMAL_SAMPLE_SECONDS:
+                    continue
+                await report(0.2 + 0.7 * attempt / len(providers_to_try), f"Cloning with {prov}")
+                reference = self.build_reference(reports, prov)
                 if prov == "replicate_xtts":
-                    result = await self._clone_replicate_xtts(voice_samples, voice_name, language)
+                    result = await self._clone_replicate_xtts(reference, len(voice_samples), voice_name, language)
                 elif prov == "elevenlabs":
-                    result = await self._clone_elevenlabs(voice_samples, voice_name)
+                    result = await self._clone_elevenlabs(reference, len(voice_samples), voice_name)
                 elif prov == "coqui_tts":
-                    result = await self._clone_coqui(voice_samples, voice_name)
+                    result = await self._clone_coqui(reference, voice_name)
                 elif prov == "bark_tts":
-                    result = await self._clone_bark(voice_samples, voice_name)
-                else:
-                    continue
+                    result = await self._clone_bark(reference, voice_name)
                     
                 if result and result.get("success"):
+                    result["sample_quality"] = sample_quality
                     return result
             
             return {"success": False, "error": "All voice cloning providers failed"}
@@ -56,11 +153,10 @@ class VoiceCloningService:
             logger.error(f"Voice cloning error: {e}")
             return {"success": False, "error": str(e)}
 
-    async def _clone_replicate_xtts(self, voice_samples: List[str], voice_name: str, language: str) -> Optional[dict]:
+    async def _clone_replicate_xtts(self, reference: bytes, samples_count: int, voice_name: str, language: str) -> Optional[dict]:
         """Clone voice using Replicate XTTS-v2 model (free with limited credits)"""
         try:
-            # Combine voice samples for training
-            combined_sample = voice_samples[0]  # Simplified - would merge audio in production
+            combined_sample = f"data:audio/wav;base64,{base64.b64encode(reference).decode()}"
             
             async with httpx.AsyncClient() as client:
                 # Create prediction
@@ -79,7 +175,7 @@ class VoiceCloningService:
                 prediction_id = prediction.json().get("id")
                 
                 # Poll for completion
-                while True:
+                for _ in range(MAX_POLL_SECONDS // 2):
                     status = await client.get(
                         f"https://api.replicate.com/v1/predictions/{prediction_id}",
                         headers={"Authorization": f"Token {self.replicate_token}"}
@@ -89,32 +185,45 @@ class VoiceCloningService:
                     if status_data.get("status") == "succeeded":
                         voice_embedding = status_data.get("output", {}).get("embedding")
                         
-                        # Save voice to library
-                        voice_path = os.path.join(self.voice_dir, f"{voice_name}.json")
-                        with open(voice_path, "w") as f:
-                            json.dump({
-                                "name": voice_name,
+                        # Re-upload of a speaker already in the library
+                        duplicate_of = None
+                        if voice_embedding is not None:
+                            duplicate_of = await asyncio.to_thread(
+                                self.voice_store.find_duplicate, voice_embedding, exclude=voice_name
+                            )
+                        if duplicate_of:
+                            logger.info(f"Voice {voice_name} matches existing voice {duplicate_of}")
+                            return {
+                                "success": True,
+                                "voice_id": duplicate_of,
                                 "provider": "replicate_xtts",
-                                "embedding": voice_embedding,
-                                "language": language,
-                                "samples_count": len(voice_samples)
-                            }, f)
+                                "duplicate": True
+                            }
+                        
+                        # Save voice to library
+                        await asyncio.to_thread(self.voice_store.add, voice_name, {
+                            "name": voice_name,
+                            "provider": "replicate_xtts",
+                            "language": language,
+                            "samples_count": samples_count
+                        }, voice_embedding)
                         
                         return {
                             "success": True,
                             "voice_id": voice_name,
-                            "provider": "replicate_xtts",
-                            "voice_path": voice_path
+                            "provider": "replicate_xtts"
                         }
                     elif status_data.get("status") == "failed":
                         return None
                     
                     await asyncio.sleep(2)
+                logger.error(f"Replicate XTTS cloning timed out: {prediction_id}")
+                return None
         except Exception as e:
             logger.error(f"Replicate XTTS cloning error: {e}")
             return None
 
-    async def _clone_elevenlabs(self, voice_samples: List[str], voice_name: str) -> Optional[dict]:
+    async def _clone_elevenlabs(self, reference: bytes, samples_count: int, voice_name: str) -> Optional[dict]:
         """Clone voice using ElevenLabs (premium, but high quality)"""
         try:
             async with httpx.AsyncClient() as client:
@@ -123,7 +232,7 @@ class VoiceCloningService:
                     "https://api.elevenlabs.io/v1/voices/add",
                     headers={"xi-api-key": self.elevenlabs_key},
                     files={
-                        "files": (voice_samples[0], open(voice_samples[0], "rb"))
+                        "files": ("reference.wav", reference, "audio/wav")
                     },
                     data={"name": voice_name, "labels": '{"use_case": "voice_agent"}'}
                 )
@@ -131,6 +240,11 @@ class VoiceCloningService:
                 voice_id = response.json().get("voice_id")
                 
                 if voice_id:
+                    await asyncio.to_thread(self.voice_store.add, voice_id, {
+                        "name": voice_name,
+                        "provider": "elevenlabs",
+                        "samples_count": samples_count
+                    })
                     return {
                         "success": True,
                         "voice_id": voice_id,
@@ -141,7 +255,7 @@ class VoiceCloningService:
             logger.error(f"ElevenLabs cloning error: {e}")
         return None
 
-    async def _clone_coqui(self, voice_samples: List[str], voice_name: str) -> Optional[dict]:
+    async def _clone_coqui(self, reference: bytes, voice_name: str) -> Optional[dict]:
         """Clone voice using Coqui TTS (open source)"""
         try:
             # Coqui implementation
@@ -154,7 +268,7 @@ class VoiceCloningService:
             logger.error(f"Coqui cloning error: {e}")
         return None
 
-    async def _clone_bark(self, voice_samples: List[str], voice_name: str) -> Optional[dict]:
+    async def _clone_bark(self, reference: bytes, voice_name: str) -> Optional[dict]:
         """Clone voice using Bark (text-guided audio generation)"""
         try:
             # Bark implementation
@@ -167,6 +281,17 @@ class VoiceCloningService:
             logger.error(f"Bark cloning error: {e}")
         return None
 
+    def _load_voice(self, voice_id: str) -> dict:
+        """Voice metadata plus embedding, straight from the voice store"""
+        voice_data = self.voice_store.get(voice_id)
+        if voice_data is None:
+            raise KeyError(f"Voice not found: {voice_id}")
+        voice_data["embedding"] = self.voice_store.get_embedding(voice_id)
+        return voice_data
+
+    async def _load_voice_async(self, voice_id: str) -> dict:
+        return await self.voice_flight.do(voice_id, lambda: asyncio.to_thread(self._load_voice, voice_id))
+
     async def synthesize_with_cloned_voice(
         self,
         text: str,
@@ -175,12 +300,14 @@ class VoiceCloningService:
         speed: float = 1.0
     ) -> dict:
         """Synthesize speech using cloned voice"""
+        return await self.synthesis_flight.do(
+            (text, voice_id, language, speed),
+            lambda: self._synthesize_with_cloned_voice(text, voice_id, language, speed)
+        )
+
+    async def _synthesize_with_cloned_voice(self, text: str, voice_id: str, language: str, speed: float) -> dict:
         try:
-            # Load voice embedding
-            voice_path = os.path.join(self.voice_dir, f"{voice_id}.json")
-            with open(voice_path, "r") as f:
-                voice_data = json.load(f)
-            
+            voice_data = await self._load_voice_async(voice_id)
             provider = voice_data.get("provider", "replicate_xtts")
             
             if provider == "replicate_xtts":
@@ -193,6 +320,27 @@ class VoiceCloningService:
             logger.error(f"Synthesis error: {e}")
             return {"error": str(e), "audio": ""}
 
+    async def synthesize_stream_with_cloned_voice(
+        self,
+        text: str,
+        voice_id: str,
+        language: str,
+        speed: float = 1.0
+    ) -> AsyncIterator[bytes]:
+        """Synthesize speech using cloned voice, yielding audio chunks as they arrive"""
+        voice_data = await self._load_voice_async(voice_id)
+        if voice_data.get("provider") == "elevenlabs":
+            async for chunk in self._stream_elevenlabs(text, voice_id, speed):
+                yield chunk
+            return
+        
+        # Non-streaming providers go through the coalesced path
+        result = await self.synthesize_with_cloned_voice(text, voice_id, language, speed)
+        if result.get("error"):
+            raise Exception(result["error"])
+        async for chunk in stream_audio_url(result["audio"]):
+            yield chunk
+
     async def _synthesize_replicate_xtts(self, text: str, voice_data: dict, language: str, speed: float) -> dict:
         """Synthesize using Replicate XTTS with cloned voice"""
         try:
@@ -205,7 +353,9 @@ class VoiceCloningService:
                         "input": {
                             "text": text,
                             "language": language,
-                            "speaker_embedding": voice_data.get("embedding"),
+                            "speaker_embedding": (
+                                voice_data["embedding"].tolist() if voice_data.get("embedding") is not None else None
+                            ),
                             "speed": speed
                         }
                     }
@@ -235,46 +385,54 @@ class VoiceCloningService:
     async def _synthesize_elevenlabs(self, text: str, voice_id: str, language: str, speed: float) -> dict:
         """Synthesize using ElevenLabs with cloned voice"""
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}",
-                    headers={"xi-api-key": self.elevenlabs_key},
-                    json={
-                        "text": text,
-                        "model_id": "eleven_multilingual_v2",
-                        "voice_settings": {
-                            "stability": 0.5,
-                            "similarity_boost": 0.75
-                        }
-                    }
-                )
-                
-                if response.status_code == 200:
-                    return {"audio": response.content, "provider": "elevenlabs"}
+            audio = await collect_audio(self._stream_elevenlabs(text, voice_id, speed))
+            return {"audio": audio, "provider": "elevenlabs"}
         except Exception as e:
             logger.error(f"ElevenLabs synthesis error: {e}")
         
         return {"error": "Synthesis failed", "audio": ""}
 
+    async def _stream_elevenlabs(self, text: str, voice_id: str, speed: float) -> AsyncIterator[bytes]:
+        """Stream ElevenLabs audio for a cloned voice as it is generated"""
+        async with httpx.AsyncClient() as client:
+            async with client.stream(
+                "POST",
+                f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream",
+                headers={"xi-api-key": self.elevenlabs_key},
+                params={"optimize_streaming_latency": 3},
+                json={
+                    "text": text,
+                    "model_id": "eleven_multilingual_v2",
+                    "voice_settings": {
+                        "stability": 0.5,
+                        "similarity_boost": 0.75
+                    }
+                }
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes():
+                    yield chunk
+
     def list_cloned_voices(self) -> List[dict]:
         """List all cloned voices in library"""
-        voices = []
         try:
-            for voice_file in os.listdir(self.voice_dir):
-                if voice_file.endswith(".json"):
-                    with open(os.path.join(self.voice_dir, voice_file), "r") as f:
-                        voices.append(json.load(f))
+            return self.voice_store.list()
         except Exception as e:
             logger.error(f"Error listing voices: {e}")
-        return voices
+        return []
+
+    async def find_similar_voices(self, voice_id: str, k: int = 5) -> List[dict]:
+        """Voices closest to the given voice by speaker embedding"""
+        embedding = await asyncio.to_thread(self.voice_store.get_embedding, voice_id)
+        if embedding is None:
+            return []
+        matches = await asyncio.to_thread(self.voice_store.nearest, embedding, k=k, exclude=voice_id)
+        return [{"voice_id": match_id, "similarity": score} for match_id, score in matches]
 
     def delete_cloned_voice(self, voice_id: str) -> bool:
         """Delete a cloned voice from library"""
         try:
-            voice_path = os.path.join(self.voice_dir, f"{voice_id}.json")
-            if os.path.exists(voice_path):
-                os.remove(voice_path)
-                return True
+            return self.voice_store.delete(voice_id)
         except Exception as e:
             logger.error(f"Error deleting voice: {e}")
         return False
@@ -0,0 +1,198 @@
+# Voice Session
+# Per-connection state for real-time voice conversations with barge-in (interruption) support
+
+import asyncio
+import io
+import logging
+import wave
+from datetime import datetime
+from typing import Optional, List
+
+from outbound_audio import AUDIO_MESSAGE_TYPES, BytesLike, OutboundScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def _wav_duration_ms(audio_data: bytes) -> Optional[int]:
+    """Duration of a WAV clip in milliseconds, or None if it is not WAV"""
+    try:
+        with wave.open(io.BytesIO(audio_data), "rb") as wav:
+            return int(wav.getnframes() * 1000 / wav.getframerate())
+    except Exception:
+        return None
+
+
+class VoiceSession:
+    """Tracks the in-flight turn of a voice WebSocket and cancels it when the caller interrupts"""
+
+    def __init__(self, websocket, agent_id: str, session_id: Optional[str] = None, audio_format: str = "json"):
+        self.websocket = websocket
+        self.agent_id = agent_id
+        self.session_id = session_id
+        # Control messages overtake agent audio, which is paced to real-time playback
+        self.outbound = OutboundScheduler(websocket, audio_format=audio_format, on_audio_sent=self._on_audio_sent)
+        self.transcript: List[dict] = []
+        self.turn_task: Optional[asyncio.Task] = None
+        self.current_turn: Optional[dict] = None
+        self._ai_entry: Optional[dict] = None
+        self.speculation = None
+        # Picks each turn's response language (language_id.LanguageRouter)
+        self.languages = None
+        self.stt_stream = None
+        self.stt_task: Optional[asyncio.Task] = None
+        # Why streaming STT could not be opened; audio_frame messages are ignored once set
+        self.stt_error: Optional[str] = None
+        # Converts client audio_frame audio to the PCM16 16 kHz the streaming STT expects
+        self.frame_transcoder = None
+        self._sender_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the outbound sender"""
+        self._sender_task = asyncio.create_task(self._sender())
+
+    async def _sender(self):
+        """Drain the outbound lanes onto the WebSocket"""
+        await self.outbound.run()
+
+    def _on_audio_sent(self, message: dict):
+        if self.current_turn is not None and self.current_turn["audio_sent_at"] is None \
+                and message.get("type") in ("audio", "audio_chunk"):
+            self.current_turn["audio_sent_at"] = asyncio.get_running_loop().time()
+
+    async def send(self, message: dict):
+        """Queue a message for the client; audio waits its turn (and for buffer space), anything else goes first"""
+        if message.get("type") in AUDIO_MESSAGE_TYPES:
+            await self.outbound.put_audio(message)
+        else:
+            self.outbound.put_control(message)
+
+    async def send_audio(self, frame: BytesLike, seq: int, duration_ms: float):
+        """Queue one paced audio frame (see outbound_audio.AudioFramer); `frame` is encoded only when sent"""
+        if seq == 0:
+            # The first frame carries the whole WAV header
+            self.set_audio(frame)
+        message = {"type": "audio_chunk", "seq": seq, "duration_ms": round(duration_ms, 1)}
+        await self.outbound.put_audio(message, duration_ms, frame)
+
+    def flush_audio(self) -> int:
+        """Drop unsent audio, keeping control messages in order"""
+        return self.outbound.flush_audio()
+
+    def _playback_remaining_ms(self) -> int:
+        # Paced audio: what is queued or still playing on the client
+        remaining = self.outbound.playback_remaining_ms()
+        turn = self.current_turn
+        if not turn or turn["audio_sent_at"] is None or not turn["audio_ms"]:
+            return int(remaining)
+        elapsed_ms = (asyncio.get_running_loop().time() - turn["audio_sent_at"]) * 1000
+        return max(int(remaining), int(turn["audio_ms"] - elapsed_ms))
+
+    def is_responding(self) -> bool:
+        """Whether a turn is still generating or its audio is still playing"""
+        if self.turn_task is not None and not self.turn_task.done():
+            return True
+        return self._playback_remaining_ms() > 0
+
+    def start_turn(self, coro) -> asyncio.Task:
+        """Run a conversation turn in the background so it can be interrupted"""
+        self.current_turn = {"user_text": "", "ai_text": "", "audio_ms": None, "audio_sent_at": None}
+        self._ai_entry = None
+        self.turn_task = asyncio.create_task(coro)
+        self.turn_task.add_done_callback(self._on_turn_done)
+        return self.turn_task
+
+    def _on_turn_done(self, task: asyncio.Task):
+        if task.cancelled() or self.current_turn is None or task is not self.turn_task:
+            return
+        self._ai_entry = self._record(self.current_turn["ai_text"], interrupted=False)
+
+    def set_user_text(self, text: str):
+        """Record what the caller said in the current turn"""
+        if self.current_turn is not None:
+            self.current_turn["user_text"] = text
+            self.transcript.append({
+                "role": "user",
+                "content": text,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+
+    def set_ai_text(self, text: str):
+        """Record the (possibly partial) agent response of the current turn"""
+        if self.current_turn is not None:
+            self.current_turn["ai_text"] = text
+
+    def set_audio(self, audio_data: BytesLike):
+        """Record the duration of the audio about to be sent (a WAV header is enough)"""
+        if self.current_turn is not None:
+            self.current_turn["audio_ms"] = _wav_duration_ms(audio_data)
+
+    def _spoken_text(self, played_ms: Optional[int]) -> str:
+        """Estimate the part of the response the caller actually heard"""
+        turn = self.current_turn
+        if not turn or turn["audio_sent_at"] is None:
+            return ""
+        words = turn["ai_text"].split()
+        if played_ms is None:
+            played_ms = int((asyncio.get_running_loop().time() - turn["audio_sent_at"]) * 1000)
+        if not turn["audio_ms"]:
+            return turn["ai_text"]
+        ratio = max(0.0, min(1.0, played_ms / turn["audio_ms"]))
+        return " ".join(words[:round(len(words) * ratio)])
+
+    def _record(self, text: str, interrupted: bool) -> Optional[dict]:
+        if not text:
+            return None
+        entry = {
+            "role": "assistant",
+            "content": text,
+            "interrupted": interrupted,
+            "timestamp": datetime.utcnow().isoformat()
+        }
+        self.transcript.append(entry)
+        return entry
+
+    async def interrupt(self, played_ms: Optional[int] = None) -> Optional[str]:
+        """Cancel the in-flight turn, flush pending audio and record what was spoken"""
+        if not self.is_responding():
+            return None
+
+        spoken_text = self._spoken_text(played_ms)
+        task = self.turn_task
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.error(f"Error cancelling turn: {e}")
+
+        dropped = self.flush_audio()
+        if self._ai_entry is not None:
+            # Turn had finished generating but playback was cut short
+            if spoken_text:
+                self._ai_entry["content"] = spoken_text
+                self._ai_entry["interrupted"] = True
+            else:
+                self.transcript.remove(self._ai_entry)
+            self._ai_entry = None
+        else:
+            self._record(spoken_text, interrupted=True)
+        self.current_turn = None
+        logger.info(f"Turn interrupted for {self.agent_id}, dropped {dropped} audio message(s)")
+        await self.send({"type": "interrupted", "spoken_text": spoken_text})
+        return spoken_text
+
+    async def close(self):
+        """Cancel any in-flight work when the connection ends"""
+        if self.turn_task is not None and not self.turn_task.done():
+            self.turn_task.cancel()
+        if self.speculation is not None:
+            self.speculation.cancel()
+        if self.stt_stream is not None:
+            await self.stt_stream.close()
+        if self.stt_task is not None:
+            self.stt_task.cancel()
+        if self._sender_task:
+            self._sender_task.cancel()
+        logger.info(f"Session {self.session_id} outbound audio: {self.outbound.stats()}")
@@ -0,0 +1,302 @@
+# Voice Store
+# Compact cloned-voice library: metadata index plus a float32 memory-mapped embedding matrix
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Optional, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INITIAL_CAPACITY = 64
+DUPLICATE_THRESHOLD = 0.97
+# How often reads check the shared state backend for voices added or removed by other workers
+SYNC_INTERVAL_SECONDS = 1.0
+# Per-replica bookkeeping that is not part of the shared voice record
+LOCAL_FIELDS = ("row", "embedding_file", "embedding")
+# Shared embeddings are raw float32 bytes, kept apart from the JSON records
+EMBEDDINGS_NAMESPACE = "voice_embeddings"
+
+
+class VoiceStore:
+    """O(1) voice lookup by id and vectorized nearest-neighbour search over speaker embeddings
+
+    With a state backend, the backend holds the voice records and this store is a local
+    replica of them: writes go through to the backend, reads pick up other workers' changes.
+    """
+
+    def __init__(self, store_dir: str = "/tmp/voice_library", state=None):
+        self.store_dir = store_dir
+        self.index_path = os.path.join(store_dir, "index.json")
+        self.embeddings_path = os.path.join(store_dir, "embeddings.f32")
+        os.makedirs(store_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._index = {"dim": None, "capacity": 0, "rows": 0, "free_rows": [], "voices": {}}
+        self._matrix: Optional[np.memmap] = None
+        # Unit-normalized copy for cosine scoring; zero rows for free/unused slots
+        self._normalized: Optional[np.ndarray] = None
+        self._row_ids: List[Optional[str]] = []
+        self.state = state
+        self._synced_version = None
+        self._synced_at = 0.0
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self._index = json.load(f)
+            if self._index["dim"]:
+                self._matrix = np.memmap(
+                    self.embeddings_path, dtype=np.float32, mode="r+",
+                    shape=(self._index["capacity"], self._index["dim"])
+                )
+        self._rebuild_search_index()
+        self._migrate_legacy_files()
+
+    def _rebuild_search_index(self):
+        self._row_ids = [None] * self._index["capacity"]
+        for voice_id, meta in self._index["voices"].items():
+            if meta.get("row") is not None:
+                self._row_ids[meta["row"]] = voice_id
+        if self._matrix is None:
+            self._normalized = None
+            return
+        matrix = np.asarray(self._matrix)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self._normalized = np.divide(matrix, norms, out=np.zeros(matrix.shape, dtype=np.float32), where=norms > 0)
+
+    def _migrate_legacy_files(self):
+        """Import voices saved as one JSON file each by earlier versions"""
+        for filename in os.listdir(self.store_dir):
+            if not filename.endswith(".json") or filename == "index.json":
+                continue
+            path = os.path.join(self.store_dir, filename)
+            try:
+                with open(path, "r") as f:
+                    voice_data = json.load(f)
+                embedding = voice_data.pop("embedding", None)
+                voice_id = voice_data.get("voice_id") or voice_data.get("name") or filename[:-5]
+                self.add(voice_id, voice_data, embedding)
+                os.remove(path)
+                logger.info(f"Migrated legacy voice file: {filename}")
+            except Exception as e:
+                logger.error(f"Error migrating voice file {filename}: {e}")
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _ensure_capacity(self, dim: int):
+        """Create or grow the embedding file (doubling) so one more row fits"""
+        index = self._index
+        if index["dim"] is None:
+            index["dim"] = dim
+        if index["free_rows"] or index["rows"] < index["capacity"]:
+            return
+        new_capacity = max(INITIAL_CAPACITY, index["capacity"] * 2)
+        if self._matrix is not None:
+            self._matrix.flush()
+            del self._matrix
+        with open(self.embeddings_path, "ab") as f:
+            f.truncate(new_capacity * dim * 4)
+        index["capacity"] = new_capacity
+        self._matrix = np.memmap(self.embeddings_path, dtype=np.float32, mode="r+", shape=(new_capacity, dim))
+        self._rebuild_search_index()
+
+    @staticmethod
+    def _as_vector(embedding) -> np.ndarray:
+        return np.asarray(embedding, dtype=np.float32).reshape(-1)
+
+    def add(self, voice_id: str, metadata: dict, embedding=None) -> dict:
+        """Store or replace a voice; the embedding goes into the memory-mapped matrix"""
+        with self._lock:
+            meta = self._add_locked(voice_id, {**metadata, "revision": uuid.uuid4().hex}, embedding)
+            self._save_index()
+        if self.state is not None:
+            # The embedding goes first so a replica that sees the record can also read it
+            if embedding is not None:
+                self.state.set(EMBEDDINGS_NAMESPACE, voice_id, self._as_vector(embedding).tobytes())
+            else:
+                self.state.delete(EMBEDDINGS_NAMESPACE, voice_id)
+            record = {k: v for k, v in meta.items() if k not in LOCAL_FIELDS}
+            self.state.set_json("voices", voice_id, record)
+            self.state.incr("voices_meta", "version")
+        return meta
+
+    def _add_locked(self, voice_id: str, metadata: dict, embedding=None) -> dict:
+        if voice_id in self._index["voices"]:
+            self._delete_locked(voice_id)
+        meta = {k: v for k, v in metadata.items() if k not in LOCAL_FIELDS}
+        meta["voice_id"] = voice_id
+        meta["row"] = None
+
+        if embedding is not None:
+            vector = self._as_vector(embedding)
+            if self._index["dim"] not in (None, vector.size):
+                # Different embedding model - keep it out of the shared matrix
+                np.save(os.path.join(self.store_dir, f"{voice_id}.npy"), vector)
+                meta["embedding_file"] = f"{voice_id}.npy"
+            else:
+                self._ensure_capacity(vector.size)
+                if self._index["free_rows"]:
+                    row = self._index["free_rows"].pop()
+                else:
+                    row = self._index["rows"]
+                    self._index["rows"] += 1
+                self._matrix[row] = vector
+                self._matrix.flush()
+                norm = np.linalg.norm(vector)
+                self._normalized[row] = vector / norm if norm > 0 else 0.0
+                self._row_ids[row] = voice_id
+                meta["row"] = row
+
+        self._index["voices"][voice_id] = meta
+        return meta
+
+    def _sync(self, force: bool = False):
+        """Apply voices other workers added, replaced or deleted since the last check"""
+        if self.state is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._synced_at < SYNC_INTERVAL_SECONDS:
+            return
+        self._synced_at = now
+        try:
+            # Read the version first so a write racing with the listing triggers another sync
+            version = self.state.get("voices_meta", "version")
+            if version == self._synced_version:
+                return
+            remote = {record["voice_id"]: record for record in self.state.list_json("voices")}
+            # Only voices that are new or changed since this replica last saw them fetch an embedding
+            with self._lock:
+                stale = [
+                    voice_id for voice_id, record in remote.items()
+                    if voice_id not in self._index["voices"]
+                    or self._index["voices"][voice_id].get("revision") != record.get("revision")
+                ]
+            embeddings = {voice_id: self._remote_embedding(voice_id, remote[voice_id]) for voice_id in stale}
+        except Exception as e:
+            logger.error(f"Voice sync error: {e}")
+            return
+        with self._lock:
+            changed = False
+            for voice_id in list(self._index["voices"]):
+                if voice_id not in remote:
+                    self._delete_locked(voice_id)
+                    changed = True
+            for voice_id, embedding in embeddings.items():
+                self._add_locked(voice_id, remote[voice_id], embedding)
+                changed = True
+            if changed:
+                self._save_index()
+        self._synced_version = version
+
+    def _remote_embedding(self, voice_id: str, record: dict) -> Optional[np.ndarray]:
+        if "embedding" in record:
+            # Written as a JSON list by earlier versions
+            return self._as_vector(record["embedding"])
+        data = self.state.get(EMBEDDINGS_NAMESPACE, voice_id)
+        return None if data is None else np.frombuffer(data, dtype=np.float32)
+
+    def publish_all(self):
+        """Push every locally stored voice the state backend does not have yet (one-off migration)"""
+        if self.state is None:
+            return 0
+        published = 0
+        for voice_id, meta in list(self._index["voices"].items()):
+            if self.state.get("voices", voice_id) is None:
+                embedding = self._embedding(voice_id)
+                self.add(voice_id, meta, None if embedding is None else np.array(embedding))
+                published += 1
+        return published
+
+    def get(self, voice_id: str) -> Optional[dict]:
+        """Voice metadata by id"""
+        self._sync()
+        meta = self._index["voices"].get(voice_id)
+        return dict(meta) if meta else None
+
+    def get_embedding(self, voice_id: str) -> Optional[np.ndarray]:
+        """Embedding for a voice as a float32 array (a copy; the matrix row may be reused)"""
+        self._sync()
+        return self._embedding(voice_id)
+
+    def _embedding(self, voice_id: str) -> Optional[np.ndarray]:
+        meta = self._index["voices"].get(voice_id)
+        if not meta:
+            return None
+        if meta.get("row") is not None:
+            return np.array(self._matrix[meta["row"]])
+        if meta.get("embedding_file"):
+            return np.load(os.path.join(self.store_dir, meta["embedding_file"]))
+        return None
+
+    def list(self) -> List[dict]:
+        """Metadata for every stored voice"""
+        self._sync()
+        return [dict(meta) for meta in self._index["voices"].values()]
+
+    def delete(self, voice_id: str) -> bool:
+        """Remove a voice; its embedding row is recycled"""
+        self._sync(force=True)
+        with self._lock:
+            if voice_id not in self._index["voices"]:
+                return False
+            self._delete_locked(voice_id)
+            self._save_index()
+        if self.state is not None:
+            self.state.delete("voices", voice_id)
+            self.state.delete(EMBEDDINGS_NAMESPACE, voice_id)
+            self.state.incr("voices_meta", "version")
+        return True
+
+    def _delete_locked(self, voice_id: str):
+        meta = self._index["voices"].pop(voice_id)
+        row = meta.get("row")
+        if row is not None:
+            self._matrix[row] = 0.0
+            self._normalized[row] = 0.0
+            self._row_ids[row] = None
+            self._index["free_rows"].append(row)
+        if meta.get("embedding_file"):
+            try:
+                os.remove(os.path.join(self.store_dir, meta["embedding_file"]))
+            except OSError:
+                pass
+
+    def nearest(self, embedding, k: int = 5, exclude: Optional[str] = None) -> List[Tuple[str, float]]:
+        """Top-k most similar voices by cosine similarity"""
+        self._sync()
+        if self._normalized is None:
+            return []
+        query = self._as_vector(embedding)
+        if query.size != self._index["dim"]:
+            return []
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        scores = self._normalized[:self._index["rows"]] @ (query / norm)
+        order = np.argsort(-scores)
+        results = []
+        for row in order:
+            voice_id = self._row_ids[row]
+            if voice_id is None or voice_id == exclude:
+                continue
+            results.append((voice_id, float(scores[row])))
+            if len(results) == k:
+                break
+        return results
+
+    def find_duplicate(self, embedding, threshold: float = DUPLICATE_THRESHOLD, exclude: Optional[str] = None) -> Optional[str]:
+        """Voice id of an already stored voice from the same speaker, if any"""
+        matches = self.nearest(embedding, k=1, exclude=exclude)
+        if matches and matches[0][1] >= threshold:
+            return matches[0][0]
+        return None
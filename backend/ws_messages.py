@@ -0,0 +1,68 @@
+# WebSocket Messages
+# Typed schemas for client -> server voice-agent frames, validated as they are decoded
+
+from typing import Literal, Optional, Union
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing_extensions import Annotated
+
+from serialization import loads
+
+
+class InterruptMessage(BaseModel):
+    """Caller started talking over the agent (explicit or client-side VAD)"""
+    type: Literal["interrupt", "speech_start"]
+    played_ms: Optional[float] = None
+
+
+class PartialTranscriptMessage(BaseModel):
+    type: Literal["partial_transcript"]
+    text: str = ""
+    confidence: float = 1.0
+    stable: bool = False
+    played_ms: Optional[float] = None
+
+
+class FinalTranscriptMessage(BaseModel):
+    type: Literal["final_transcript"]
+    text: str = ""
+    played_ms: Optional[float] = None
+
+
+class AudioFrameMessage(BaseModel):
+    """Raw audio frame for real-time STT; codec and sample_rate are read from the first frame"""
+    type: Literal["audio_frame"]
+    audio: str
+    codec: Literal["pcm16", "mulaw", "alaw"] = "pcm16"
+    sample_rate: int = Field(16000, ge=8000, le=48000)
+
+
+class AudioMessage(BaseModel):
+    """A complete user utterance (encoded audio file)"""
+    type: Literal["audio"]
+    audio: str
+    played_ms: Optional[float] = None
+
+
+ClientMessage = Annotated[
+    Union[InterruptMessage, PartialTranscriptMessage, FinalTranscriptMessage, AudioFrameMessage, AudioMessage],
+    Field(discriminator="type")
+]
+
+_client_message_adapter = TypeAdapter(ClientMessage)
+
+
+def parse_client_message(raw: Union[str, bytes]) -> ClientMessage:
+    """Parse and validate a client frame (raises ValueError for bad JSON or a bad schema)
+
+    Parsing with the fast serializer and validating the resulting dict is quicker than
+    validate_json for frames carrying large base64 strings.
+    """
+    return _client_message_adapter.validate_python(loads(raw))
+
+
+def describe_errors(error: ValueError) -> list:
+    """Compact error list for the client - without echoing the (possibly huge) input back"""
+    if isinstance(error, ValidationError):
+        return [{"loc": list(err["loc"]), "msg": err["msg"]} for err in error.errors()]
+    return [{"loc": [], "msg": str(error)}]